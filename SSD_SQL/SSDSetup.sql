@@ -133,7 +133,8 @@ CREATE TABLE IF NOT EXISTS Detection (
     Score FLOAT NOT NULL,
     CreateDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ModDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    FOREIGN KEY (UserID) REFERENCES User(UserID)
+    FOREIGN KEY (UserID) REFERENCES User(UserID),
+    INDEX ix_detection_userid_starttime (UserID, StartTime, DetectionID)
 );
 
 -- 創建 Head 表
@@ -199,3 +200,22 @@ CREATE TABLE IF NOT EXISTS Feet (
     ModDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (DetectionID) REFERENCES Detection(DetectionID)
 );
+
+-- 創建 DetectionRollup 表（日 / 週 / 月統計，由後端在寫入 Detection 時同步累加）
+-- 回補歷史資料：python -m app.core.rollups rebuild
+CREATE TABLE IF NOT EXISTS DetectionRollup (
+    UserID INT NOT NULL,
+    Granularity ENUM('day', 'week', 'month') NOT NULL,
+    BucketStart DATE NOT NULL,
+    TimeZone VARCHAR(50) NOT NULL,
+    SessionCount INT NOT NULL DEFAULT 0,
+    TotalPredictions INT NOT NULL DEFAULT 0,
+    TotalSeconds INT NOT NULL DEFAULT 0,
+    HeadNeutralCount INT NOT NULL DEFAULT 0,
+    NeckNeutralCount INT NOT NULL DEFAULT 0,
+    ShoulderNeutralCount INT NOT NULL DEFAULT 0,
+    TorsoNeutralCount INT NOT NULL DEFAULT 0,
+    FeetFlatCount INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (UserID, Granularity, BucketStart, TimeZone),
+    FOREIGN KEY (UserID) REFERENCES User(UserID)
+);
@@ -0,0 +1,52 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select, update
+from app.core.security import password_hasher, create_access_token, create_refresh_token, decode_token
+from app.api.deps import AsyncSessionDep
+from app.models import User
+from app.schemas import TokenResponse, RefreshTokenRequest
+
+router = APIRouter()
+
+@router.post("/token", response_model=TokenResponse)
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSessionDep):
+    result = await db.execute(select(User.UserName, User.Password).where(User.UserName == form_data.username))
+    user = result.first()
+    # bcrypt 是 CPU 密集運算，在 password_hasher 的 process pool 中執行
+    verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.Password) if user else (False, None)
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="不正確的用戶名或密碼",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if new_hash is not None:
+        # BCRYPT_ROUNDS 改變後，登入時以新的 work factor 重新雜湊
+        await db.execute(update(User).where(User.UserName == user.UserName).values(Password=new_hash))
+        await db.commit()
+    access_token = create_access_token(data={"sub": user.UserName})
+    refresh_token = create_refresh_token(data={"sub": user.UserName})
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_access_token(refresh_token_req: RefreshTokenRequest, db: AsyncSessionDep):
+    payload = decode_token(refresh_token_req.refresh_token)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="無效的 refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    username = payload.get("sub")
+    result = await db.execute(select(User.UserName).where(User.UserName == username))
+    user = result.first()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用戶不存在",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    new_access_token = create_access_token(data={"sub": user.UserName})
+    new_refresh_token = create_refresh_token(data={"sub": user.UserName})
+    return {"access_token": new_access_token, "refresh_token": new_refresh_token, "token_type": "bearer"}
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, HTTPException, status, Query
+from app.api.deps import AsyncCurrentUser, AsyncCurrentPrincipal, AsyncSessionDep, AsyncReadSessionDep
+from app.api.detections import ingest_detections, query_detections_page, detection_cursor_headers
+from app.core.serializers import FastJSONResponse
+from app.schemas import DetectionCreate, DetectionResponse
+from app.config import DETECTION_BATCH_MAX_SIZE, DETECTION_PAGE_SIZE, DETECTION_PAGE_MAX_SIZE
+from typing import List, Annotated, Optional
+from datetime import datetime
+
+router = APIRouter()
+
+# 寫入與查詢邏輯與同步版本共用，透過 AsyncSession.run_sync 在 async 連線上執行
+
+@router.post("/", response_model=DetectionResponse, status_code=status.HTTP_201_CREATED)
+async def create_detection(
+    detection_data: DetectionCreate,
+    db: AsyncSessionDep,
+    current_user: AsyncCurrentUser
+):
+    detections = await db.run_sync(lambda session: ingest_detections(session, current_user, [detection_data]))
+    return FastJSONResponse(detections[0], status_code=status.HTTP_201_CREATED)
+
+@router.post("/batch", response_model=List[DetectionResponse], status_code=status.HTTP_201_CREATED)
+async def create_detections_batch(
+    detections_data: List[DetectionCreate],
+    db: AsyncSessionDep,
+    current_user: AsyncCurrentUser
+):
+    if len(detections_data) > DETECTION_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次最多上傳 {DETECTION_BATCH_MAX_SIZE} 筆偵測資料"
+        )
+    if not detections_data:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="至少需要一筆偵測資料"
+        )
+    detections = await db.run_sync(lambda session: ingest_detections(session, current_user, detections_data))
+    return FastJSONResponse(detections, status_code=status.HTTP_201_CREATED)
+
+@router.get("/", response_model=List[DetectionResponse])
+async def get_detections(
+    db: AsyncReadSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    limit: Annotated[int, Query(ge=1, le=DETECTION_PAGE_MAX_SIZE)] = DETECTION_PAGE_SIZE,
+    before: Annotated[Optional[str], Query(description="取得比此 cursor 更舊的資料")] = None,
+    after: Annotated[Optional[str], Query(description="取得比此 cursor 更新的資料")] = None,
+    start_from: Annotated[Optional[datetime], Query(alias="from")] = None,
+    end_to: Annotated[Optional[datetime], Query(alias="to")] = None,
+):
+    detections, next_cursor, prev_cursor = await db.run_sync(
+        lambda session: query_detections_page(session, current_user.UserID, limit, before, after, start_from, end_to)
+    )
+    return FastJSONResponse(detections, headers=detection_cursor_headers(next_cursor, prev_cursor))
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Query
+from sqlalchemy import select
+from app.models import User
+from app.schemas import UserResponse, LeaderboardResponse
+from app.api.deps import AsyncCurrentPrincipal, AsyncReadSessionDep
+from app.api.friends import build_friend_leaderboard
+from app.core.indexes import friend_graph
+from typing import List, Annotated, Optional
+
+router = APIRouter()
+
+@router.get("/", response_model=List[UserResponse])
+async def get_friends_list(
+    current_user: AsyncCurrentPrincipal,
+    db: AsyncReadSessionDep
+):
+    await db.run_sync(friend_graph.ensure_loaded)
+    friend_ids = friend_graph.friends_of(current_user.UserID)
+    if not friend_ids:
+        return []
+    result = await db.execute(select(User).where(User.UserID.in_(friend_ids)))
+    return result.scalars().all()
+
+@router.get("/leaderboard", response_model=List[LeaderboardResponse])
+async def get_leaderboard(
+    current_user: AsyncCurrentPrincipal,
+    db: AsyncReadSessionDep,
+    sortBy: str = "level",  # 排序方式，默認為 level
+    limit: Annotated[Optional[int], Query(ge=1, le=500)] = None,
+    offset: Annotated[int, Query(ge=0)] = 0,
+):
+    return await db.run_sync(
+        lambda session: build_friend_leaderboard(session, current_user.UserID, sortBy, limit, offset)
+    )
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from app.api.deps import AsyncCurrentUser, AsyncSessionDep
+from app.api.users import get_userDTO
+from app.core.serializers import FastJSONResponse
+from app.schemas import ExtendedUserResponse
+
+router = APIRouter()
+
+@router.get("/me", response_model=ExtendedUserResponse)
+async def read_users_me(current_user: AsyncCurrentUser, db: AsyncSessionDep):
+    # get_userDTO 只在排名索引需要重新載入時才查詢資料庫，透過 run_sync 共用同步版本的邏輯
+    return FastJSONResponse(await db.run_sync(lambda session: get_userDTO(session, current_user)))
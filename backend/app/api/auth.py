@@ -1,22 +1,35 @@
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from app.core.security import verify_password, create_access_token, create_refresh_token, decode_token
+from app.core.security import password_hasher, create_access_token, create_refresh_token, decode_token
 from app.api.deps import SessionDep
 from app.models import User
 from app.schemas import TokenResponse, RefreshTokenRequest
 
 router = APIRouter()
 
+def find_login_user(db, username: str):
+    return db.query(User).filter(User.UserName == username).first()
+
+def save_rehashed_password(db, user: User, new_hash: str):
+    user.Password = new_hash
+    db.commit()
+
 @router.post("/token", response_model=TokenResponse)
-def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: SessionDep):
-    user = db.query(User).filter(User.UserName == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.Password):
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: SessionDep):
+    # 資料庫存取在 threadpool 執行；等待 bcrypt 時只 await，不佔用任何執行緒
+    user = await run_in_threadpool(find_login_user, db, form_data.username)
+    verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.Password) if user else (False, None)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="不正確的用戶名或密碼",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash is not None:
+        # BCRYPT_ROUNDS 改變後，登入時以新的 work factor 重新雜湊
+        await run_in_threadpool(save_rehashed_password, db, user, new_hash)
     access_token = create_access_token(data={"sub": user.UserName})
     refresh_token = create_refresh_token(data={"sub": user.UserName})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
@@ -1,12 +1,18 @@
+import logging
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlmodel import Session
+from sqlalchemy import select
 from sqlalchemy.orm import sessionmaker
-from app.core.security import decode_token
-from app.core.database import engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.core.security import decode_token, Principal, principal_cache
+from app.core.database import engine, read_engine, async_engine, async_read_engine
 from app.models import User
 from typing import Annotated
 from app.schemas import UserResponse
+from app.config import SYSTEM_ADMIN_USERS
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
@@ -19,13 +25,39 @@ def get_db():
         db.close()
 
 SessionDep = Annotated[Session, Depends(get_db)]
+
+# 唯讀查詢使用 replica（未設定 replica 時與 primary 相同）
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
+
+# 非同步資料庫路徑（DB_ASYNC=true 時才會建立）
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if async_engine else None
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False) if async_read_engine else None
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
 TokenDep = Annotated[str, Depends(oauth2_scheme)]
 
 
-def get_current_user(token: TokenDep, db: SessionDep):
+def get_token_username(token: str):
     payload = decode_token(token)
     if payload is None:
-        print("No payload")
+        logger.info("No payload")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="無效的認證憑證",
@@ -33,15 +65,60 @@ def get_current_user(token: TokenDep, db: SessionDep):
         )
     username: str = payload.get("sub")
     if username is None:
-        print("No username")
+        logger.info("No username")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="無效的認證憑證",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = db.query(User).filter(User.UserName == username).first()
+    return username, payload.get("exp")
+
+def cache_principal(token: str, row, exp) -> Principal:
+    if row is None:
+        logger.info("No user")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用戶不存在",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    principal = Principal(UserID=row.UserID, UserName=row.UserName)
+    if exp is not None:
+        principal_cache.set(token, principal, exp)
+    return principal
+
+def get_current_principal(token: TokenDep, db: SessionDep) -> Principal:
+    """
+    驗證 token 並回傳輕量的 Principal；快取命中時不需要查詢資料庫。
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    username, exp = get_token_username(token)
+    row = db.query(User.UserID, User.UserName).filter(User.UserName == username).first()
+    return cache_principal(token, row, exp)
+
+CurrentPrincipal = Annotated[Principal, Depends(get_current_principal)]
+
+
+def get_system_admin(principal: CurrentPrincipal) -> Principal:
+    """
+    只有 SYSTEM_ADMIN_USERS 裡的使用者可以通過，用於會暴露其他使用者資料的系統 API。
+    """
+    if principal.UserName not in SYSTEM_ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="沒有權限")
+    return principal
+
+SystemAdmin = Annotated[Principal, Depends(get_system_admin)]
+
+
+def get_current_user(principal: CurrentPrincipal, db: SessionDep):
+    """
+    需要完整 User 資料（含密碼、統計欄位）的 API 才使用，以主鍵載入。
+    """
+    user = db.get(User, principal.UserID)
     if user is None:
-        print("No user")
+        logger.info("No user")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用戶不存在",
@@ -51,3 +128,28 @@ def get_current_user(token: TokenDep, db: SessionDep):
 
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
+
+async def aget_current_principal(token: TokenDep, db: AsyncSessionDep) -> Principal:
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    username, exp = get_token_username(token)
+    result = await db.execute(select(User.UserID, User.UserName).where(User.UserName == username))
+    return cache_principal(token, result.first(), exp)
+
+AsyncCurrentPrincipal = Annotated[Principal, Depends(aget_current_principal)]
+
+
+async def aget_current_user(principal: AsyncCurrentPrincipal, db: AsyncSessionDep):
+    user = await db.get(User, principal.UserID)
+    if user is None:
+        logger.info("No user")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用戶不存在",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+AsyncCurrentUser = Annotated[User, Depends(aget_current_user)]
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, or_, and_
 from sqlalchemy.orm import Session
-from app.models import User, Detection, Torso, Feet, Head, Shoulder, Neck
-from app.schemas import UserResponse, DetectionCreate, DetectionResponse, TorsoCreate, FeetCreate, HeadCreate, ShoulderCreate, NeckCreate
-from app.api.deps import CurrentUser, SessionDep
-from typing import List, Annotated
-from datetime import datetime, timedelta
+from app.models import User, Detection, Torso, Feet, Head, Shoulder, Neck, DetectionRollup, GranularityEnum
+from app.schemas import UserResponse, DetectionCreate, DetectionResponse, DetectionStatsResponse, ExportFormat, TorsoCreate, FeetCreate, HeadCreate, ShoulderCreate, NeckCreate
+from app.api.deps import CurrentUser, CurrentPrincipal, SessionDep, ReadSessionDep, ReadSessionLocal
+from app.core.bll import calculate_detection_scores, calculate_partial_score
+from app.core.rollups import add_rollup_delta, upsert_rollups
+from app.core.indexes import score_rank_index
+from app.core.leaderboards import invalidate_leaderboard_member
+from app.core.serializers import FastJSONResponse, compile_row_serializer
+from app.core.exports import EXPORT_MEDIA_TYPES, require_parquet, column_names, ndjson_chunks, csv_chunks, parquet_chunks
+from app.config import DETECTION_BATCH_MAX_SIZE, DETECTION_PAGE_SIZE, DETECTION_PAGE_MAX_SIZE, DETECTION_EXPORT_CHUNK_SIZE, ROLLUP_TIMEZONES
+from typing import List, Annotated, Optional
+from datetime import datetime, timedelta, date
 
 router = APIRouter()
 
@@ -14,150 +23,390 @@ def create_detection(
     db: SessionDep,
     current_user: CurrentUser
 ):
-    # 計算 PartialScore
-    def calculate_partial_score(correct_count, total_predictions):
-        return correct_count / total_predictions if total_predictions > 0 else 0.0
+    return FastJSONResponse(ingest_detections(db, current_user, [detection_data])[0], status_code=status.HTTP_201_CREATED)
 
-    # 計算每個部位的 PartialScore
-    torso_score = calculate_partial_score(detection_data.Torso.NeutralCount, detection_data.TotalPredictions)
-    feet_score = calculate_partial_score(detection_data.Feet.FlatCount, detection_data.TotalPredictions)
-    head_score = calculate_partial_score(detection_data.Head.NeutralCount, detection_data.TotalPredictions)
-    shoulder_score = calculate_partial_score(detection_data.Shoulder.NeutralCount, detection_data.TotalPredictions)
-    neck_score = calculate_partial_score(detection_data.Neck.NeutralCount, detection_data.TotalPredictions)
-
-    # 計算 Single Detection Score
-    detection_score = (torso_score + feet_score + head_score + shoulder_score + neck_score) / 5.0
-
-    # 創建 Detection 記錄
-    new_detection = Detection(
-        UserID=current_user.UserID,
-        StartTime=detection_data.StartTime,
-        EndTime=detection_data.EndTime,
-        TotalTime=detection_data.TotalTime,
-        TotalPredictions=detection_data.TotalPredictions,
-        Score=detection_score
-    )
-    db.add(new_detection)
-    db.commit()
-    db.refresh(new_detection)
-
-    # 創建每個部位的紀錄
-    body_parts = {
-        "Torso": Torso(
-            DetectionID=new_detection.DetectionID,
-            BackwardCount=detection_data.Torso.BackwardCount,
-            ForwardCount=detection_data.Torso.ForwardCount,
-            NeutralCount=detection_data.Torso.NeutralCount,
-            AmbiguousCount=detection_data.Torso.AmbiguousCount,
-            PartialScore=torso_score
-        ),
-        "Feet": Feet(
-            DetectionID=new_detection.DetectionID,
-            AnkleOnKneeCount=detection_data.Feet.AnkleOnKneeCount,
-            FlatCount=detection_data.Feet.FlatCount,
-            AmbiguousCount=detection_data.Torso.AmbiguousCount,
-            PartialScore=feet_score
-        ),
-        "Head": Head(
-            DetectionID=new_detection.DetectionID,
-            BowedCount=detection_data.Head.BowedCount,
-            NeutralCount=detection_data.Head.NeutralCount,
-            TiltBackCount=detection_data.Head.TiltBackCount,
-            AmbiguousCount=detection_data.Torso.AmbiguousCount,
-            PartialScore=head_score
-        ),
-        "Shoulder": Shoulder(
-            DetectionID=new_detection.DetectionID,
-            HunchedCount=detection_data.Shoulder.HunchedCount,
-            NeutralCount=detection_data.Shoulder.NeutralCount,
-            ShrugCount=detection_data.Shoulder.ShrugCount,
-            AmbiguousCount=detection_data.Torso.AmbiguousCount,
-            PartialScore=shoulder_score
-        ),
-        "Neck": Neck(
-            DetectionID=new_detection.DetectionID,
-            ForwardCount=detection_data.Neck.ForwardCount,
-            NeutralCount=detection_data.Neck.NeutralCount,
-            AmbiguousCount=detection_data.Torso.AmbiguousCount,
-            PartialScore=neck_score
-        ),
-    }
-
-    # 新增部位資料到資料庫
-    for part in body_parts.values():
-        db.add(part)
-    # region: 更新 User 資料
-    db_user = db.query(User).filter(User.UserID == current_user.UserID).first()
-    if db_user:
-        # 更新 User 的 AllTimeScore 跟 TotalPredictionCount
-        total_weight_after = (db_user.AllTimeScore * db_user.TotalPredictionCount) \
-                           + (detection_score * detection_data.TotalPredictions)
-        total_prediction_count_after = db_user.TotalPredictionCount + detection_data.TotalPredictions
-        db_user.AllTimeScore = total_weight_after / total_prediction_count_after
-        db_user.TotalPredictionCount = total_prediction_count_after
-
-        # 更新 User 的 TotalDetectionTime
-        new_detection_time = datetime.combine(datetime.min, db_user.TotalDetectionTime) + timedelta(
-            hours=detection_data.TotalTime.hour,
-            minutes=detection_data.TotalTime.minute,
-            seconds=detection_data.TotalTime.second
+@router.post("/batch", response_model=List[DetectionResponse], status_code=status.HTTP_201_CREATED)
+def create_detections_batch(
+    detections_data: List[DetectionCreate],
+    db: SessionDep,
+    current_user: CurrentUser
+):
+    """
+    手機離線時累積的多筆偵測一次上傳，所有資料在同一個交易內寫入。
+    """
+    if len(detections_data) > DETECTION_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次最多上傳 {DETECTION_BATCH_MAX_SIZE} 筆偵測資料"
         )
-        db_user.TotalDetectionTime = new_detection_time.time()
-    db.commit()
-    db.refresh(new_detection) #commit過後重新refresh一遍
-    # endregion
-
-
-    # TODO: 只能先這樣，還找不到解決Pydantic不能轉換nested的原因，我覺得可能是因為Detection的head是Relationship
-    detection_response = DetectionResponse(
-        **new_detection.dict(),
-        Head = new_detection.head,
-        Neck = new_detection.neck,
-        Shoulder = new_detection.shoulder,
-        Torso = new_detection.torso,
-        Feet = new_detection.feet,
-    )
-    return detection_response
+    if not detections_data:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="至少需要一筆偵測資料"
+        )
+    return FastJSONResponse(ingest_detections(db, current_user, detections_data), status_code=status.HTTP_201_CREATED)
 
-# 保留：還需要測試一下
 @router.get("/", response_model=List[DetectionResponse])
 def get_detections(
-    db: SessionDep,
-    current_user: CurrentUser
+    db: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    limit: Annotated[int, Query(ge=1, le=DETECTION_PAGE_MAX_SIZE)] = DETECTION_PAGE_SIZE,
+    before: Annotated[Optional[str], Query(description="取得比此 cursor 更舊的資料")] = None,
+    after: Annotated[Optional[str], Query(description="取得比此 cursor 更新的資料")] = None,
+    start_from: Annotated[Optional[datetime], Query(alias="from")] = None,
+    end_to: Annotated[Optional[datetime], Query(alias="to")] = None,
+):
+    """
+    依 (StartTime, DetectionID) 由新到舊分頁（keyset pagination）。
+    下一頁 / 上一頁的 cursor 放在 X-Next-Cursor / X-Prev-Cursor header。
+    """
+    detections, next_cursor, prev_cursor = query_detections_page(
+        db, current_user.UserID, limit, before, after, start_from, end_to
+    )
+    return FastJSONResponse(detections, headers=detection_cursor_headers(next_cursor, prev_cursor))
+
+@router.get("/stats", response_model=List[DetectionStatsResponse])
+def get_detection_stats(
+    db: ReadSessionDep,
+    current_user: CurrentPrincipal,
+    granularity: GranularityEnum = GranularityEnum.day,
+    start_from: Annotated[Optional[date], Query(alias="from")] = None,
+    end_to: Annotated[Optional[date], Query(alias="to")] = None,
+    tz: Annotated[Optional[str], Query(description="時區，需為 ROLLUP_TIMEZONES 其中之一")] = None,
 ):
-    detections = db.query(Detection).filter(Detection.UserID == current_user.UserID).all()
-    deteciton_response = []
-    for detection in detections:
-        deteciton_response.append(DetectionResponse(
-            **detection.dict(),
-            Head = detection.head,
-            Neck = detection.neck,
-            Shoulder = detection.shoulder,
-            Torso = detection.torso,
-            Feet = detection.feet,
+    """
+    依日 / 週 / 月回傳統計資料，直接讀取 DetectionRollup，成本只與區間數量有關。
+    from / to 以區間起始日篩選（包含 from，不包含 to）。
+    """
+    tz = tz or ROLLUP_TIMEZONES[0]
+    if tz not in ROLLUP_TIMEZONES:
+        raise HTTPException(status_code=400, detail=f"不支援的時區，可用：{', '.join(ROLLUP_TIMEZONES)}")
+
+    query = db.query(DetectionRollup).filter(
+        DetectionRollup.UserID == current_user.UserID,
+        DetectionRollup.Granularity == granularity,
+        DetectionRollup.TimeZone == tz,
+    )
+    if start_from:
+        query = query.filter(DetectionRollup.BucketStart >= start_from)
+    if end_to:
+        query = query.filter(DetectionRollup.BucketStart < end_to)
+
+    stats = []
+    for rollup in query.order_by(DetectionRollup.BucketStart.asc()).all():
+        part_scores = {
+            part: calculate_partial_score(count, rollup.TotalPredictions)
+            for part, count in (
+                ("Torso", rollup.TorsoNeutralCount),
+                ("Feet", rollup.FeetFlatCount),
+                ("Head", rollup.HeadNeutralCount),
+                ("Shoulder", rollup.ShoulderNeutralCount),
+                ("Neck", rollup.NeckNeutralCount),
+            )
+        }
+        stats.append(DetectionStatsResponse(
+            BucketStart=rollup.BucketStart,
+            SessionCount=rollup.SessionCount,
+            TotalPredictions=rollup.TotalPredictions,
+            TotalSeconds=rollup.TotalSeconds,
+            # 以預測數加權的平均分數
+            Score=sum(part_scores.values()) / len(part_scores),
+            **{f"{part}Score": score for part, score in part_scores.items()},
         ))
-    return deteciton_response
+    return stats
 
 
+# 必須在 /{detection_id} 之前宣告，否則 export 會被當成 detection_id
+@router.get("/export")
+def export_detections(
+    current_user: CurrentPrincipal,
+    export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.ndjson,
+    start_from: Annotated[Optional[datetime], Query(alias="from")] = None,
+    end_to: Annotated[Optional[datetime], Query(alias="to")] = None,
+):
+    """
+    匯出全部偵測紀錄（含五個部位），依 StartTime 由舊到新，邊查詢邊輸出。
+    ndjson 每行一筆，格式與 DetectionResponse 相同；csv / parquet 的部位欄位攤平為 Head.BowedCount 這類欄位。
+    """
+    if export_format == ExportFormat.parquet:
+        require_parquet()
+    return StreamingResponse(
+        stream_detection_export(current_user.UserID, export_format, start_from, end_to),
+        media_type=EXPORT_MEDIA_TYPES[export_format.value],
+        headers={"Content-Disposition": f'attachment; filename="detections.{export_format.value}"'},
+    )
+
 @router.get("/{detection_id}", response_model=DetectionResponse)
 def get_Detection(
     detection_id: int,
-    current_user: CurrentUser,
-    db: SessionDep
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep
 ):
-    detection = db.query(Detection).filter(Detection.DetectionID == detection_id, Detection.UserID == current_user.UserID).first()
-    
-    if not detection:
+    row = detection_rows_query(db)\
+            .filter(Detection.DetectionID == detection_id, Detection.UserID == current_user.UserID)\
+            .first()
+
+    if not row:
         raise HTTPException(status_code=404, detail="Detection not found")
 
-    return DetectionResponse(
-                **detection.dict(),
-                Head = detection.head,
-                Neck = detection.neck,
-                Shoulder = detection.shoulder,
-                Torso = detection.torso,
-                Feet = detection.feet
-                )
+    return FastJSONResponse(serialize_detection_row(row))
+# region: depencies functions
+BODY_PART_MODELS = {
+    "Torso": Torso,
+    "Feet": Feet,
+    "Head": Head,
+    "Shoulder": Shoulder,
+    "Neck": Neck,
+}
+
+# 依 DetectionResponse 的欄位順序，一次 LEFT OUTER JOIN 五個部位表取出的欄位與對應的 serializer
+DETECTION_COLUMNS, serialize_detection_row = compile_row_serializer(DetectionResponse, Detection, BODY_PART_MODELS)
+# CSV / parquet 匯出的欄位：不含最後用來判斷部位紀錄是否存在的主鍵欄位，缺少的部位各欄位為空值
+DETECTION_EXPORT_COLUMNS = DETECTION_COLUMNS[:len(DETECTION_COLUMNS) - len(BODY_PART_MODELS)]
+
+def detection_rows_query(db: Session, columns=DETECTION_COLUMNS):
+    # 缺少部位紀錄的偵測仍然要出現在列表、單筆查詢與匯出中，所以使用 outer join
+    query = db.query(*columns)
+    for model in BODY_PART_MODELS.values():
+        query = query.outerjoin(model, model.DetectionID == Detection.DetectionID)
+    return query
+
+def ingest_detections(db: Session, user: User, detections_data: List[DetectionCreate]) -> List[dict]:
+    """
+    寫入多筆 Detection 與其部位資料，全部只 commit 一次：
+      - Detection 以一次 flush 寫入（取得 DetectionID）
+      - 每個部位表各用一個 executemany INSERT
+      - User 的統計欄位合併成一次 UPDATE
+    """
+    scored = [(data, calculate_detection_scores(data)) for data in detections_data]
+
+    # 創建 Detection 記錄
+    new_detections = [
+        Detection(
+            UserID=user.UserID,
+            StartTime=data.StartTime,
+            EndTime=data.EndTime,
+            TotalTime=data.TotalTime,
+            TotalPredictions=data.TotalPredictions,
+            Score=scores["Score"]
+        )
+        for data, scores in scored
+    ]
+    db.add_all(new_detections)
+    db.flush()
+    detection_ids = [detection.DetectionID for detection in new_detections]
+
+    # 創建每個部位的紀錄
+    for part, model in BODY_PART_MODELS.items():
+        rows = [
+            {**getattr(data, part).dict(), "DetectionID": detection_id, "PartialScore": scores[part]}
+            for detection_id, (data, scores) in zip(detection_ids, scored)
+        ]
+        db.execute(insert(model), rows)
+
+    apply_detections_to_user(user, scored)
+
+    # 同一個交易內累加日 / 週 / 月統計
+    rollup_deltas = {}
+    for data, _ in scored:
+        add_detection_rollup(rollup_deltas, user.UserID, data)
+    upsert_rollups(db, rollup_deltas)
+
+    # commit 之後物件會 expire，先組好回傳資料避免重新查詢（欄位順序與 DetectionResponse 相同）
+    detection_responses = [
+        {
+            "StartTime": data.StartTime,
+            "EndTime": data.EndTime,
+            "TotalTime": data.TotalTime,
+            "TotalPredictions": data.TotalPredictions,
+            "DetectionID": detection_id,
+            "UserID": user.UserID,
+            "Score": scores["Score"],
+            **{part: {**getattr(data, part).dict(), "PartialScore": scores[part]} for part in BODY_PART_MODELS},
+        }
+        for detection_id, (data, scores) in zip(detection_ids, scored)
+    ]
+    commit_user_detections(db, user)
+    return detection_responses
+
+def update_streamed_detection(db: Session, user: User, detection_id: int, previous: DetectionCreate, current: DetectionCreate):
+    """
+    同一個串流 session 之後的 checkpoint：以 session 目前的累計（current）更新既有的 Detection 與部位資料。
+    User 與日 / 週 / 月統計扣除上一次寫入的數值（previous）再加上 current，session 數不變。
+    """
+    previous_scored = (previous, calculate_detection_scores(previous))
+    scores = calculate_detection_scores(current)
+
+    db.query(Detection).filter(Detection.DetectionID == detection_id).update({
+        "EndTime": current.EndTime,
+        "TotalTime": current.TotalTime,
+        "TotalPredictions": current.TotalPredictions,
+        "Score": scores["Score"],
+    }, synchronize_session=False)
+    for part, model in BODY_PART_MODELS.items():
+        db.query(model).filter(model.DetectionID == detection_id)\
+          .update({**getattr(current, part).dict(), "PartialScore": scores[part]}, synchronize_session=False)
+
+    apply_detections_to_user(user, [(current, scores)], replaced=[previous_scored])
+
+    rollup_deltas = {}
+    add_detection_rollup(rollup_deltas, user.UserID, current)
+    add_detection_rollup(rollup_deltas, user.UserID, previous, sign=-1)
+    upsert_rollups(db, rollup_deltas)
+
+    commit_user_detections(db, user)
+
+def commit_user_detections(db: Session, user: User):
+    # commit 後才更新行程內的排名索引與快取，交易失敗時不會留下不一致的狀態
+    new_score = user.AllTimeScore
+    db.commit()
+    score_rank_index.update(user.UserID, new_score)
+    invalidate_leaderboard_member(user.UserID)
+
+def add_detection_rollup(rollup_deltas: dict, user_id: int, data: DetectionCreate, sign: int = 1):
+    add_rollup_delta(
+        rollup_deltas, user_id, data.StartTime, data.TotalTime, data.TotalPredictions,
+        (data.Head.NeutralCount, data.Neck.NeutralCount, data.Shoulder.NeutralCount, data.Torso.NeutralCount, data.Feet.FlatCount),
+        sign,
+    )
+
+def apply_detections_to_user(user: User, scored: list, replaced: list = ()):
+    """
+    將多筆偵測的結果累加到 User 的 AllTimeScore、TotalPredictionCount、TotalDetectionTime。
+    scored: [(DetectionCreate, calculate_detection_scores 的結果), ...]
+    replaced: 格式同 scored，被 scored 取代的舊數值，會先從統計中扣除
+    """
+    added_predictions = sum(data.TotalPredictions for data, _ in scored) - sum(data.TotalPredictions for data, _ in replaced)
+    added_weight = sum(scores["Score"] * data.TotalPredictions for data, scores in scored)\
+                 - sum(scores["Score"] * data.TotalPredictions for data, scores in replaced)
+
+    # 更新 User 的 AllTimeScore 跟 TotalPredictionCount
+    total_weight_after = (user.AllTimeScore * user.TotalPredictionCount) + added_weight
+    total_prediction_count_after = user.TotalPredictionCount + added_predictions
+    if total_prediction_count_after > 0:
+        user.AllTimeScore = total_weight_after / total_prediction_count_after
+    user.TotalPredictionCount = total_prediction_count_after
+
+    # 更新 User 的 TotalDetectionTime
+    new_detection_time = datetime.combine(datetime.min, user.TotalDetectionTime)
+    for data, _ in scored:
+        new_detection_time += timedelta(
+            hours=data.TotalTime.hour,
+            minutes=data.TotalTime.minute,
+            seconds=data.TotalTime.second
+        )
+    for data, _ in replaced:
+        new_detection_time -= timedelta(
+            hours=data.TotalTime.hour,
+            minutes=data.TotalTime.minute,
+            seconds=data.TotalTime.second
+        )
+    user.TotalDetectionTime = new_detection_time.time()
+
+def query_detections_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    start_from: Optional[datetime] = None,
+    end_to: Optional[datetime] = None,
+):
+    """
+    取得一頁偵測紀錄，回傳 (DetectionResponse 格式的 dict 列表, 下一頁 cursor, 上一頁 cursor)。
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="before 與 after 只能擇一使用")
+
+    query = detection_rows_query(db).filter(Detection.UserID == user_id)
+    if start_from:
+        query = query.filter(Detection.StartTime >= start_from)
+    if end_to:
+        query = query.filter(Detection.StartTime < end_to)
+
+    if after:
+        cursor_time, cursor_id = decode_detection_cursor(after)
+        query = query.filter(or_(
+            Detection.StartTime > cursor_time,
+            and_(Detection.StartTime == cursor_time, Detection.DetectionID > cursor_id)
+        )).order_by(Detection.StartTime.asc(), Detection.DetectionID.asc())
+    else:
+        if before:
+            cursor_time, cursor_id = decode_detection_cursor(before)
+            query = query.filter(or_(
+                Detection.StartTime < cursor_time,
+                and_(Detection.StartTime == cursor_time, Detection.DetectionID < cursor_id)
+            ))
+        query = query.order_by(Detection.StartTime.desc(), Detection.DetectionID.desc())
+
+    # 多取一筆判斷是否還有下一頁
+    detections = [serialize_detection_row(row) for row in query.limit(limit + 1).all()]
+    has_more = len(detections) > limit
+    detections = detections[:limit]
+    if after:
+        detections.reverse()
+
+    next_cursor = prev_cursor = None
+    if detections:
+        if has_more or after:
+            next_cursor = encode_detection_cursor(detections[-1])
+        if (has_more and after) or before:
+            prev_cursor = encode_detection_cursor(detections[0])
+
+    return detections, next_cursor, prev_cursor
+
+def stream_detection_export(
+    user_id: int,
+    export_format: ExportFormat,
+    start_from: Optional[datetime] = None,
+    end_to: Optional[datetime] = None,
+):
+    """
+    StreamingResponse 在 dependency 的 session 關閉後才開始讀取，所以這裡使用自己的 session。
+    yield_per 讓資料庫以 server-side cursor 分批取出，每批 DETECTION_EXPORT_CHUNK_SIZE 筆，記憶體用量與資料量無關。
+    """
+    with ReadSessionLocal() as db:
+        columns = DETECTION_COLUMNS if export_format == ExportFormat.ndjson else DETECTION_EXPORT_COLUMNS
+        query = detection_rows_query(db, columns).filter(Detection.UserID == user_id)
+        if start_from:
+            query = query.filter(Detection.StartTime >= start_from)
+        if end_to:
+            query = query.filter(Detection.StartTime < end_to)
+        statement = query.order_by(Detection.StartTime, Detection.DetectionID).statement
+        partitions = db.execute(statement.execution_options(yield_per=DETECTION_EXPORT_CHUNK_SIZE)).partitions()
+
+        if export_format == ExportFormat.ndjson:
+            yield from ndjson_chunks(partitions, serialize_detection_row)
+        else:
+            names = column_names(DETECTION_EXPORT_COLUMNS, Detection)
+            if export_format == ExportFormat.csv:
+                yield from csv_chunks(partitions, DETECTION_EXPORT_COLUMNS, names)
+            else:
+                yield from parquet_chunks(partitions, DETECTION_EXPORT_COLUMNS, names)
+
+def detection_cursor_headers(next_cursor: Optional[str], prev_cursor: Optional[str]) -> dict:
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if prev_cursor:
+        headers["X-Prev-Cursor"] = prev_cursor
+    return headers
+
+def encode_detection_cursor(detection: dict) -> str:
+    return f"{detection['StartTime'].isoformat()}_{detection['DetectionID']}"
+
+def decode_detection_cursor(cursor: str):
+    try:
+        start_time, detection_id = cursor.rsplit("_", 1)
+        start_time, detection_id = datetime.fromisoformat(start_time), int(detection_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的 cursor")
+    # cursor 由 encode_detection_cursor 產生：不含時區的 StartTime 與 BIGINT 範圍內的正整數 DetectionID
+    if start_time.tzinfo is not None or not 0 < detection_id < 2 ** 63:
+        raise HTTPException(status_code=400, detail="無效的 cursor")
+    return start_time, detection_id
+# endregion
+
 # region: [API] put and delete not avaliable now
 '''
 @router.put("/{Detection_id}", response_model=DetectionResponse)
@@ -1,31 +1,81 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, or_, insert, update
+from sqlalchemy.orm import Session
 from app.models import User, FriendList, FriendRequest, StatusEnum
-from app.schemas import UserResponse, FriendRequestCreate, LeaderboardResponse, FriendRequestSentResponse, FriendRequestReceivedResponse, SuccessMessage, FriendRequestAction
+from app.schemas import UserResponse, FriendRequestCreate, LeaderboardResponse, FriendRequestSentResponse, FriendRequestReceivedResponse, SuccessMessage, FriendRequestAction, FriendRequestBulkAction, FriendRequestBulkResult, MutualFriendsResponse, FriendSuggestionResponse
 from app.api.deps import get_current_user
-from app.api.deps import CurrentUser, SessionDep
-from typing import List, Annotated
+from app.api.deps import CurrentUser, CurrentPrincipal, SessionDep, ReadSessionDep
+from typing import List, Annotated, Optional
 from enum import Enum
-from app.core.bll import calculate_user_level, calculate_user_level_progress
+from datetime import datetime
+import time
+from app.core.bll import calculate_user_level, calculate_user_level_progress, time_to_minutes
+from app.core.leaderboards import friend_leaderboard_cache, invalidate_friendships, LEADERBOARD_SORTS
+from app.core.indexes import friend_graph
+from app.config import FRIEND_SUGGESTION_MAX_LIMIT, FRIEND_REQUEST_BATCH_MAX_SIZE
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[UserResponse])
 def get_friends_list(
-    current_user: CurrentUser,
-    db: SessionDep
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep
 ):
-    friends = db.query(User)\
-                .join(FriendList, FriendList.UserID2 == User.UserID)\
-                .filter(FriendList.UserID1 == current_user.UserID)\
-                .all()
+    friend_graph.ensure_loaded(db)
+    friend_ids = friend_graph.friends_of(current_user.UserID)
+    if not friend_ids:
+        return []
+    friends = db.query(User).filter(User.UserID.in_(friend_ids)).all()
 
     return friends
 
+@router.get("/mutual", response_model=List[MutualFriendsResponse])
+def get_mutual_friend_counts(
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep,
+    ids: Annotated[List[int], Query(max_length=100, description="要查詢共同好友數的 UserID")],
+):
+    """
+    目前使用者與每位指定使用者的共同好友數。
+    """
+    friend_graph.ensure_loaded(db)
+    counts = friend_graph.mutual_counts(current_user.UserID, ids)
+    return [MutualFriendsResponse(UserID=user_id, MutualCount=count) for user_id, count in counts.items()]
+
+@router.get("/suggestions", response_model=List[FriendSuggestionResponse])
+def get_friend_suggestions(
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep,
+    limit: Annotated[int, Query(ge=1, le=FRIEND_SUGGESTION_MAX_LIMIT)] = 10,
+):
+    """
+    推薦朋友的朋友，依共同好友數由多到少排序。
+    """
+    friend_graph.ensure_loaded(db)
+    suggestions = friend_graph.suggestions(current_user.UserID, limit)
+    if not suggestions:
+        return []
+    users = {
+        row.UserID: row
+        for row in db.query(User.UserID, User.UserName, User.PhotoUrl)
+                     .filter(User.UserID.in_([user_id for user_id, _ in suggestions]))
+    }
+    return [
+        FriendSuggestionResponse(
+            UserID=user_id,
+            UserName=users[user_id].UserName,
+            PhotoUrl=users[user_id].PhotoUrl,
+            MutualCount=count,
+        )
+        for user_id, count in suggestions
+        if user_id in users
+    ]
+
 @router.post("/requests", response_model=SuccessMessage)
 def send_friend_request(
     request: FriendRequestCreate,
-    current_user: CurrentUser,
+    current_user: CurrentPrincipal,
     db: SessionDep
 ):
     # 不能加自己好友
@@ -67,8 +117,8 @@ def send_friend_request(
 
 @router.get("/requests/received", response_model=List[FriendRequestReceivedResponse])
 def get_received_friend_requests(
-    current_user: CurrentUser,
-    db: SessionDep
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep
 ):
     received_requests = db.query(
         FriendRequest.RequestID,
@@ -87,8 +137,8 @@ def get_received_friend_requests(
 
 @router.get("/requests/sent", response_model=List[FriendRequestSentResponse])
 def get_sent_friend_requests(
-    current_user: CurrentUser,
-    db: SessionDep
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep
 ):
     sent_requests = db.query(
         FriendRequest.RequestID,
@@ -102,11 +152,29 @@ def get_sent_friend_requests(
     
     return sent_requests
 
+@router.patch("/requests", response_model=List[FriendRequestBulkResult])
+def handle_friend_requests_bulk(
+    actions: List[FriendRequestBulkAction],
+    current_user: CurrentPrincipal,
+    db: SessionDep
+):
+    """
+    一次接受 / 拒絕多筆好友邀請：一次查詢驗證、一次寫入好友關係、一次 commit，回傳每一筆的處理結果。
+    """
+    if len(actions) > FRIEND_REQUEST_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次最多處理 {FRIEND_REQUEST_BATCH_MAX_SIZE} 筆好友邀請"
+        )
+    if not actions:
+        return []
+    return apply_friend_request_actions(db, current_user.UserID, actions)
+
 @router.patch("/requests/{id}", response_model=SuccessMessage)
 def handle_friend_request(
     id: int,
     action: FriendRequestAction,
-    current_user: CurrentUser,
+    current_user: CurrentPrincipal,
     db: SessionDep
 ):
     # 1. 查詢該好友請求
@@ -155,51 +223,130 @@ def handle_friend_request(
         )
 
     db.commit()
+    if action.Action == "Accept":
+        friend_graph.add_friendship(current_user.UserID, friend_request.SenderID)
+        invalidate_friendships(current_user.UserID, friend_request.SenderID)
 
     return SuccessMessage(message=f"好友請求已{action.Action.lower()}")
 
 @router.get("/leaderboard", response_model=List[LeaderboardResponse])
 def get_leaderboard(
-    current_user: CurrentUser,
-    db: SessionDep,
-    sortBy: str = "level"  # 排序方式，默認為 level
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep,
+    sortBy: str = "level",  # 排序方式，默認為 level
+    limit: Annotated[Optional[int], Query(ge=1, le=500)] = None,
+    offset: Annotated[int, Query(ge=0)] = 0,
 ):
-    # Step 1: 獲取好友列表
-    friends = db.query(User)\
-                .join(FriendList, FriendList.UserID2 == User.UserID)\
-                .filter(FriendList.UserID1 == current_user.UserID)\
-                .all()
-    
-    # 包括當前用戶
-    users = [current_user] + friends
+    return build_friend_leaderboard(db, current_user.UserID, sortBy, limit, offset)
 
-    # Step 2: 計算每位用戶的等級和進度
-    def calculate_user_data(user):
-        total_minutes = user.TotalDetectionTime.hour * 60 + user.TotalDetectionTime.minute
-        level = calculate_user_level(total_minutes)
-        progress = calculate_user_level_progress(total_minutes, level)
-        return {
-            "UserID": user.UserID,
-            "UserName": user.UserName,
-            "PhotoUrl": user.PhotoUrl,
-            "Rank": 0,  # 稍後排序後再更新
-            "Level": level,
-            "Progress": progress,
-            "AllTimeScore": user.AllTimeScore,
-        }
+# region: depencies functions
+def build_friend_leaderboard(db: Session, user_id: int, sortBy: str, limit: int = None, offset: int = 0):
+    """
+    好友排行榜（包含自己），排好名次的結果會快取，直到好友名單或任一成員的資料改變。
+    """
+    if sortBy not in LEADERBOARD_SORTS:
+        raise HTTPException(status_code=400, detail="Invalid sortBy parameter")
 
-    leaderboard = [calculate_user_data(user) for user in users]
+    rows = friend_leaderboard_cache.get(user_id, sortBy)
+    if rows is None:
+        loaded_at = time.monotonic()
+        rows = load_friend_leaderboard(db, user_id, sortBy)
+        friend_leaderboard_cache.set(user_id, sortBy, rows, [row["UserID"] for row in rows], loaded_at)
 
-    # Step 3: 根據排序方式排序
-    if sortBy == "level":
-        leaderboard.sort(key=lambda x: (-x["Level"], -x["Progress"]))
-    elif sortBy == "score":
-        leaderboard.sort(key=lambda x: -x["AllTimeScore"])
-    else:
-        raise HTTPException(status_code=400, detail="Invalid sortBy parameter")
+    end = None if limit is None else offset + limit
+    return [{**row, "Rank": rank} for rank, row in enumerate(rows[offset:end], start=offset + 1)]
 
-    for idx, user in enumerate(leaderboard, start=1):
-        user["Rank"] = idx
+def apply_friend_request_actions(db: Session, user_id: int, actions: List[FriendRequestBulkAction]):
+    # 1. 一次查詢所有屬於目前使用者（接收者）的邀請
+    request_ids = {action.RequestID for action in actions}
+    pending = {
+        row.RequestID: row
+        for row in db.query(FriendRequest.RequestID, FriendRequest.SenderID, FriendRequest.Status)
+                     .filter(FriendRequest.RequestID.in_(request_ids), FriendRequest.ReceiverID == user_id)
+    }
 
-    return leaderboard
+    # 2. 逐筆檢查，並依動作分組
+    results = []
+    accepted, declined, sender_ids = [], [], set()
+    handled = set()
+    for action in actions:
+        request = pending.get(action.RequestID)
+        if request is None:
+            results.append(FriendRequestBulkResult(RequestID=action.RequestID, Success=False, message="好友邀請不存在或無權處理"))
+            continue
+        if action.RequestID in handled:
+            results.append(FriendRequestBulkResult(RequestID=action.RequestID, Success=False, message="重複的好友邀請"))
+            continue
+        handled.add(action.RequestID)
+        if request.Status != StatusEnum.Pending:
+            results.append(FriendRequestBulkResult(RequestID=action.RequestID, Success=False, message="好友邀請已處理"))
+            continue
+        if action.Action == "Accept":
+            accepted.append(action.RequestID)
+            sender_ids.add(request.SenderID)
+        else:
+            declined.append(action.RequestID)
+        results.append(FriendRequestBulkResult(
+            RequestID=action.RequestID, Success=True, message=f"好友請求已{action.Action.lower()}"
+        ))
 
+    # 3. 每種狀態一個 UPDATE，缺少的好友關係一次 multi-row INSERT
+    now = datetime.utcnow()
+    if accepted:
+        db.execute(update(FriendRequest).where(FriendRequest.RequestID.in_(accepted))
+                   .values(Status=StatusEnum.Accepted, ModDate=now))
+    if declined:
+        db.execute(update(FriendRequest).where(FriendRequest.RequestID.in_(declined))
+                   .values(Status=StatusEnum.Declined, ModDate=now))
+    if sender_ids:
+        existing = set(
+            db.query(FriendList.UserID1, FriendList.UserID2).filter(or_(
+                and_(FriendList.UserID1 == user_id, FriendList.UserID2.in_(sender_ids)),
+                and_(FriendList.UserID2 == user_id, FriendList.UserID1.in_(sender_ids)),
+            )).all()
+        )
+        rows = [
+            {"UserID1": user_id1, "UserID2": user_id2, "CreateDate": now, "ModDate": now}
+            for sender_id in sorted(sender_ids)
+            for user_id1, user_id2 in ((user_id, sender_id), (sender_id, user_id))
+            if (user_id1, user_id2) not in existing
+        ]
+        if rows:
+            db.execute(insert(FriendList), rows)
+    db.commit()
+
+    for sender_id in sender_ids:
+        friend_graph.add_friendship(user_id, sender_id)
+    if sender_ids:
+        invalidate_friendships(user_id, *sender_ids)
+    return results
+
+def load_friend_leaderboard(db: Session, user_id: int, sortBy: str):
+    # 只查詢需要的欄位，並直接在 SQL 排序
+    # 等級與進度都隨 TotalDetectionTime 遞增，所以依 level 排序等同依 TotalDetectionTime 排序
+    order_column = User.TotalDetectionTime if sortBy == "level" else User.AllTimeScore
+    friend_graph.ensure_loaded(db)
+    member_ids = friend_graph.friends_of(user_id) | {user_id}
+    query = db.query(
+        User.UserID,
+        User.UserName,
+        User.PhotoUrl,
+        User.TotalDetectionTime,
+        User.AllTimeScore,
+    ).filter(User.UserID.in_(member_ids))\
+     .order_by(order_column.desc(), User.UserID)
+
+    leaderboard = []
+    for row in query:
+        total_minutes = time_to_minutes(row.TotalDetectionTime)
+        level = calculate_user_level(total_minutes)
+        leaderboard.append({
+            "UserID": row.UserID,
+            "UserName": row.UserName,
+            "PhotoUrl": row.PhotoUrl,
+            "Level": level,
+            "Progress": calculate_user_level_progress(total_minutes, level),
+            "AllTimeScore": row.AllTimeScore,
+        })
+    return leaderboard
+# endregion
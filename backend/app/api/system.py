@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+from app.api.deps import CurrentPrincipal, get_current_principal, get_system_admin
+from app.core.database import registry
+from app.core.relay import relay
+from app.core.security import password_hasher
+
+# 系統狀態只提供給已登入的使用者；會暴露其他使用者資料的詳細內容另外限制為 SYSTEM_ADMIN_USERS
+router = APIRouter(dependencies=[Depends(get_current_principal)])
+
+@router.get("/db-pool")
+def get_db_pool_status():
+    """
+    各資料庫連線池的使用量（checked_out / capacity）與取用等待時間統計。
+    """
+    return registry.pool_status()
+
+
+@router.get("/ws-queues")
+def get_ws_queue_status(principal: CurrentPrincipal, detail: bool = False):
+    """
+    本 worker 上 WebSocket 送出佇列的彙總數字（各角色連線數、佇列深度、丟棄 / 合併次數）。
+    detail=true 時回傳每條連線（使用者 / 角色 / 裝置）的數字，只有管理者可以查看。
+    """
+    if detail:
+        get_system_admin(principal)
+        return relay.queue_stats()
+    return relay.queue_summary()
+
+
+@router.get("/bcrypt")
+def get_bcrypt_status():
+    """
+    本 worker 的 bcrypt process pool 使用量、排隊等待時間與重新雜湊次數。
+    """
+    return password_hasher.stats()
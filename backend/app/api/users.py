@@ -1,18 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, Query, Header, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from sqlalchemy import func, or_, and_, case
 from sqlalchemy.orm import Session
 from app.models import User, FriendRequest, FriendList
-from app.schemas import UserRegister, UserUpdate, UserResponse, PasswordUpdate, SuccessMessage, ExtendedUserResponse, UserSearchResponse
-from app.core.security import get_password_hash, verify_password
-from app.api.deps import CurrentUser, SessionDep
+from app.schemas import UserRegister, UserUpdate, UserResponse, PasswordUpdate, SuccessMessage, ExtendedUserResponse, UserSearchResponse, LeaderboardResponse
+from app.core.security import get_password_hash, verify_password, invalidate_principal
+from app.api.deps import CurrentUser, CurrentPrincipal, SessionDep, ReadSessionDep
 from app.core.bll import calculate_user_level, calculate_user_level_progress, time_to_minutes
+from app.core.indexes import score_rank_index, username_index, friend_graph
+from app.config import USER_SEARCH_MAX_CANDIDATES
+from app.core.leaderboards import invalidate_leaderboard_member
+from app.core.serializers import FastJSONResponse, compile_object_serializer
+from app.core.avatars import (
+    save_upload, build_variants, get_executor, remove_avatar, forget_avatar, variant_name, pick_variant_size,
+    find_avatar, etag_matches,
+)
 from pathlib import Path
-import shutil
-import uuid
 from datetime import datetime
 
-from typing import List, Annotated
+from typing import List, Annotated, Optional
 
 router = APIRouter()
 
@@ -20,18 +28,27 @@ router = APIRouter()
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 BASE_IMAGE_DIR = BASE_DIR / "images"
 BASE_IMAGE_DIR.mkdir(parents=True, exist_ok=True)  # 確保目錄存在
+DEFAULT_PHOTO = "default.png"  # 所有使用者共用的預設圖片，不能刪除
 
 @router.get("/search", response_model=List[UserSearchResponse])
 def search_users(
     q: Annotated[str, Query(..., description="UserName")],
-    current_user: CurrentUser,
-    db: SessionDep
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep
 ):
     """
     搜尋使用者，同時額外取得兩個欄位：
       - RequestState：若 FriendRequest 存在則回傳 Status（否則回傳空字串）
       - IsFriend：若 Friend 表中存在 friend 關係則為 True，否則為 False
+    名稱比對使用行程內的 username_index（前綴優先），只有排名前 50 的使用者才查詢好友狀態；
+    是否為好友由 friend_graph 判斷。
     """
+    username_index.ensure_loaded(db)
+    friend_graph.ensure_loaded(db)
+    user_ids = username_index.search(q, 50, USER_SEARCH_MAX_CANDIDATES)
+    if not user_ids:
+        return []
+
     query = (
         db.query(
             User.UserID,
@@ -39,11 +56,6 @@ def search_users(
             User.PhotoUrl,
             # 若有 FriendRequest 資料就會取得 Status，否則為 None
             FriendRequest.Status,
-            # 利用 outer join 判斷 Friend 是否存在：若 Friend.UserID1 不為 None，則為 True
-            case(
-                (FriendList.UserID1 != None, True),
-                else_=False
-            ).label("is_friend")
         )
         .outerjoin(
             FriendRequest,
@@ -52,21 +64,15 @@ def search_users(
                 FriendRequest.ReceiverID == User.UserID
             )
         )
-        .outerjoin(
-            FriendList,
-            and_(
-                FriendList.UserID1 == current_user.UserID,
-                FriendList.UserID2 == User.UserID
-            )
-        )
-        .filter(User.UserName.ilike(f"%{q}%")) 
-        .limit(50)
+        .filter(User.UserID.in_(user_ids))
     )
 
-    results = query.all()
+    # 依索引的排名排序
+    positions = {user_id: position for position, user_id in enumerate(user_ids)}
+    results = sorted(query.all(), key=lambda row: positions[row.UserID])
 
     output = []
-    for user_id, user_name, photo_url, friend_status, is_friend in results:
+    for user_id, user_name, photo_url, friend_status in results:
         # 若搜尋到的是目前使用者，本身就不需要 RequestState（可依需求調整）
         if user_id == current_user.UserID:
             friend_status = None
@@ -76,13 +82,12 @@ def search_users(
             UserName=user_name,
             PhotoUrl=photo_url,
             RequestState=friend_status,
-            IsFriend=is_friend
+            IsFriend=friend_graph.is_friend(current_user.UserID, user_id)
         ))
 
     return output
 
-@router.post("/", response_model=ExtendedUserResponse)
-def create_user(user: UserRegister, db: SessionDep):
+def check_new_user(db: Session, user: UserRegister):
     # 檢查郵箱是否已經存在
     db_user = db.query(User).filter(User.Email == user.Email).first()
     if db_user:
@@ -92,21 +97,30 @@ def create_user(user: UserRegister, db: SessionDep):
     db_user = db.query(User).filter(User.UserName == user.UserName).first()
     if db_user:
         raise HTTPException(status_code=400, detail="用戶名已被使用")
-    
-    user_data = user.dict()
-    user_data['Password'] = get_password_hash(user.Password)
 
+def insert_user(db: Session, user_data: dict) -> dict:
     new_user = User(**user_data)
 
     # 添加並提交到資料庫
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
-    
+    score_rank_index.update(new_user.UserID, new_user.AllTimeScore)
+    username_index.add(new_user.UserID, new_user.UserName)
     return get_userDTO(db, new_user)
 
+@router.post("/", response_model=ExtendedUserResponse)
+async def create_user(user: UserRegister, db: SessionDep):
+    # 資料庫存取在 threadpool 執行；等待 bcrypt 時只 await，不佔用任何執行緒
+    await run_in_threadpool(check_new_user, db, user)
+
+    user_data = user.dict()
+    user_data['Password'] = await get_password_hash(user.Password)
+
+    return FastJSONResponse(await run_in_threadpool(insert_user, db, user_data))
+
 @router.patch("/me", response_model=ExtendedUserResponse)
-def update_user(user: UserUpdate, current_user: CurrentUser, db: SessionDep):
+def update_user(user: UserUpdate, current_user: CurrentPrincipal, db: SessionDep):
     db_user = db.query(User).filter(User.UserID == current_user.UserID).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="用戶未找到")
@@ -122,17 +136,25 @@ def update_user(user: UserUpdate, current_user: CurrentUser, db: SessionDep):
     
     db.commit()
     db.refresh(db_user)
+    invalidate_leaderboard_member(db_user.UserID)
+    username_index.add(db_user.UserID, db_user.UserName)
+
+    return FastJSONResponse(get_userDTO(db, db_user))
 
-    return get_userDTO(db, db_user)
+def save_password(db: Session, user: User, hashed_password: str):
+    user.Password = hashed_password
+    db.commit()
+    db.refresh(user)
+    invalidate_principal(user.UserID)
 
 @router.patch("/me/password", response_model=SuccessMessage)
-def update_password(
+async def update_password(
     password_data: PasswordUpdate,
     current_user: CurrentUser,
     db: SessionDep
 ):
     # 1. 驗證當前密碼是否正確
-    if not verify_password(password_data.current_password, current_user.Password):
+    if not await verify_password(password_data.current_password, current_user.Password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="當前密碼不正確",
@@ -140,87 +162,126 @@ def update_password(
         )
     
     # 2. 確保新密碼與當前密碼不同
-    if verify_password(password_data.new_password, current_user.Password):
+    if await verify_password(password_data.new_password, current_user.Password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="新密碼不能與當前密碼相同",
         )
     
-    hashed_new_password = get_password_hash(password_data.new_password)
-    current_user.Password = hashed_new_password
-    
-    db.commit()
-    db.refresh(current_user)
+    hashed_new_password = await get_password_hash(password_data.new_password)
+    await run_in_threadpool(save_password, db, current_user, hashed_new_password)
     
     return SuccessMessage(message="密碼更新成功")
 
 @router.get("/me", response_model=ExtendedUserResponse)
 def read_users_me(current_user: CurrentUser, db: SessionDep):
-    return get_userDTO(db, current_user)
+    return FastJSONResponse(get_userDTO(db, current_user))
+
+@router.get("/leaderboard", response_model=List[LeaderboardResponse])
+def get_global_leaderboard(
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0)] = 0
+):
+    """
+    全站依 AllTimeScore 排名的排行榜（由行程內的排名索引提供）。
+    """
+    score_rank_index.ensure_loaded(db)
+    return get_leaderboard_entries(db, score_rank_index.page(offset, limit))
+
+@router.get("/leaderboard/around-me", response_model=List[LeaderboardResponse])
+def get_leaderboard_around_me(
+    current_user: CurrentPrincipal,
+    db: ReadSessionDep,
+    radius: Annotated[int, Query(ge=0, le=50)] = 5
+):
+    """
+    全站排行榜中，排在目前使用者前後各 radius 名的使用者。
+    """
+    score_rank_index.ensure_loaded(db)
+    return get_leaderboard_entries(db, score_rank_index.around(current_user.UserID, radius))
+
+def replace_photo(db: Session, user_id: int, filename: str):
+    """
+    更新使用者的照片檔名，並刪除舊的檔案與縮圖（預設圖片除外）。
+    """
+    db_user = db.get(User, user_id)
+    old_photo_url = db_user.PhotoUrl
+    db_user.PhotoUrl = filename
+    db.commit()
+    invalidate_leaderboard_member(db_user.UserID)
+
+    if old_photo_url and old_photo_url != DEFAULT_PHOTO:
+        remove_avatar(BASE_IMAGE_DIR, old_photo_url)
 
 @router.post("/avatar")
-def upload_photo(current_user: CurrentUser, file: UploadFile, db: SessionDep):
+async def upload_photo(current_user: CurrentPrincipal, file: UploadFile, db: SessionDep):
+    # 資料庫與檔案存取在 threadpool 執行；等待縮圖的 process pool 時只 await，不佔用任何執行緒
     # 檢查使用者是否存在
-    db_user = db.query(User).filter(User.UserID == current_user.UserID).first()
-    if not db_user:
+    if await run_in_threadpool(db.get, User, current_user.UserID) is None:
         raise HTTPException(status_code=404, detail="用戶未找到")
 
     # 檢查檔案類型
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Invalid file type, only images are allowed")
 
-    # 提取副檔名
-    file_extension = Path(file.filename).suffix
-    if not file_extension:
-        raise HTTPException(status_code=400, detail="File must have an extension")
-
-    # 刪除舊的檔案（如果存在）
-    if db_user.PhotoUrl:
-        old_photo_path = BASE_IMAGE_DIR / db_user.PhotoUrl
-        if old_photo_path.exists():
-            old_photo_path.unlink()
-
-    # 生成亂碼檔名
-    unique_filename = f"{uuid.uuid4().hex}{file_extension}"
-    photo_path = BASE_IMAGE_DIR / unique_filename
-
-    # 儲存新檔案
+    # 分段寫入新檔案（亂碼檔名），超過大小上限時中止；副檔名之後依實際的圖片格式決定
     try:
-        with photo_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        photo_path = await run_in_threadpool(save_upload, file.file, BASE_IMAGE_DIR)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
 
-    # 更新使用者的照片檔名
-    db_user.PhotoUrl = unique_filename
-    db.commit()
+    # 在 process pool 中驗證圖片、產生固定尺寸的縮圖，並將原圖改名為 Pillow 判斷出的格式的副檔名
+    try:
+        unique_filename, _ = await asyncio.wrap_future(get_executor().submit(build_variants, str(photo_path)))
+    except ValueError as e:
+        await run_in_threadpool(remove_avatar, BASE_IMAGE_DIR, photo_path.name)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await run_in_threadpool(remove_avatar, BASE_IMAGE_DIR, photo_path.name)
+        raise HTTPException(status_code=500, detail=f"Failed to process image: {e}")
+
+    forget_avatar(unique_filename)
+    await run_in_threadpool(replace_photo, db, current_user.UserID, unique_filename)
 
     return {"message": "Photo uploaded successfully", "filename": unique_filename}
 
 
 @router.get("/avatar/{photo_url}")
-def get_image(photo_url: str, db: SessionDep):
-    # 確保傳入的文件名安全
-    try:
-        sanitized_path = Path(photo_url).name  # 僅保留檔名，移除路徑
-        image_path = BASE_IMAGE_DIR / sanitized_path
-    except Exception:
+def get_image(
+    photo_url: str,
+    size: Annotated[Optional[int], Query(ge=1, le=4096, description="需要的邊長（px），會回傳最接近的預先產生縮圖")] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    # 確保傳入的文件名安全：僅保留檔名，移除路徑，檔案一定在 BASE_IMAGE_DIR 內
+    sanitized_path = Path(photo_url).name
+    if sanitized_path in ("", ".", ".."):
         raise HTTPException(status_code=400, detail="Invalid image name")
 
-    # 確保文件在指定的 BASE_IMAGE_DIR 內
-    if not image_path.resolve().is_relative_to(BASE_IMAGE_DIR):
-        raise HTTPException(status_code=400, detail="Invalid image path")
-
-    # 檢查檔案是否存在
-    if not image_path.exists() or not image_path.is_file():
+    # 有縮圖時回傳縮圖，舊的上傳或預設圖片沒有縮圖則回傳原圖
+    image = None
+    if size is not None:
+        image = find_avatar(BASE_IMAGE_DIR, variant_name(sanitized_path, pick_variant_size(size)))
+    if image is None:
+        image = find_avatar(BASE_IMAGE_DIR, sanitized_path)
+    if image is None:
         raise HTTPException(status_code=404, detail="Image not found")
 
-    return FileResponse(image_path)
+    headers = {"ETag": image.etag, "Cache-Control": image.cache_control}
+    if etag_matches(if_none_match, image.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if image.content is not None:
+        return Response(content=image.content, media_type=image.media_type, headers=headers)
+    return FileResponse(image.path, media_type=image.media_type, headers=headers)
 
 # region: depencies functions
-def get_userDTO(db: Session, user: User) -> ExtendedUserResponse:
-    user_dict = user.dict()
+# 依 ExtendedUserResponse 的欄位順序直接從 User 取值，PR / Level / LevelProgress 由 get_userDTO 計算後傳入
+serialize_user = compile_object_serializer(ExtendedUserResponse, ("PR", "Level", "LevelProgress"))
 
+def get_userDTO(db: Session, user: User) -> dict:
     pr = compute_user_percentile_rank(db, user)
 
     # Core transfer logic
@@ -228,25 +289,42 @@ def get_userDTO(db: Session, user: User) -> ExtendedUserResponse:
     level = calculate_user_level(total_minutes)
     progress = calculate_user_level_progress(total_minutes, level)
 
-    return ExtendedUserResponse(
-        **user_dict,
-        PR=pr,
-        Level=level,
-        LevelProgress=progress,
-    )
+    return serialize_user(user, pr, level, progress)
 
 def compute_user_percentile_rank(db: Session, user: User) -> float:
     user_score = user.AllTimeScore or 0.0
 
-    # <= user_score
-    count_lte = db.query(func.count(User.UserID)).filter(User.AllTimeScore <= user_score).scalar()
-    # 全部人數
-    count_all = db.query(func.count(User.UserID)).scalar()
+    # 分數 <= user_score 的人數 / 全部人數，由排名索引以 O(log n) 計算
+    score_rank_index.ensure_loaded(db)
+    return score_rank_index.percentile_rank(user_score)
 
-    if not count_all:
-        return 0.0
-    
-    pr = (count_lte / count_all) * 100
-    return pr
+def get_leaderboard_entries(db: Session, ranked: list) -> List[LeaderboardResponse]:
+    """
+    ranked: [(Rank, UserID, score), ...]，一次查出這些使用者的顯示資料。
+    """
+    if not ranked:
+        return []
+    rows = db.query(User.UserID, User.UserName, User.PhotoUrl, User.TotalDetectionTime)\
+             .filter(User.UserID.in_([user_id for _, user_id, _ in ranked]))\
+             .all()
+    users_by_id = {row.UserID: row for row in rows}
+
+    leaderboard = []
+    for rank, user_id, score in ranked:
+        row = users_by_id.get(user_id)
+        if row is None:
+            continue
+        total_minutes = time_to_minutes(row.TotalDetectionTime)
+        level = calculate_user_level(total_minutes)
+        leaderboard.append(LeaderboardResponse(
+            UserID=row.UserID,
+            UserName=row.UserName,
+            PhotoUrl=row.PhotoUrl,
+            Rank=rank,
+            Level=level,
+            Progress=calculate_user_level_progress(total_minutes, level),
+            AllTimeScore=score,
+        ))
+    return leaderboard
 
 # endregion
\ No newline at end of file
@@ -1,200 +1,372 @@
-import requests
+"""
+API 壓力測試：以多個 async client 同時呼叫 API，統計每個 endpoint 的延遲分佈與每秒請求數。
 
-BASE_URL = "http://localhost:8000"  # FastAPI 服務的 URL
+    # 對執行中的服務（預設 http://localhost:8000）
+    python app/api_simulation.py --concurrency 50 --duration 60 --ramp-up 10
 
-# 測試數據
-test_user_datas = [
-    {
-    "UserName": f"user{x+1}",
-    "Email": f"user{x+1}@example.com",
-    "Password": "123123123",
-    "PhotoUrl":"default.png"
-    } for x in range(10)
-]
-
-updated_user_data = {
-    "FirstName": "Test",
-    "LastName": "User",
-    "Gender": "Other"
-}
+    # 在同一個行程內啟動 app（未設定 DATABASE_URL 時使用暫存的 SQLite）
+    python app/api_simulation.py --in-process --concurrency 20 --duration 15
 
-password_update_data = {
-    "current_password": "password123",
-    "new_password": "newpassword456",
-    "confirm_password": "newpassword456"
-}
+    # 自訂情境比例與分段負載（秒數:同時使用者數，使用者數在每段內線性變化）
+    python app/api_simulation.py --mix "login=1,me=5,ingest=3,leaderboard=2,search=2,friend_requests=1" \\
+        --stages "10:20,30:20,10:100,30:100"
 
-test_detection_data = {
-  "StartTime": "2024-12-22T09:40:14.883Z",
-  "EndTime": "2024-12-22T09:40:34.883Z",
-  "TotalTime": "00:00:20.0Z",
-  "TotalPredictions": 20,
-  "Torso": {
-    "BackwardCount": 0,
-    "ForwardCount": 0,
-    "NeutralCount": 10,
-    "AmbiguousCount": 10
-  },
-  "Feet": {
-    "AnkleOnKneeCount": 5,
-    "FlatCount": 5,
-    "AmbiguousCount": 10
-  },
-  "Head": {
-    "BowedCount": 2,
-    "NeutralCount": 3,
-    "TiltBackCount": 5,
-    "AmbiguousCount": 10
-  },
-  "Shoulder": {
-    "HunchedCount": 2,
-    "NeutralCount": 3,
-    "ShrugCount": 5,
-    "AmbiguousCount": 10
-  },
-  "Neck": {
-    "ForwardCount": 2,
-    "NeutralCount": 8,
-    "AmbiguousCount": 10
-  }
-}
+結果以 JSON 輸出（--output 指定檔案，否則印在 stdout）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager, redirect_stdout
+from pathlib import Path
+
+import httpx
+
+BASE_URL = "http://localhost:8000"  # FastAPI 服務的 URL
+
+# 測試帳號的密碼，每位虛擬使用者使用 user{n} 帳號
+TEST_PASSWORD = "123123123"
 
-test_detection_data2 = {
+test_detection_data = {
     "StartTime": "2024-12-22T17:32:42",
     "EndTime": "2024-12-22T17:34:32",
     "TotalTime": "00:01:50",
     "TotalPredictions": 110,
-    "Torso": {
-        "BackwardCount": 10,
-        "ForwardCount": 20,
-        "NeutralCount": 70,
-        "AmbiguousCount": 10
-    },
-    "Feet": {
-        "AnkleOnKneeCount": 5,
-        "FlatCount": 95,
-        "AmbiguousCount": 10
-    },
-    "Head": {
-        "BowedCount": 15,
-        "NeutralCount": 80,
-        "TiltBackCount": 5,
-        "AmbiguousCount": 10
-    },
-    "Shoulder": {
-        "HunchedCount": 10,
-        "NeutralCount": 85,
-        "ShrugCount": 5,
-        "AmbiguousCount": 10
-    },
-    "Neck": {
-        "ForwardCount": 20,
-        "NeutralCount": 80,
-        "AmbiguousCount": 10
-    }
+    "Torso": {"BackwardCount": 10, "ForwardCount": 20, "NeutralCount": 70, "AmbiguousCount": 10},
+    "Feet": {"AnkleOnKneeCount": 5, "FlatCount": 95, "AmbiguousCount": 10},
+    "Head": {"BowedCount": 15, "NeutralCount": 80, "TiltBackCount": 5, "AmbiguousCount": 10},
+    "Shoulder": {"HunchedCount": 10, "NeutralCount": 85, "ShrugCount": 5, "AmbiguousCount": 10},
+    "Neck": {"ForwardCount": 20, "NeutralCount": 80, "AmbiguousCount": 10},
 }
 
-def create_user(user_data, is_print=False):
-    response = requests.post(f"{BASE_URL}/users/", json=user_data)
-    if is_print:
-        print("Create User Response:", response.json())
-    return response
+# 預設情境比例（權重）
+DEFAULT_MIX = {"login": 1, "me": 5, "ingest": 3, "leaderboard": 2, "search": 2, "friend_requests": 1}
 
-def login_user(user_data, is_print=False):
-    login_data = {"username": user_data["UserName"], "password": user_data["Password"]}
-    response = requests.post(f"{BASE_URL}/auth/token", data=login_data)
-    if is_print:
-        print("Login Response:", response.json())
-    return response.json()["access_token"]
-
-def get_current_user(token, is_print=False):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"{BASE_URL}/users/me", headers=headers)
-    print("Get Current User Response:", response.json())
-    return response
+# 延遲直方圖的上界（毫秒），最後一格為 +Inf
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
 
-def update_user(token, is_print=False):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.patch(f"{BASE_URL}/users/me", json=updated_user_data, headers=headers)
-    print("Update User Response:", response.json())
-    return response
 
-def update_password(token, is_print=False):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.patch(f"{BASE_URL}/users/me/password", json=password_update_data, headers=headers)
-    if is_print:
-        print("Update Password Response:", response.json())
-    return response
+def percentile(sorted_values, q: float) -> float:
+    """
+    nearest-rank 百分位數，sorted_values 必須已排序。
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(-(-q * len(sorted_values) // 100)))  # ceil(q / 100 * n)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LatencyRecorder:
+    """
+    依 endpoint（"METHOD /path"）記錄每個請求的延遲與狀態碼。
+    """
+
+    def __init__(self):
+        self.latencies = {}  # {endpoint: [ms, ...]}
+        self.statuses = {}   # {endpoint: {status: count}}
+        self.started_at = None
+        self.finished_at = None
 
-def create_detection(token, detection_data, is_print=False):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.post(f"{BASE_URL}/detections/", json=detection_data, headers=headers)
-    if is_print:
-        print("Create Detection Response:", response.json())
+    def record(self, endpoint: str, elapsed_ms: float, status):
+        self.latencies.setdefault(endpoint, []).append(elapsed_ms)
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def report(self) -> dict:
+        duration = max((self.finished_at or time.perf_counter()) - (self.started_at or 0), 1e-9)
+        endpoints = {}
+        total = 0
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+            histogram = {}
+            lower = 0
+            for bound in HISTOGRAM_BUCKETS_MS:
+                histogram[f"le_{bound}"] = sum(1 for value in values if lower < value <= bound) if values else 0
+                lower = bound
+            histogram["le_inf"] = sum(1 for value in values if value > HISTOGRAM_BUCKETS_MS[-1])
+            endpoints[endpoint] = {
+                "count": len(values),
+                "errors": errors,
+                "status": statuses,
+                "rps": round(len(values) / duration, 2),
+                "mean_ms": round(sum(values) / len(values), 3),
+                "p50_ms": round(percentile(values, 50), 3),
+                "p95_ms": round(percentile(values, 95), 3),
+                "p99_ms": round(percentile(values, 99), 3),
+                "max_ms": round(values[-1], 3),
+                "histogram_ms": histogram,
+            }
+            total += len(values)
+        return {
+            "duration_s": round(duration, 3),
+            "requests": total,
+            "rps": round(total / duration, 2),
+            "endpoints": endpoints,
+        }
+
+
+class VirtualUser:
+    def __init__(self, index: int):
+        self.username = f"user{index + 1}"
+        self.email = f"user{index + 1}@example.com"
+        self.user_id = None
+        self.token = None
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def timed(client: httpx.AsyncClient, recorder: LatencyRecorder, endpoint: str, method: str, url: str, **kwargs):
+    """
+    送出請求並記錄延遲；連線錯誤記為 status "error"，回傳 None。
+    """
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        recorder.record(endpoint, (time.perf_counter() - started) * 1000, "error")
+        print(f"{endpoint} failed: {e!r}", file=sys.stderr)
+        return None
+    recorder.record(endpoint, (time.perf_counter() - started) * 1000, response.status_code)
     return response
 
-def create_friend_request(token, receiverId, is_print=False):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.post(
-        f"{BASE_URL}/friends/requests",
-        json={"ReceiverID": receiverId},
-        headers=headers
+
+# region: 情境
+async def scenario_login(client, recorder, user: VirtualUser, users, rng):
+    response = await timed(
+        client, recorder, "POST /auth/token", "POST", "/auth/token",
+        data={"username": user.username, "password": TEST_PASSWORD},
     )
-    if is_print:
-        print("Create Friend Request Response:", response.json())
-    return response
+    if response is not None and response.status_code == 200:
+        user.token = response.json()["access_token"]
+
 
+async def scenario_me(client, recorder, user: VirtualUser, users, rng):
+    await timed(client, recorder, "GET /users/me", "GET", "/users/me", headers=user.headers)
 
-def accept_friend_request(token, is_print=False):
-    headers = {"Authorization": f"Bearer {token}"}
 
-    response = requests.get(f"{BASE_URL}/friends/requests/received/", headers=headers)
-    if response.status_code != 200:
-        print(f"Failed to fetch friend requests: {response.status_code}, {response.text}")
+async def scenario_ingest(client, recorder, user: VirtualUser, users, rng):
+    await timed(client, recorder, "POST /detections/", "POST", "/detections/", json=test_detection_data, headers=user.headers)
+
+
+async def scenario_leaderboard(client, recorder, user: VirtualUser, users, rng):
+    if rng.random() < 0.5:
+        await timed(client, recorder, "GET /users/leaderboard", "GET", "/users/leaderboard", headers=user.headers)
+    else:
+        await timed(
+            client, recorder, "GET /friends/leaderboard", "GET", "/friends/leaderboard",
+            params={"sortBy": rng.choice(("level", "score")), "limit": 20}, headers=user.headers,
+        )
+
+
+async def scenario_search(client, recorder, user: VirtualUser, users, rng):
+    query = rng.choice(users).username[: rng.randint(2, 5)]
+    await timed(client, recorder, "GET /users/search", "GET", "/users/search", params={"q": query}, headers=user.headers)
+
+
+async def scenario_friend_requests(client, recorder, user: VirtualUser, users, rng):
+    """
+    有待處理的邀請時一次全部接受，否則隨機送出一個好友邀請（已是好友或重複邀請會回傳 400）。
+    """
+    response = await timed(
+        client, recorder, "GET /friends/requests/received", "GET", "/friends/requests/received", headers=user.headers,
+    )
+    if response is None or response.status_code != 200:
         return
-    friend_requests = response.json()
-    for req in friend_requests:
-        user_id = req.get("RequestID")
-        if not user_id:
-            print(f"Skipping invalid request: {req}")
+    actions = [{"RequestID": req["RequestID"], "Action": "Accept"} for req in response.json()]
+    if actions:
+        await timed(client, recorder, "PATCH /friends/requests", "PATCH", "/friends/requests", json=actions, headers=user.headers)
+        return
+    receiver = rng.choice(users)
+    if receiver is user or receiver.user_id is None:
+        return
+    await timed(
+        client, recorder, "POST /friends/requests", "POST", "/friends/requests",
+        json={"ReceiverID": receiver.user_id}, headers=user.headers,
+    )
+
+
+SCENARIOS = {
+    "login": scenario_login,
+    "me": scenario_me,
+    "ingest": scenario_ingest,
+    "leaderboard": scenario_leaderboard,
+    "search": scenario_search,
+    "friend_requests": scenario_friend_requests,
+}
+# endregion
+
+
+def parse_mix(text: str) -> dict:
+    """
+    "login=1,me=5" -> {"login": 1.0, "me": 5.0}
+    """
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
             continue
-        accept_response = requests.patch(
-            f"{BASE_URL}/friends/requests/{user_id}",
-            json={"Action": "Accept"},
-            headers=headers
-        )
-        if is_print:
-            print("Accept Friend Request Response:", accept_response.json())
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {name} (available: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Scenario mix must have a positive weight")
+    return mix
+
+
+def parse_stages(text: str):
+    """
+    "10:20,30:20" -> [(10.0, 20), (30.0, 20)]，每段為（秒數, 結束時的同時使用者數）。
+    """
+    stages = []
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        seconds, _, target = part.partition(":")
+        stages.append((float(seconds), int(target)))
+    if not stages:
+        raise ValueError("At least one stage is required")
+    return stages
+
+
+def build_stages(concurrency: int, duration: float, ramp_up: float):
+    stages = []
+    if ramp_up > 0:
+        stages.append((ramp_up, concurrency))
+    stages.append((duration, concurrency))
+    return stages
+
+
+def target_concurrency(stages, elapsed: float) -> int:
+    """
+    依經過時間計算目前應該活動的使用者數，每段內由上一段的人數線性變化到該段的目標。
+    """
+    previous = 0
+    for seconds, target in stages:
+        if elapsed < seconds:
+            return int(round(previous + (target - previous) * elapsed / seconds))
+        elapsed -= seconds
+        previous = target
+    return previous
+
+
+async def setup_users(client: httpx.AsyncClient, count: int):
+    """
+    建立（或沿用既有的）測試帳號並登入，取得 token 與 UserID。
+    """
+    users = [VirtualUser(i) for i in range(count)]
+
+    async def prepare(user: VirtualUser):
+        await client.post("/users/", json={"UserName": user.username, "Email": user.email, "Password": TEST_PASSWORD})
+        response = await client.post("/auth/token", data={"username": user.username, "password": TEST_PASSWORD})
+        response.raise_for_status()
+        user.token = response.json()["access_token"]
+        response = await client.get("/users/me", headers=user.headers)
+        response.raise_for_status()
+        user.user_id = response.json()["UserID"]
+
+    # 註冊與登入都是 bcrypt，分批進行避免暖身階段就塞滿伺服器
+    for start in range(0, count, 20):
+        await asyncio.gather(*(prepare(user) for user in users[start:start + 20]))
+    return users
+
+
+async def run_load(client: httpx.AsyncClient, users, mix: dict, stages, think_time: float = 0.0, seed: int = None) -> dict:
+    recorder = LatencyRecorder()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    max_workers = max(target for _, target in stages)
+    total_seconds = sum(seconds for seconds, _ in stages)
+    recorder.started_at = time.perf_counter()
+    deadline = recorder.started_at + total_seconds
+
+    async def worker(index: int):
+        rng = random.Random(None if seed is None else seed + index)
+        user = users[index % len(users)]
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                return
+            if index >= target_concurrency(stages, now - recorder.started_at):
+                await asyncio.sleep(0.05)
+                continue
+            name = rng.choices(names, weights)[0]
+            await SCENARIOS[name](client, recorder, user, users, rng)
+            if think_time > 0:
+                await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+    await asyncio.gather(*(worker(i) for i in range(max_workers)))
+    recorder.finished_at = time.perf_counter()
+    report = recorder.report()
+    report["stages"] = [{"seconds": seconds, "concurrency": target} for seconds, target in stages]
+    report["mix"] = mix
+    report["users"] = len(users)
+    return report
+
+
+@asynccontextmanager
+async def open_client(base_url: str = None, in_process: bool = False, max_connections: int = 100):
+    """
+    base_url 指向執行中的服務；in_process=True 時直接以 ASGITransport 呼叫同一行程內的 app（含 lifespan）。
+    """
+    if not in_process:
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        async with httpx.AsyncClient(base_url=base_url or BASE_URL, limits=limits, timeout=30) as client:
+            yield client
+        return
+
+    if "DATABASE_URL" not in os.environ:
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'api_simulation.db'}"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=30) as client:
+            yield client
+
+
+async def main(args) -> dict:
+    mix = parse_mix(args.mix) if args.mix else dict(DEFAULT_MIX)
+    stages = parse_stages(args.stages) if args.stages else build_stages(args.concurrency, args.duration, args.ramp_up)
+    async with open_client(args.url, args.in_process, max(target for _, target in stages)) as client:
+        users = await setup_users(client, args.users or max(target for _, target in stages))
+        report = await run_load(client, users, mix, stages, args.think_time, args.seed)
+    report["target"] = "in-process" if args.in_process else (args.url or BASE_URL)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load generator for the SSD API")
+    parser.add_argument("--url", default=None, help=f"base URL of a running server (default {BASE_URL})")
+    parser.add_argument("--in-process", action="store_true", help="run the app in this process through ASGITransport")
+    parser.add_argument("--concurrency", type=int, default=10, help="number of concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to hold full concurrency")
+    parser.add_argument("--ramp-up", type=float, default=0, help="seconds to ramp from 0 to full concurrency")
+    parser.add_argument("--stages", default=None, help='ramp profile "seconds:users,...", overrides the three options above')
+    parser.add_argument("--users", type=int, default=None, help="number of test accounts (default: peak concurrency)")
+    parser.add_argument("--mix", default=None, help='scenario weights, e.g. "login=1,me=5,ingest=3"')
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds each virtual user waits between scenarios")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for reproducible scenario order")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    print("\nCreating user...")
-    for user_data in test_user_datas:
-        create_user(user_data)
-    
-    print("\nLogging in user...")
-    tokens = []
-    for user_data in test_user_datas:
-        token = login_user(user_data)
-        tokens.append(token)
-    
-    # print("\n3. Getting current user data...")
-    # get_current_user(token)
-    
-    # print("\n4. Updating user data...")
-    # update_user(token)
-    
-    # print("\n5. Updating password...")
-    # update_password(token)
-
-    print("\nCreating detection...")
-    for idx, user_data in enumerate(test_user_datas):
-        create_detection(tokens[idx], test_detection_data2)
-
-    print("\nSend friend request to user0(id=0) ...")
-    for idx, user_data in enumerate(test_user_datas):
-        create_friend_request(token=tokens[idx], receiverId=1)
-
-    # print("\nAccept friend request to user0(id=0) ...")
-    # accept_friend_request(token=tokens[0])
-    
+    args = parse_args()
+    # app 與伺服器端的 print 改印到 stderr，stdout 只有 JSON 報告
+    with redirect_stdout(sys.stderr):
+        report = asyncio.run(main(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    else:
+        print(text)
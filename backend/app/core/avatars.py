@@ -0,0 +1,206 @@
+import mimetypes
+import os
+import re
+import stat
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+from app.config import (
+    AVATAR_SIZES, AVATAR_MAX_UPLOAD_BYTES, AVATAR_WORKERS, AVATAR_CACHE_MAX_BYTES, AVATAR_CACHE_MAX_ITEM_BYTES,
+)
+from app.core.cache import ByteBudgetCache, TTLCache
+
+# 上傳時每次讀取的大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 接受的原始圖片格式與儲存時使用的副檔名（依 Pillow 判斷的格式決定，不使用客戶端提供的檔名）
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif", "BMP": ".bmp"}
+ALLOWED_FORMATS = set(FORMAT_EXTENSIONS)
+
+# 驗證完成之前的上傳檔案使用的副檔名
+UPLOAD_EXTENSION = ".upload"
+
+# 縮圖優先使用 WebP，Pillow 不支援時改用 JPEG
+VARIANT_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+VARIANT_EXTENSION = ".webp" if VARIANT_FORMAT == "WEBP" else ".jpg"
+VARIANT_QUALITY = 80
+mimetypes.add_type("image/webp", ".webp")  # 舊版 Python 的 mimetypes 沒有 webp
+
+# 上傳產生的檔名（uuid hex，縮圖再加上 _尺寸），同一個檔名的內容永遠不會改變
+_GENERATED_NAME_PATTERN = re.compile(r"^[0-9a-f]{32}(_[0-9]+)?\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# content 為 None 表示檔案太大沒有放進記憶體，直接從 path 讀取
+AvatarFile = namedtuple("AvatarFile", ["path", "content", "etag", "media_type", "cache_control"])
+
+_avatar_cache = ByteBudgetCache(AVATAR_CACHE_MAX_BYTES, AVATAR_CACHE_MAX_ITEM_BYTES)
+# 不存在的檔名（例如預設圖片的縮圖）也短暫記住，避免每次都查詢檔案系統
+_missing_avatars = TTLCache(maxsize=4096, ttl_seconds=60)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    縮圖在獨立的 process pool 中產生，解碼與縮放不會佔用 API 的執行緒與 GIL。
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=AVATAR_WORKERS)
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+def variant_name(photo_url: str, size: int) -> str:
+    return f"{Path(photo_url).stem}_{size}{VARIANT_EXTENSION}"
+
+
+def pick_variant_size(requested: int) -> int:
+    """
+    選出大於等於 requested 的最小縮圖尺寸，都不夠大時使用最大的尺寸。
+    """
+    for size in sorted(AVATAR_SIZES):
+        if size >= requested:
+            return size
+    return max(AVATAR_SIZES)
+
+
+def save_upload(source, image_dir: Path, max_bytes: int = AVATAR_MAX_UPLOAD_BYTES) -> Path:
+    """
+    分段將上傳內容寫入 image_dir 下的新檔案（副檔名為 UPLOAD_EXTENSION，由 build_variants 改成實際格式），
+    超過 max_bytes 時刪除檔案並拋出 ValueError。
+    """
+    path = image_dir / f"{uuid.uuid4().hex}{UPLOAD_EXTENSION}"
+    written = 0
+    try:
+        with path.open("wb") as buffer:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ValueError(f"Image is larger than {max_bytes} bytes")
+                buffer.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
+
+
+def build_variants(path: str, sizes=AVATAR_SIZES) -> tuple:
+    """
+    驗證圖片並產生置中裁切的正方形縮圖，最後將原圖改名為實際格式的副檔名。
+    回傳 (原圖檔名, [縮圖檔名])；圖片無效時拋出 ValueError，原圖維持原本的檔名。
+    在 process pool 中執行，所以參數與回傳值都是可 pickle 的基本型別。
+    """
+    path = Path(path)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with Image.open(path) as image:
+            if image.format not in ALLOWED_FORMATS:
+                raise ValueError(f"Unsupported image format: {image.format}")
+            original = path.with_name(f"{path.stem}{FORMAT_EXTENSIONS[image.format]}")
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if VARIANT_FORMAT == "WEBP" and image.mode in ("RGBA", "LA", "P") else "RGB")
+            filenames = []
+            for size in sorted(sizes, reverse=True):
+                variant = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                filename = variant_name(path.name, size)
+                tmp_path = path.with_name(f".{filename}.tmp")
+                variant.save(tmp_path, VARIANT_FORMAT, quality=VARIANT_QUALITY)
+                os.replace(tmp_path, path.with_name(filename))
+                filenames.append(filename)
+        os.replace(path, original)
+        return original.name, filenames
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ValueError(f"Invalid image: {e}")
+
+
+def avatar_names(photo_url: str) -> list:
+    return [photo_url] + [variant_name(photo_url, size) for size in AVATAR_SIZES]
+
+
+def remove_avatar(image_dir: Path, photo_url: str):
+    """
+    刪除原始圖片與所有縮圖。
+    """
+    for name in avatar_names(photo_url):
+        (image_dir / Path(name).name).unlink(missing_ok=True)
+    forget_avatar(photo_url)
+
+
+def forget_avatar(photo_url: str):
+    # 清除本 worker 記憶體中的快取（包含「不存在」的紀錄）
+    for name in avatar_names(photo_url):
+        _avatar_cache.pop(name)
+        _missing_avatars.pop(name)
+
+
+def is_immutable_name(filename: str) -> bool:
+    return bool(_GENERATED_NAME_PATTERN.match(filename))
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match 使用弱比較：忽略 W/ 前綴，"*" 符合任何 ETag。
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def find_avatar(image_dir: Path, filename: str):
+    """
+    取得圖片檔案的資訊與內容，找不到時回傳 None。
+    小於 AVATAR_CACHE_MAX_ITEM_BYTES 的圖片會留在記憶體中，之後的請求不需要讀取檔案系統。
+    """
+    entry = _avatar_cache.get(filename)
+    if entry is not None:
+        return entry
+    if filename in _missing_avatars:
+        return None
+
+    path = image_dir / filename
+    try:
+        st = path.stat()
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        _missing_avatars.set(filename, True)
+        return None
+
+    if is_immutable_name(filename):
+        # 檔名本身就能代表內容
+        etag = f'"{filename}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        # 預設圖片等固定檔名，以修改時間與大小產生 ETag，客戶端每次都要重新驗證
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        cache_control = REVALIDATE_CACHE_CONTROL
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    content = path.read_bytes() if st.st_size <= _avatar_cache.max_item_bytes else None
+    entry = AvatarFile(path, content, etag, media_type, cache_control)
+    if content is not None:
+        _avatar_cache.set(filename, entry, len(content))
+    return entry
+
@@ -35,4 +35,27 @@ def time_to_minutes(t: time) -> int:
     將 Python 的 time(hour, minute, second) 轉成「總分鐘數」。
     """
     return t.hour * 60 + t.minute
+
+# 每個部位代表「正確姿勢」的欄位
+BODY_PART_CORRECT_FIELDS = {
+    "Torso": "NeutralCount",
+    "Feet": "FlatCount",
+    "Head": "NeutralCount",
+    "Shoulder": "NeutralCount",
+    "Neck": "NeutralCount",
+}
+def calculate_partial_score(correct_count: int, total_predictions: int) -> float:
+    return correct_count / total_predictions if total_predictions > 0 else 0.0
+
+def calculate_detection_scores(detection_data) -> dict:
+    """
+    計算單次偵測每個部位的 PartialScore 與整體 Score。
+    回傳值範例：{"Torso": 0.6, ..., "Score": 0.7}
+    """
+    scores = {
+        part: calculate_partial_score(getattr(getattr(detection_data, part), field), detection_data.TotalPredictions)
+        for part, field in BODY_PART_CORRECT_FIELDS.items()
+    }
+    scores["Score"] = sum(scores.values()) / len(BODY_PART_CORRECT_FIELDS)
+    return scores
 # enregion
\ No newline at end of file
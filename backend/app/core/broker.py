@@ -0,0 +1,157 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Redis 只傳 bytes，所以在訊息前加一個位元組標記原本是文字還是二進位
+_TEXT_TAG = b"t"
+_BYTES_TAG = b"b"
+
+
+class Broker:
+    """
+    Pub/sub 介面：handler 為 async callable，收到訊息（str 或 bytes）時被呼叫。
+    同一個 channel 可以有多個 handler。
+    """
+
+    async def publish(self, channel: str, message):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, handler):
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str, handler):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+async def _dispatch(channel: str, handlers, message):
+    for handler in list(handlers):
+        try:
+            await handler(message)
+        except Exception:
+            logger.exception("Broker handler failed on channel %s", channel)
+
+
+class InMemoryBroker(Broker):
+    """
+    單一行程內的 broker，只有一個 worker 時使用。
+    """
+
+    def __init__(self):
+        self._handlers = {}  # {channel: set(handler)}
+
+    async def publish(self, channel: str, message):
+        handlers = self._handlers.get(channel)
+        if handlers:
+            await _dispatch(channel, handlers, message)
+
+    async def subscribe(self, channel: str, handler):
+        self._handlers.setdefault(channel, set()).add(handler)
+
+    async def unsubscribe(self, channel: str, handler):
+        handlers = self._handlers.get(channel)
+        if handlers is None:
+            return
+        handlers.discard(handler)
+        if not handlers:
+            del self._handlers[channel]
+
+
+class RedisBroker(Broker):
+    """
+    透過 Redis pub/sub 在多個 worker / container 之間轉發訊息。
+    每個 worker 只用一條 pubsub 連線，本機有 handler 的 channel 才會訂閱。
+    """
+
+    def __init__(self, url: str = None, client=None, poll_timeout: float = 1.0):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError("RedisBroker 需要安裝 redis 套件（pip install redis）") from e
+            client = redis.from_url(url)
+        self._redis = client
+        self._pubsub = client.pubsub()
+        self._handlers = {}  # {channel: set(handler)}
+        self._reader = None
+        self.poll_timeout = poll_timeout
+
+    async def publish(self, channel: str, message):
+        if isinstance(message, str):
+            data = _TEXT_TAG + message.encode()
+        else:
+            data = _BYTES_TAG + bytes(message)
+        await self._redis.publish(channel, data)
+
+    async def subscribe(self, channel: str, handler):
+        handlers = self._handlers.get(channel)
+        if handlers is None:
+            handlers = self._handlers[channel] = set()
+            handlers.add(handler)
+            await self._pubsub.subscribe(channel)
+        else:
+            handlers.add(handler)
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read_loop())
+
+    async def unsubscribe(self, channel: str, handler):
+        handlers = self._handlers.get(channel)
+        if handlers is None:
+            return
+        handlers.discard(handler)
+        if not handlers:
+            del self._handlers[channel]
+            await self._pubsub.unsubscribe(channel)
+
+    async def _read_loop(self):
+        while True:
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(self.poll_timeout)
+                continue
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=self.poll_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Redis pubsub read failed: %s", e)
+                await asyncio.sleep(self.poll_timeout)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            handlers = self._handlers.get(channel)
+            if not handlers:
+                continue
+            data = message["data"]
+            if data[:1] == _TEXT_TAG:
+                payload = data[1:].decode()
+            else:
+                payload = data[1:]
+            await _dispatch(channel, handlers, payload)
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        await self._pubsub.aclose()
+        await self._redis.aclose()
+
+
+def create_broker(url: str = None) -> Broker:
+    """
+    依 WS_BROKER_URL 建立 broker：未設定或 memory:// 為行程內，redis:// / rediss:// 使用 Redis。
+    """
+    if not url or url.startswith("memory://"):
+        return InMemoryBroker()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported broker URL: {url}")
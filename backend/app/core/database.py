@@ -1,3 +1,202 @@
+import threading
+import time
 from sqlalchemy import create_engine
-from app.config import DATABASE_URL
-engine = create_engine(DATABASE_URL)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from app.config import (
+    DATABASE_URL, DATABASE_REPLICA_URL, DB_ASYNC,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+)
+
+# 同步 driver 對應的 async driver
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    """
+    將同步的連線字串轉成 async driver，例如 mysql+pymysql:// -> mysql+aiomysql://
+    """
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS[parsed.get_backend_name()]).render_as_string(hide_password=False)
+
+
+class PoolStats:
+    """
+    連線池的取用統計：等待時間、因池滿而需要等待的次數、逾時次數。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.saturated_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, wait_seconds: float, saturated: bool, timed_out: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            if wait_seconds > self.wait_seconds_max:
+                self.wait_seconds_max = wait_seconds
+            if saturated:
+                self.saturated_checkouts += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "saturated_checkouts": self.saturated_checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+def _instrumented_pool_class(base, stats: PoolStats):
+    """
+    產生會記錄取用等待時間的 pool 類別；dispose / recreate 時 SQLAlchemy 會沿用同一個類別。
+    """
+    class InstrumentedPool(base):
+        def _do_get(self):
+            saturated = self._max_overflow >= 0 and self.checkedout() >= self.size() + self._max_overflow
+            start = time.perf_counter()
+            timed_out = False
+            try:
+                return super()._do_get()
+            except PoolTimeoutError:
+                timed_out = True
+                raise
+            finally:
+                stats.record(time.perf_counter() - start, saturated, timed_out)
+
+    return InstrumentedPool
+
+
+class EngineRegistry:
+    """
+    統一建立與管理資料庫 engine。
+    role 為 "primary"（寫入）或 "replica"（唯讀查詢）；未設定 replica 時兩者共用 primary。
+    """
+
+    def __init__(
+        self,
+        primary_url: str,
+        replica_url: str = None,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = False,
+    ):
+        self.urls = {"primary": primary_url, "replica": replica_url or primary_url}
+        self.pool_options = {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": pool_timeout,
+        }
+        self.engine_options = {
+            "pool_recycle": pool_recycle,
+            "pool_pre_ping": pool_pre_ping,
+        }
+        self.stats = {}
+        self._engines = {}
+        self._async_engines = {}
+        self._lock = threading.Lock()
+
+    def _role(self, role: str) -> str:
+        if role not in self.urls:
+            raise ValueError(f"Unknown database role: {role}")
+        # 沒有獨立的 replica 時直接使用 primary 的 engine
+        if role == "replica" and self.urls["replica"] == self.urls["primary"]:
+            return "primary"
+        return role
+
+    def _options(self, url: str, name: str, pool_base) -> dict:
+        options = dict(self.engine_options)
+        parsed = make_url(url)
+        # SQLite in-memory 資料庫使用單一連線，不套用連線池設定
+        if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+            return options
+        stats = self.stats.setdefault(name, PoolStats())
+        options.update(self.pool_options)
+        options["poolclass"] = _instrumented_pool_class(pool_base, stats)
+        return options
+
+    def get_engine(self, role: str = "primary"):
+        role = self._role(role)
+        engine = self._engines.get(role)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(role)
+                if engine is None:
+                    url = self.urls[role]
+                    engine = create_engine(url, **self._options(url, role, QueuePool))
+                    self._engines[role] = engine
+        return engine
+
+    def get_async_engine(self, role: str = "primary"):
+        role = self._role(role)
+        engine = self._async_engines.get(role)
+        if engine is None:
+            with self._lock:
+                engine = self._async_engines.get(role)
+                if engine is None:
+                    url = to_async_url(self.urls[role])
+                    engine = create_async_engine(url, **self._options(url, f"{role}_async", AsyncAdaptedQueuePool))
+                    self._async_engines[role] = engine
+        return engine
+
+    def pool_status(self) -> dict:
+        """
+        每個已建立的 engine 目前的連線池狀態與累計統計。
+        """
+        status = {}
+        engines = [(role, engine) for role, engine in self._engines.items()]
+        engines += [(f"{role}_async", engine.sync_engine) for role, engine in self._async_engines.items()]
+        for name, engine in engines:
+            pool = engine.pool
+            info = {}
+            if isinstance(pool, QueuePool):
+                capacity = pool.size() + max(pool._max_overflow, 0)
+                info.update({
+                    "size": pool.size(),
+                    "checked_out": pool.checkedout(),
+                    "overflow": pool.overflow(),
+                    "capacity": capacity,
+                    "saturation": pool.checkedout() / capacity if capacity else 0.0,
+                })
+            if name in self.stats:
+                info.update(self.stats[name].as_dict())
+            status[name] = info
+        return status
+
+    def dispose(self):
+        for engine in self._engines.values():
+            engine.dispose()
+
+    async def dispose_async(self):
+        for engine in self._async_engines.values():
+            await engine.dispose()
+
+
+registry = EngineRegistry(
+    DATABASE_URL,
+    DATABASE_REPLICA_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+engine = registry.get_engine("primary")
+read_engine = registry.get_engine("replica")
+async_engine = registry.get_async_engine("primary") if DB_ASYNC else None
+async_read_engine = registry.get_async_engine("replica") if DB_ASYNC else None
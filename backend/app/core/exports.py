@@ -0,0 +1,130 @@
+import csv
+import io
+from datetime import date, datetime, time
+from fastapi import HTTPException, status
+from app.core.serializers import dumps
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow 為選用套件，只有 parquet 匯出需要
+    pyarrow = None
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# 下面的函式都接收 partitions：一批一批的查詢結果 row（例如 Result.partitions()），每處理完一批就產生一段輸出，
+# 記憶體用量只與每批的筆數有關。
+
+
+def require_parquet():
+    if pyarrow is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="伺服器未安裝 pyarrow，無法匯出 parquet",
+        )
+
+
+def column_names(columns, model) -> list:
+    """
+    攤平後的欄位名稱：model 的欄位直接使用名稱，其他表（部位）的欄位加上表名前綴，例如 Head.BowedCount。
+    """
+    return [
+        column.key if column.class_ is model else f"{column.class_.__name__}.{column.key}"
+        for column in columns
+    ]
+
+
+def ndjson_chunks(partitions, serialize_row):
+    for rows in partitions:
+        yield b"".join([dumps(serialize_row(row)) + b"\n" for row in rows])
+
+
+def csv_chunks(partitions, columns, names: list):
+    # 與 JSON 輸出相同，日期時間使用 ISO 8601；只轉換日期時間欄位，其他值直接交給 csv
+    temporal = [index for index, column in enumerate(columns) if column.type.python_type in (datetime, date, time)]
+
+    def to_csv_row(row):
+        row = list(row)
+        for index in temporal:
+            if row[index] is not None:
+                row[index] = row[index].isoformat()
+        return row
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in partitions:
+        writer.writerows([to_csv_row(row) for row in rows])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # 沒有任何資料時仍然輸出標題列
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    ParquetWriter 的輸出目標：寫入的資料暫存在記憶體，每寫完一個 row group 就由 drain() 取出送給客戶端。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_type(column):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return pyarrow.timestamp("us")
+    if python_type is time:
+        return pyarrow.time64("us")
+    if python_type is date:
+        return pyarrow.date32()
+    if python_type is bool:
+        return pyarrow.bool_()
+    if python_type is int:
+        return pyarrow.int64()
+    if python_type is float:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def parquet_chunks(partitions, columns, names: list):
+    """
+    每一批資料寫成一個 row group；檔尾（metadata）在最後才寫入，所以客戶端需要收完整個檔案才能讀取。
+    """
+    require_parquet()
+    schema = pyarrow.schema([(name, _arrow_type(column)) for name, column in zip(names, columns)])
+    sink = _ChunkSink()
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        for rows in partitions:
+            values = list(zip(*rows))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(values, schema)],
+                schema=schema,
+            ))
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,364 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from sqlalchemy.orm import Session
+from app.config import RANK_INDEX_REFRESH_SECONDS, USERNAME_INDEX_REFRESH_SECONDS, FRIEND_GRAPH_REFRESH_SECONDS
+from app.models import User, FriendList
+
+_INF = float("inf")
+_EMPTY = frozenset()
+
+
+class InMemoryIndex:
+    """
+    行程內索引的共用基底：第一次使用時從資料庫載入，之後隨寫入同步更新。
+    每個 worker 各有一份，所以每隔 refresh_seconds 會重新載入，以追上其他 worker 的寫入（0 表示不重新載入）。
+    """
+
+    def __init__(self, refresh_seconds: int = 0):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._loading = None  # 正在載入時為 threading.Event，同一時間只有一個執行緒查詢資料庫
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def ensure_loaded(self, db: Session):
+        """
+        查詢資料庫在鎖外進行，_load 只在交換建好的資料結構時持有鎖，重新載入期間讀取不會被擋住。
+        已經有其他執行緒在載入時：已有（過期的）資料就直接使用，第一次載入則等待完成。
+        """
+        if self._is_fresh():
+            return
+        with self._lock:
+            if self._is_fresh():
+                return
+            loading = self._loading
+            if loading is None:
+                loading = self._loading = threading.Event()
+                owner = True
+            elif self.loaded:
+                return
+            else:
+                owner = False
+
+        if not owner:
+            loading.wait()
+            # 載入失敗時由這個執行緒重試
+            if not self.loaded:
+                self.ensure_loaded(db)
+            return
+
+        try:
+            self._load(db)
+        finally:
+            with self._lock:
+                self._loading = None
+            loading.set()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return self.refresh_seconds <= 0 or time.monotonic() - self._loaded_at < self.refresh_seconds
+
+    def _load(self, db: Session):
+        raise NotImplementedError
+
+
+class ScoreRankIndex(InMemoryIndex):
+    """
+    依 AllTimeScore 排序的索引（sorted list + bisect），用於 PR 值與全站排行榜。
+    查詢為 O(log n)；更新一位使用者的分數只需移除舊值再插入新值。
+    """
+
+    def __init__(self, refresh_seconds: int = 0):
+        super().__init__(refresh_seconds)
+        self._scores = {}   # {UserID: score}
+        self._sorted = []   # [(score, UserID)]，由低到高
+
+    def _load(self, db: Session):
+        self.load_scores(db.query(User.UserID, User.AllTimeScore).all())
+
+    def load_scores(self, rows):
+        """
+        rows: [(UserID, AllTimeScore), ...]
+        """
+        scores = {user_id: score or 0.0 for user_id, score in rows}
+        with self._lock:
+            self._scores = scores
+            self._sorted = sorted((score, user_id) for user_id, score in scores.items())
+            self._loaded_at = time.monotonic()
+
+    def update(self, user_id: int, score: float):
+        # 尚未載入時不需要更新，之後載入時會讀到最新的分數
+        if not self.loaded:
+            return
+        score = score or 0.0
+        with self._lock:
+            self._discard(user_id)
+            self._scores[user_id] = score
+            insort(self._sorted, (score, user_id))
+
+    def remove(self, user_id: int):
+        with self._lock:
+            self._discard(user_id)
+
+    def _discard(self, user_id: int):
+        old_score = self._scores.pop(user_id, None)
+        if old_score is None:
+            return
+        idx = bisect_left(self._sorted, (old_score, user_id))
+        if idx < len(self._sorted) and self._sorted[idx] == (old_score, user_id):
+            del self._sorted[idx]
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def count_lte(self, score: float) -> int:
+        return bisect_right(self._sorted, (score, _INF))
+
+    def percentile_rank(self, score: float) -> float:
+        """
+        分數小於等於 score 的使用者比例 (0 ~ 100)。
+        """
+        with self._lock:
+            total = len(self._sorted)
+            if not total:
+                return 0.0
+            return self.count_lte(score or 0.0) / total * 100
+
+    def rank_of(self, user_id: int):
+        """
+        使用者在全站排行榜（分數由高到低）的名次，從 1 開始；不在索引中回傳 None。
+        """
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            idx = bisect_left(self._sorted, (score, user_id))
+            return len(self._sorted) - idx
+
+    def page(self, offset: int, limit: int):
+        """
+        依分數由高到低取出 [(Rank, UserID, score), ...]。
+        """
+        with self._lock:
+            total = len(self._sorted)
+            start = max(total - offset - limit, 0)
+            end = max(total - offset, 0)
+            entries = self._sorted[start:end]
+        return [
+            (offset + idx, user_id, score)
+            for idx, (score, user_id) in enumerate(reversed(entries), start=1)
+        ]
+
+    def around(self, user_id: int, radius: int):
+        """
+        取出使用者前後各 radius 名的排行資料。
+        """
+        rank = self.rank_of(user_id)
+        if rank is None:
+            return []
+        offset = max(rank - 1 - radius, 0)
+        return self.page(offset, rank - offset + radius)
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class UsernameIndex(InMemoryIndex):
+    """
+    使用者名稱的搜尋索引（不分大小寫）：
+      - 排序好的名稱清單，用 bisect 找前綴相符的名稱
+      - trigram 反向索引，取交集後再確認是否包含查詢字串
+    結果依「完全相同、前綴相符、包含」排序，同一類中名稱較短的在前。
+    """
+
+    def __init__(self, refresh_seconds: int = 0):
+        super().__init__(refresh_seconds)
+        self._names = {}     # {UserID: 小寫名稱}
+        self._sorted = []    # [(小寫名稱, UserID)]
+        self._postings = {}  # {trigram: {UserID, ...}}
+
+    def _load(self, db: Session):
+        self.load_names(db.query(User.UserID, User.UserName).all())
+
+    def load_names(self, rows):
+        """
+        rows: [(UserID, UserName), ...]
+        """
+        names = {user_id: name.lower() for user_id, name in rows if name}
+        postings = {}
+        for user_id, name in names.items():
+            for gram in trigrams(name):
+                postings.setdefault(gram, set()).add(user_id)
+        with self._lock:
+            self._names = names
+            self._sorted = sorted((name, user_id) for user_id, name in names.items())
+            self._postings = postings
+            self._loaded_at = time.monotonic()
+
+    def add(self, user_id: int, name: str):
+        """
+        新增使用者或更新名稱。
+        """
+        if not self.loaded or not name:
+            return
+        name = name.lower()
+        with self._lock:
+            if self._names.get(user_id) == name:
+                return
+            self._discard(user_id)
+            self._names[user_id] = name
+            insort(self._sorted, (name, user_id))
+            for gram in trigrams(name):
+                self._postings.setdefault(gram, set()).add(user_id)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            self._discard(user_id)
+
+    def _discard(self, user_id: int):
+        old_name = self._names.pop(user_id, None)
+        if old_name is None:
+            return
+        idx = bisect_left(self._sorted, (old_name, user_id))
+        if idx < len(self._sorted) and self._sorted[idx] == (old_name, user_id):
+            del self._sorted[idx]
+        for gram in trigrams(old_name):
+            users = self._postings.get(gram)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._postings[gram]
+
+    def __len__(self):
+        return len(self._names)
+
+    def search(self, q: str, limit: int, max_candidates: int = 1000):
+        """
+        回傳最多 limit 個 UserID。
+        少於 3 個字的查詢只做前綴搜尋；前綴與包含的候選各自最多檢查 max_candidates 筆。
+        """
+        q = q.lower()
+        if not q or limit <= 0:
+            return []
+        with self._lock:
+            # 前綴相符：在排序清單中是連續的一段
+            start = bisect_left(self._sorted, (q, -1))
+            prefix = []
+            for name, user_id in self._sorted[start:start + max_candidates]:
+                if not name.startswith(q):
+                    break
+                prefix.append((name != q, len(name), name, user_id))
+
+            contains = []
+            grams = trigrams(q)
+            if grams:
+                postings = sorted((self._postings.get(gram, _EMPTY) for gram in grams), key=len)
+                candidates = set(postings[0])
+                for users in postings[1:]:
+                    candidates &= users
+                    if not candidates:
+                        break
+                prefix_ids = {entry[3] for entry in prefix}
+                for user_id in candidates:
+                    if user_id in prefix_ids:
+                        continue
+                    name = self._names[user_id]
+                    if q in name:
+                        contains.append((len(name), name, user_id))
+                    if len(contains) >= max_candidates:
+                        break
+
+        prefix.sort()
+        contains.sort()
+        ranked = [entry[3] for entry in prefix] + [entry[2] for entry in contains]
+        return ranked[:limit]
+
+
+class FriendGraph(InMemoryIndex):
+    """
+    好友關係的鄰接表 {UserID: {好友 UserID, ...}}。
+    好友判斷、共同好友與朋友的朋友都用集合運算完成，不需要查詢資料庫。
+    """
+
+    def __init__(self, refresh_seconds: int = 0):
+        super().__init__(refresh_seconds)
+        self._adjacency = {}
+
+    def _load(self, db: Session):
+        self.load_edges(db.query(FriendList.UserID1, FriendList.UserID2).all())
+
+    def load_edges(self, rows):
+        """
+        rows: [(UserID1, UserID2), ...]；FriendList 每組好友有兩筆，單向的資料也視為好友。
+        """
+        adjacency = {}
+        for user_id1, user_id2 in rows:
+            adjacency.setdefault(user_id1, set()).add(user_id2)
+            adjacency.setdefault(user_id2, set()).add(user_id1)
+        with self._lock:
+            self._adjacency = adjacency
+            self._loaded_at = time.monotonic()
+
+    def add_friendship(self, user_id1: int, user_id2: int):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._adjacency.setdefault(user_id1, set()).add(user_id2)
+            self._adjacency.setdefault(user_id2, set()).add(user_id1)
+
+    def remove_friendship(self, user_id1: int, user_id2: int):
+        with self._lock:
+            self._adjacency.get(user_id1, set()).discard(user_id2)
+            self._adjacency.get(user_id2, set()).discard(user_id1)
+
+    def friends_of(self, user_id: int) -> frozenset:
+        with self._lock:
+            return frozenset(self._adjacency.get(user_id, _EMPTY))
+
+    def is_friend(self, user_id1: int, user_id2: int) -> bool:
+        with self._lock:
+            return user_id2 in self._adjacency.get(user_id1, _EMPTY)
+
+    def mutual_friends(self, user_id1: int, user_id2: int) -> frozenset:
+        with self._lock:
+            return frozenset(self._adjacency.get(user_id1, _EMPTY) & self._adjacency.get(user_id2, _EMPTY))
+
+    def mutual_counts(self, user_id: int, other_ids) -> dict:
+        """
+        {other_id: 與 user_id 的共同好友數}
+        """
+        with self._lock:
+            friends = self._adjacency.get(user_id, _EMPTY)
+            return {other_id: len(friends & self._adjacency.get(other_id, _EMPTY)) for other_id in other_ids}
+
+    def suggestions(self, user_id: int, limit: int):
+        """
+        朋友的朋友（排除自己與已是好友的人），依共同好友數由多到少排序，回傳 [(UserID, 共同好友數), ...]。
+        """
+        with self._lock:
+            # 複製一份，釋放 lock 之後其他執行緒新增 / 移除好友不會影響下面的迭代
+            friends = frozenset(self._adjacency.get(user_id, _EMPTY))
+            counts = Counter()
+            for friend_id in friends:
+                counts.update(self._adjacency.get(friend_id, _EMPTY))
+        counts.pop(user_id, None)
+        for friend_id in friends:
+            counts.pop(friend_id, None)
+        return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+score_rank_index = ScoreRankIndex(RANK_INDEX_REFRESH_SECONDS)
+username_index = UsernameIndex(USERNAME_INDEX_REFRESH_SECONDS)
+friend_graph = FriendGraph(FRIEND_GRAPH_REFRESH_SECONDS)
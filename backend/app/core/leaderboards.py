@@ -0,0 +1,90 @@
+import threading
+import time
+from app.config import FRIEND_LEADERBOARD_CACHE_SIZE, FRIEND_LEADERBOARD_CACHE_TTL_SECONDS
+from app.core.cache import TTLCache
+
+
+class FriendLeaderboardCache:
+    """
+    每位使用者、每種 sortBy 排好名次的好友排行榜。
+    另外記錄「哪些排行榜包含這位使用者」，只有好友名單或成員的資料改變時才清除對應的排行榜。
+    每個 worker 各有一份，ttl_seconds 用來追上其他 worker 的寫入。
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._entries = TTLCache(maxsize, ttl_seconds)  # {(owner_id, sortBy): ranked rows}
+        self._owners_by_member = {}  # {member_id: {owner_id, ...}}
+        self._members_by_owner = {}  # {owner_id: {member_id, ...}}
+        self._invalidated_at = {}    # {user_id: monotonic time}
+        self._lock = threading.Lock()
+
+    def get(self, owner_id: int, sort_by: str):
+        return self._entries.get((owner_id, sort_by))
+
+    def set(self, owner_id: int, sort_by: str, rows, member_ids, loaded_at: float):
+        """
+        loaded_at 為開始查詢資料庫的時間；查詢期間有成員被清除過，表示結果可能已經過期，不寫入快取。
+        """
+        with self._lock:
+            if any(self._invalidated_at.get(member_id, 0) >= loaded_at for member_id in member_ids):
+                return
+            for member_id in self._members_by_owner.get(owner_id, ()):
+                owners = self._owners_by_member.get(member_id)
+                if owners is not None:
+                    owners.discard(owner_id)
+                    if not owners:
+                        del self._owners_by_member[member_id]
+            members = set(member_ids)
+            self._members_by_owner[owner_id] = members
+            for member_id in members:
+                self._owners_by_member.setdefault(member_id, set()).add(owner_id)
+            self._entries.set((owner_id, sort_by), rows)
+
+    def invalidate_owner(self, owner_id: int, sort_bys):
+        """
+        好友名單改變時清除這位使用者的排行榜。
+        """
+        with self._lock:
+            self._invalidated_at[owner_id] = time.monotonic()
+            self._drop_owner(owner_id, sort_bys)
+
+    def invalidate_member(self, member_id: int, sort_bys):
+        """
+        使用者的分數、偵測時間、名稱或大頭貼改變時，清除所有包含他的排行榜。
+        """
+        with self._lock:
+            self._invalidated_at[member_id] = time.monotonic()
+            for owner_id in list(self._owners_by_member.pop(member_id, ())):
+                self._drop_owner(owner_id, sort_bys)
+
+    def _drop_owner(self, owner_id: int, sort_bys):
+        for sort_by in sort_bys:
+            self._entries.pop((owner_id, sort_by))
+        for member_id in self._members_by_owner.pop(owner_id, ()):
+            owners = self._owners_by_member.get(member_id)
+            if owners is not None:
+                owners.discard(owner_id)
+                if not owners:
+                    del self._owners_by_member[member_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._owners_by_member.clear()
+            self._members_by_owner.clear()
+            self._invalidated_at.clear()
+
+
+# 好友排行榜支援的排序方式，對應到 SQL 的排序欄位由 app.api.friends 決定
+LEADERBOARD_SORTS = ("level", "score")
+
+friend_leaderboard_cache = FriendLeaderboardCache(FRIEND_LEADERBOARD_CACHE_SIZE, FRIEND_LEADERBOARD_CACHE_TTL_SECONDS)
+
+
+def invalidate_friendships(*user_ids: int):
+    for user_id in user_ids:
+        friend_leaderboard_cache.invalidate_owner(user_id, LEADERBOARD_SORTS)
+
+
+def invalidate_leaderboard_member(user_id: int):
+    friend_leaderboard_cache.invalidate_member(user_id, LEADERBOARD_SORTS)
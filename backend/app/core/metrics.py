@@ -0,0 +1,193 @@
+from bisect import bisect_left
+from time import perf_counter
+
+# 延遲直方圖的上界（秒），最後一格為 +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 沒有對應到任何路由（404）的請求統一使用這個標籤，避免任意路徑造成無限多個時間序列
+UNMATCHED_ROUTE = "<unmatched>"
+
+WS_ROLES = ("phone", "viewer")
+WS_MESSAGE_KINDS = ("text", "binary")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RouteSeries:
+    """
+    一組 (method, route, status) 的延遲直方圖與位元組計數；buckets 在建立時就配置好。
+    """
+    __slots__ = ("buckets", "count", "sum", "request_bytes", "response_bytes")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def observe(self, seconds: float, request_bytes: int, response_bytes: int):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """
+    HTTP 與 WebSocket 的行程內指標，以 Prometheus text format 輸出。
+    所有更新與輸出都在 event loop 執行緒上進行（middleware、websocket_endpoint 與 async 的 /metrics），不需要加鎖。
+    每個 worker 各有一份，由 Prometheus 分別抓取。
+    """
+
+    def __init__(self):
+        self._series = {}  # {route: {method: {status: RouteSeries}}}
+        self.in_flight = 0
+        self.ws_active = {role: 0 for role in WS_ROLES + ("other",)}
+        self.ws_connections = {role: 0 for role in WS_ROLES + ("other",)}
+        self.ws_messages = {(role, kind): 0 for role in WS_ROLES + ("other",) for kind in WS_MESSAGE_KINDS}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, request_bytes: int, response_bytes: int):
+        by_method = self._series.get(route)
+        if by_method is None:
+            by_method = self._series[route] = {}
+        by_status = by_method.get(method)
+        if by_status is None:
+            by_status = by_method[method] = {}
+        series = by_status.get(status)
+        if series is None:
+            series = by_status[status] = RouteSeries()
+        series.observe(seconds, request_bytes, response_bytes)
+
+    def series(self, method: str, route: str, status: int):
+        return self._series.get(route, {}).get(method, {}).get(status)
+
+    @staticmethod
+    def _ws_role(role: str) -> str:
+        return role if role in WS_ROLES else "other"
+
+    def ws_connected(self, role: str):
+        role = self._ws_role(role)
+        self.ws_active[role] += 1
+        self.ws_connections[role] += 1
+
+    def ws_disconnected(self, role: str):
+        self.ws_active[self._ws_role(role)] -= 1
+
+    def ws_message(self, role: str, kind: str):
+        self.ws_messages[(self._ws_role(role), kind)] += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_request_duration_seconds HTTP request latency by route template.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        byte_lines = {"request": [], "response": []}
+        for route, by_method in sorted(self._series.items()):
+            for method, by_status in sorted(by_method.items()):
+                for status, series in sorted(by_status.items()):
+                    labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS, series.buckets):
+                        cumulative += count
+                        lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series.count}')
+                    lines.append(f"http_request_duration_seconds_sum{{{labels}}} {series.sum!r}")
+                    lines.append(f"http_request_duration_seconds_count{{{labels}}} {series.count}")
+                    byte_lines["request"].append(f"http_request_bytes_total{{{labels}}} {series.request_bytes}")
+                    byte_lines["response"].append(f"http_response_bytes_total{{{labels}}} {series.response_bytes}")
+        lines += [
+            "# HELP http_request_bytes_total Request body bytes received.",
+            "# TYPE http_request_bytes_total counter",
+            *byte_lines["request"],
+            "# HELP http_response_bytes_total Response body bytes sent.",
+            "# TYPE http_response_bytes_total counter",
+            *byte_lines["response"],
+            "# HELP http_requests_in_flight HTTP requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP websocket_connections_active Open WebSocket connections by role.",
+            "# TYPE websocket_connections_active gauge",
+            *(f'websocket_connections_active{{role="{role}"}} {count}' for role, count in self.ws_active.items()),
+            "# HELP websocket_connections_total WebSocket connections accepted by role.",
+            "# TYPE websocket_connections_total counter",
+            *(f'websocket_connections_total{{role="{role}"}} {count}' for role, count in self.ws_connections.items()),
+            "# HELP websocket_messages_received_total WebSocket messages received by role and frame type.",
+            "# TYPE websocket_messages_received_total counter",
+            *(
+                f'websocket_messages_received_total{{role="{role}",kind="{kind}"}} {count}'
+                for (role, kind), count in self.ws_messages.items()
+            ),
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class RequestRecorder:
+    """
+    一個 HTTP 請求的狀態碼與收送位元組數；receive / send 包住下游的 ASGI callable。
+    每個請求只建立這一個物件，不需要 closure 與額外的 list。
+    """
+    __slots__ = ("_receive", "_send", "status", "request_bytes", "response_bytes")
+
+    def __init__(self, receive, send):
+        self._receive = receive
+        self._send = send
+        # 沒有送出回應就發生例外時記為 500
+        self.status = 500
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    async def receive(self):
+        message = await self._receive()
+        if message["type"] == "http.request":
+            self.request_bytes += len(message.get("body", b""))
+        return message
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        elif message["type"] == "http.response.body":
+            self.response_bytes += len(message.get("body", b""))
+        await self._send(message)
+
+
+class MetricsMiddleware:
+    """
+    純 ASGI middleware：記錄每個 HTTP 請求的延遲、狀態碼與收送的位元組數。
+    路由以樣板（例如 /detections/{detection_id}）為標籤，在路由比對後從 scope["route"] 取得。
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = None):
+        self.app = app
+        self.registry = registry if registry is not None else metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        registry.in_flight += 1
+        started = perf_counter()
+        recorder = RequestRecorder(receive, send)
+        try:
+            await self.app(scope, recorder.receive, recorder.send)
+        finally:
+            registry.in_flight -= 1
+            route = scope.get("route")
+            registry.observe_request(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                recorder.status,
+                perf_counter() - started,
+                recorder.request_bytes,
+                recorder.response_bytes,
+            )
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,179 @@
+import struct
+from datetime import datetime, timedelta
+from app.schemas import DetectionCreate
+
+# 手機端串流的每一幀是 5 個標籤 index，順序為 Head、Neck、Shoulder、Torso、Feet
+# 每個 index 對應到該部位在 schemas 裡的計數欄位
+POSTURE_LABELS = {
+    "Head": ("BowedCount", "NeutralCount", "TiltBackCount", "AmbiguousCount"),
+    "Neck": ("ForwardCount", "NeutralCount", "AmbiguousCount"),
+    "Shoulder": ("HunchedCount", "NeutralCount", "ShrugCount", "AmbiguousCount"),
+    "Torso": ("BackwardCount", "ForwardCount", "NeutralCount", "AmbiguousCount"),
+    "Feet": ("AnkleOnKneeCount", "FlatCount", "AmbiguousCount"),
+}
+POSTURE_PARTS = tuple(POSTURE_LABELS)
+
+# 文字訊息格式："P:01020,11020"，逗號分隔多幀，每幀 5 個數字
+POSTURE_MESSAGE_PREFIX = "P:"
+
+# 二進位訊息格式：struct "!BH"（訊息類型、幀數）標頭，後接每幀 5 個 byte 的標籤 index
+POSTURE_FRAME_TYPE = 0x01
+_BINARY_HEADER = struct.Struct("!BH")
+
+# 每個部位在計數陣列中的起始位置
+_OFFSETS = []
+_offset = 0
+for _labels in POSTURE_LABELS.values():
+    _OFFSETS.append(_offset)
+    _offset += len(_labels)
+_COUNTER_SIZE = _offset
+_LABEL_SIZES = tuple(len(labels) for labels in POSTURE_LABELS.values())
+
+
+def is_posture_message(message: str) -> bool:
+    return message.startswith(POSTURE_MESSAGE_PREFIX)
+
+
+def is_posture_frame(data: bytes) -> bool:
+    return len(data) >= _BINARY_HEADER.size and data[0] == POSTURE_FRAME_TYPE
+
+
+def encode_posture_frames(frames) -> bytes:
+    """
+    將多幀標籤 index 編成二進位姿勢訊息，[[0, 1, 0, 2, 0]] 編碼後為 01 0001 0001000200（共 8 bytes）
+    """
+    return _BINARY_HEADER.pack(POSTURE_FRAME_TYPE, len(frames)) + b"".join(bytes(frame) for frame in frames)
+
+
+def decode_posture_frames(data: bytes):
+    """
+    解析二進位姿勢訊息，回傳每幀 5 個 byte 的 bytes 串列。
+    """
+    if not is_posture_frame(data):
+        raise ValueError("不是二進位姿勢訊息")
+    _, count = _BINARY_HEADER.unpack_from(data)
+    frame_size = len(POSTURE_PARTS)
+    payload = memoryview(data)[_BINARY_HEADER.size:]
+    if len(payload) != count * frame_size:
+        raise ValueError(f"姿勢訊息長度不符：{count} 幀需要 {count * frame_size} bytes")
+    return [bytes(payload[i:i + frame_size]) for i in range(0, len(payload), frame_size)]
+
+
+class PostureAccumulator:
+    """
+    單一串流 session 的姿勢計數器。
+    只保存固定長度的計數陣列、時間戳與上一次寫入的結果，不論串流多久記憶體用量都相同。
+    計數在 checkpoint 之後不會歸零：一個 session 對應一筆 Detection，第一次 checkpoint 新增，之後的 checkpoint 以累計值更新，
+    TotalTime 為第一幀到最後一幀的時間（包含 checkpoint 之間的時間）。
+    """
+    __slots__ = ("counts", "frame_count", "started_at", "last_frame_at", "last_flush_at", "detection_id", "saved")
+
+    def __init__(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        self.counts = [0] * _COUNTER_SIZE
+        self.frame_count = 0
+        self.started_at = None
+        self.last_frame_at = None
+        self.last_flush_at = now
+        self.detection_id = None  # 第一次 checkpoint 寫入的 DetectionID
+        self.saved = None  # 上一次寫入的 DetectionCreate
+
+    def add_frame(self, labels, now: datetime = None):
+        if len(labels) != len(POSTURE_PARTS):
+            raise ValueError("每一幀需要 5 個部位標籤")
+        for size, label in zip(_LABEL_SIZES, labels):
+            if not 0 <= label < size:
+                raise ValueError(f"無效的標籤 index: {label}")
+        for offset, label in zip(_OFFSETS, labels):
+            self.counts[offset + label] += 1
+        now = now or datetime.utcnow()
+        if self.started_at is None:
+            self.started_at = now
+        self.last_frame_at = now
+        self.frame_count += 1
+
+    def add_message(self, message: str, now: datetime = None) -> int:
+        """
+        解析 "P:..." 文字訊息並累計，回傳這則訊息包含的幀數。
+        """
+        now = now or datetime.utcnow()
+        frames = message[len(POSTURE_MESSAGE_PREFIX):].split(",")
+        parsed = []
+        for frame in frames:
+            if len(frame) != len(POSTURE_PARTS) or not frame.isdigit():
+                raise ValueError(f"無效的姿勢訊息: {frame!r}")
+            parsed.append([int(c) for c in frame])
+        return self._add_frames(parsed, now)
+
+    def add_binary(self, data: bytes, now: datetime = None) -> int:
+        """
+        解析二進位姿勢訊息並累計，回傳這則訊息包含的幀數。
+        """
+        return self._add_frames(decode_posture_frames(data), now or datetime.utcnow())
+
+    def _add_frames(self, frames, now: datetime) -> int:
+        # 先檢查整則訊息，避免只累計到一半
+        for labels in frames:
+            for size, label in zip(_LABEL_SIZES, labels):
+                if not 0 <= label < size:
+                    raise ValueError(f"無效的標籤 index: {label}")
+        for labels in frames:
+            self.add_frame(labels, now)
+        return len(frames)
+
+    def has_unsaved_frames(self) -> bool:
+        saved_frames = self.saved.TotalPredictions if self.saved is not None else 0
+        return self.frame_count > saved_frames
+
+    def should_checkpoint(self, interval_seconds: int, now: datetime = None) -> bool:
+        if not self.has_unsaved_frames():
+            return False
+        now = now or datetime.utcnow()
+        return (now - self.last_flush_at).total_seconds() >= interval_seconds
+
+    def to_detection_create(self):
+        """
+        將目前的計數轉成 DetectionCreate，沒有任何幀時回傳 None。
+        """
+        if self.frame_count == 0:
+            return None
+        parts = {}
+        for part, offset in zip(POSTURE_PARTS, _OFFSETS):
+            labels = POSTURE_LABELS[part]
+            parts[part] = dict(zip(labels, self.counts[offset:offset + len(labels)]))
+        total_time = self.last_frame_at - self.started_at
+        return DetectionCreate(
+            StartTime=self.started_at,
+            EndTime=self.last_frame_at,
+            TotalTime=(datetime.min + min(total_time, timedelta(hours=23, minutes=59, seconds=59))).time(),
+            TotalPredictions=self.frame_count,
+            **parts,
+        )
+
+    def mark_saved(self, detection_id: int, detection_data, now: datetime = None):
+        """
+        checkpoint 寫入成功：記住這個 session 的 DetectionID 與寫入的數值，下一次 checkpoint 只更新差值。
+        """
+        self.detection_id = detection_id
+        self.saved = detection_data
+        self.last_flush_at = now or datetime.utcnow()
+
+    def defer_checkpoint(self, now: datetime = None):
+        """
+        checkpoint 寫入失敗：保留計數，等下一個間隔再重試。
+        """
+        self.last_flush_at = now or datetime.utcnow()
+
+    def reset(self, now: datetime = None):
+        """
+        開始新的 session：清除計數與已寫入的 Detection。
+        """
+        now = now or datetime.utcnow()
+        for i in range(_COUNTER_SIZE):
+            self.counts[i] = 0
+        self.frame_count = 0
+        self.started_at = None
+        self.last_frame_at = None
+        self.last_flush_at = now
+        self.detection_id = None
+        self.saved = None
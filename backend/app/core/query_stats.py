@@ -0,0 +1,132 @@
+import contextvars
+import logging
+from contextlib import contextmanager
+from time import perf_counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import SQL_REPEAT_THRESHOLD, SQL_STRICT, SQL_LOG_QUERY_COUNT, SQL_SERVER_TIMING
+
+logger = logging.getLogger(__name__)
+
+
+class RepeatedQueryError(AssertionError):
+    """
+    strict 模式下，同一個 SQL 在一次請求內執行超過門檻次數（通常是 N+1）。
+    """
+
+
+class QueryStats:
+    """
+    一次請求（或一段 track_queries 區塊）內執行的 SQL 次數、總耗時，以及每種 SQL 的次數。
+    SQL 的 bind 參數是 placeholder，所以同一段程式以不同參數查詢時會是相同的字串。
+    """
+
+    def __init__(self, repeat_threshold: int = SQL_REPEAT_THRESHOLD, strict: bool = False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}  # {statement: 次數}
+        self.repeat_threshold = repeat_threshold
+        self.strict = strict
+
+    def add_statement(self, statement: str):
+        self.count += 1
+        times = self.statements.get(statement, 0) + 1
+        self.statements[statement] = times
+        if self.strict and times > self.repeat_threshold:
+            raise RepeatedQueryError(
+                f"Statement executed {times} times in one request (threshold {self.repeat_threshold}): {statement}"
+            )
+
+    def add_duration(self, seconds: float):
+        self.duration += seconds
+
+    def repeated(self) -> dict:
+        """
+        執行次數超過門檻的 SQL，格式：{statement: 次數}。
+        """
+        return {statement: times for statement, times in self.statements.items() if times > self.repeat_threshold}
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"'
+
+
+_current_stats = contextvars.ContextVar("query_stats", default=None)
+
+
+def current_query_stats():
+    return _current_stats.get()
+
+
+@contextmanager
+def track_queries(repeat_threshold: int = SQL_REPEAT_THRESHOLD, strict: bool = False):
+    """
+    統計區塊內（包含 threadpool 與 async engine 的 greenlet，兩者都會複製 context）執行的 SQL。
+    測試中可以用 strict=True，同一個 SQL 超過 repeat_threshold 次時直接拋出 RepeatedQueryError。
+    """
+    stats = QueryStats(repeat_threshold, strict)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    context._query_started = perf_counter()
+    stats.add_statement(statement)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    started = getattr(context, "_query_started", None)
+    if stats is None or started is None:
+        return
+    stats.add_duration(perf_counter() - started)
+
+
+def log_query_stats(method: str, path: str, stats: QueryStats):
+    """
+    查詢次數過多或有重複的 SQL 時記錄一筆警告。
+    """
+    repeated = stats.repeated()
+    if stats.count < SQL_LOG_QUERY_COUNT and not repeated:
+        return
+    lines = [f"{method} {path}: {stats.count} queries in {stats.duration * 1000:.1f}ms"]
+    for statement, times in repeated.items():
+        lines.append(f"  repeated {times}x: {' '.join(statement.split())[:200]}")
+    logger.warning("\n".join(lines))
+
+
+class QueryStatsMiddleware:
+    """
+    純 ASGI middleware：統計每個 HTTP 請求的 SQL 次數與耗時，放在 Server-Timing header，並記錄異常的請求。
+    """
+
+    def __init__(self, app, strict: bool = SQL_STRICT, repeat_threshold: int = SQL_REPEAT_THRESHOLD, server_timing: bool = SQL_SERVER_TIMING):
+        self.app = app
+        self.strict = strict
+        self.repeat_threshold = repeat_threshold
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries(self.repeat_threshold, self.strict) as stats:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", stats.server_timing().encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                log_query_stats(scope["method"], scope["path"], stats)
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import re
+from collections import deque
+from uuid import uuid4
+from app.config import WS_BROKER_URL, WS_SEND_QUEUE_SIZE, WS_OVERFLOW_POLICY
+from app.core.broker import Broker, create_broker
+from app.core.posture_stream import is_posture_message, is_posture_frame
+
+logger = logging.getLogger(__name__)
+
+# 送出佇列滿時的處理方式
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# 佇列溢位而主動斷線時使用的 close code（1013: Try Again Later）
+OVERFLOW_CLOSE_CODE = 1013
+
+# 用 WebSocket subprotocol 協商精簡的二進位編碼；協商成功的連線才會收到二進位姿勢事件
+COMPACT_SUBPROTOCOL = "ssd.compact.v1"
+
+
+def peer_role(role: str) -> str:
+    # phone 的訊息送給 viewer，其他角色的訊息送給 phone
+    return "viewer" if role == "phone" else "phone"
+
+
+# 裝置 id 由客戶端以 ?device= 指定，會出現在 channel 名稱中，所以限制可用字元
+_DEVICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_device_id(device_id: str) -> bool:
+    return bool(_DEVICE_ID_PATTERN.match(device_id))
+
+
+def relay_channel(username: str, role: str, compact: bool = False) -> str:
+    # 發給某角色所有裝置的 channel；compact channel 只有協商了二進位編碼的連線會訂閱
+    return f"ws:{username}:{role}:compact" if compact else f"ws:{username}:{role}"
+
+
+def device_channel(username: str, role: str, device_id: str) -> str:
+    # 發給某角色單一裝置的 channel
+    return f"ws:{username}:{role}:device:{device_id}"
+
+
+def coalesce_key(message):
+    """
+    可以只保留最新一筆的訊息類型；SDP / ICE 等信令不能合併，回傳 None。
+    """
+    if isinstance(message, str):
+        return "posture" if is_posture_message(message) else None
+    return "posture" if is_posture_frame(message) else None
+
+
+class PeerConnection:
+    """
+    一條 WebSocket 連線的有界送出佇列，由專屬的 writer task 依序送出。
+    轉發端只把訊息放進佇列，不會因為對方網路慢而被卡住。
+    """
+
+    def __init__(
+        self,
+        websocket,
+        maxsize: int = 256,
+        overflow_policy: str = "drop_oldest",
+        compact: bool = False,
+        device_id: str = None,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.websocket = websocket
+        self.compact = compact
+        self.device_id = device_id
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.overflowed = False
+        self._queue = deque()
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, message) -> bool:
+        """
+        將訊息放進佇列（不會等待），回傳是否有被接受。
+        """
+        if self.overflowed:
+            self.dropped += 1
+            return False
+        if len(self._queue) >= self.maxsize:
+            if not self._make_room(message):
+                return False
+        self._queue.append(message)
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        self._ready.set()
+        return True
+
+    def _make_room(self, message) -> bool:
+        if self.overflow_policy == "disconnect":
+            # 對方跟不上，清空佇列並由 writer 關閉連線
+            self.dropped += len(self._queue) + 1
+            self._queue.clear()
+            self.overflowed = True
+            self._ready.set()
+            return False
+        if self.overflow_policy == "coalesce":
+            key = coalesce_key(message)
+            if key is not None:
+                for i in range(len(self._queue) - 1, -1, -1):
+                    if coalesce_key(self._queue[i]) == key:
+                        del self._queue[i]
+                        self.coalesced += 1
+                        return True
+        # drop_oldest，或 coalesce 找不到可合併的訊息
+        self._queue.popleft()
+        self.dropped += 1
+        return True
+
+    async def _write_loop(self):
+        while True:
+            await self._ready.wait()
+            if self.overflowed:
+                try:
+                    await self.websocket.close(code=OVERFLOW_CLOSE_CODE)
+                except Exception:
+                    pass
+                return
+            while self._queue:
+                message = self._queue.popleft()
+                try:
+                    if isinstance(message, str):
+                        await self.websocket.send_text(message)
+                    else:
+                        await self.websocket.send_bytes(message)
+                except Exception as e:
+                    # 連線已斷開，剩下的訊息由 receive loop 斷線後 detach 清除
+                    logger.info("WebSocket send failed: %s", e)
+                    self._queue.clear()
+                    return
+                self.sent += 1
+                if self.overflowed:
+                    break
+            if not self._queue and not self.overflowed:
+                self._ready.clear()
+
+    async def close(self):
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._queue.clear()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "overflowed": self.overflowed,
+        }
+
+
+class WebSocketRelay:
+    """
+    phone <-> viewer 的訊息轉發，每位使用者的每個角色可以有多個裝置（N:M）。
+    訊息一律經由 broker 發布：發給對方角色所有裝置，或以 target 指定單一裝置。
+    每個 worker 只訂閱本機有連線的 channel，收到後放進本機各連線的送出佇列，
+    同一則訊息只經過 broker 一次，再由各連線的 writer task 同時送出。
+    """
+
+    def __init__(self, broker: Broker, queue_size: int = 256, overflow_policy: str = "drop_oldest"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.broker = broker
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        # 本機的連線，格式：{username: {"phone": {device_id: PeerConnection}, "viewer": {...}}}
+        self.connections = {}
+        self._subscriptions = {}  # {channel: [handler, 本機使用這個 channel 的連線數]}
+
+    async def attach(self, username: str, role: str, websocket, device_id: str = None, compact: bool = False) -> str:
+        """
+        登記本機的連線並訂閱對應的 channel，回傳裝置 id（未指定時自動產生）。
+        同一個裝置 id 重新連線時會取代舊連線。
+        """
+        device_id = device_id or uuid4().hex
+        devices = self.connections.setdefault(username, {}).setdefault(role, {})
+        previous = devices.get(device_id)
+        devices[device_id] = PeerConnection(websocket, self.queue_size, self.overflow_policy, compact, device_id)
+        for channel, handler_args in self._peer_channels(username, role, device_id, compact):
+            await self._acquire(channel, *handler_args)
+        if previous is not None:
+            await self._release_peer(username, role, previous)
+        return device_id
+
+    async def detach(self, username: str, role: str, websocket, device_id: str):
+        devices = self.connections.get(username, {}).get(role, {})
+        peer = devices.get(device_id)
+        # 已被同裝置的新連線取代時，不影響新連線的訂閱
+        if peer is None or peer.websocket is not websocket:
+            return
+        del devices[device_id]
+        await self._release_peer(username, role, peer)
+        if not devices:
+            del self.connections[username][role]
+            if not self.connections[username]:
+                del self.connections[username]
+
+    async def send(self, username: str, role: str, message, target: str = None, compact: bool = False):
+        """
+        將 role 端送出的訊息（str 或 bytes）轉發給同一個 username 的另一端。
+        target 指定對方的裝置 id，未指定時送給對方角色的所有裝置。
+        compact=True 的訊息一律送給所有協商了二進位編碼的連線。
+        """
+        to_role = peer_role(role)
+        if compact:
+            channel = relay_channel(username, to_role, compact=True)
+        elif target:
+            channel = device_channel(username, to_role, target)
+        else:
+            channel = relay_channel(username, to_role)
+        await self.broker.publish(channel, message)
+
+    @staticmethod
+    def _peer_channels(username: str, role: str, device_id: str, compact: bool):
+        # (channel, 交給 _deliver 的參數：username, role, device_id, compact_only)
+        channels = [
+            (relay_channel(username, role), (username, role, None, False)),
+            (device_channel(username, role, device_id), (username, role, device_id, False)),
+        ]
+        if compact:
+            channels.append((relay_channel(username, role, compact=True), (username, role, None, True)))
+        return channels
+
+    async def _acquire(self, channel: str, username: str, role: str, device_id: str, compact_only: bool):
+        subscription = self._subscriptions.get(channel)
+        if subscription is not None:
+            subscription[1] += 1
+            return
+
+        async def deliver(message):
+            self._deliver(username, role, device_id, compact_only, message)
+
+        self._subscriptions[channel] = [deliver, 1]
+        await self.broker.subscribe(channel, deliver)
+
+    async def _release_peer(self, username: str, role: str, peer: PeerConnection):
+        await peer.close()
+        for channel, _ in self._peer_channels(username, role, peer.device_id, peer.compact):
+            subscription = self._subscriptions.get(channel)
+            if subscription is None:
+                continue
+            subscription[1] -= 1
+            if subscription[1] <= 0:
+                del self._subscriptions[channel]
+                await self.broker.unsubscribe(channel, subscription[0])
+
+    def _deliver(self, username: str, role: str, device_id: str, compact_only: bool, message):
+        devices = self.connections.get(username, {}).get(role)
+        if not devices:
+            return
+        if device_id is not None:
+            peer = devices.get(device_id)
+            peers = (peer,) if peer is not None else ()
+        else:
+            peers = tuple(devices.values())
+        for peer in peers:
+            if peer.compact or not compact_only:
+                peer.put(message)
+
+    def queue_summary(self) -> dict:
+        """
+        本機所有連線的彙總數字：各角色的連線數、佇列深度合計與最大值、送出 / 丟棄 / 合併 / 溢出次數合計。
+        不包含使用者名稱與裝置 ID。
+        """
+        summary = {"connections": {}, "depth": 0, "max_depth": 0, "sent": 0, "dropped": 0, "coalesced": 0, "overflowed": 0}
+        for roles in self.connections.values():
+            for role, devices in roles.items():
+                summary["connections"][role] = summary["connections"].get(role, 0) + len(devices)
+                for peer in devices.values():
+                    summary["depth"] += peer.depth
+                    summary["max_depth"] = max(summary["max_depth"], peer.max_depth)
+                    summary["sent"] += peer.sent
+                    summary["dropped"] += peer.dropped
+                    summary["coalesced"] += peer.coalesced
+                    summary["overflowed"] += peer.overflowed
+        return summary
+
+    def queue_stats(self) -> dict:
+        """
+        本機每條連線的送出佇列深度與丟棄 / 合併次數，格式：{username: {role: {device_id: stats}}}。
+        包含使用者名稱與裝置 ID，只提供給管理者。
+        """
+        return {
+            username: {
+                role: {device_id: peer.stats() for device_id, peer in devices.items()}
+                for role, devices in roles.items()
+            }
+            for username, roles in self.connections.items()
+        }
+
+
+relay = WebSocketRelay(create_broker(WS_BROKER_URL), WS_SEND_QUEUE_SIZE, WS_OVERFLOW_POLICY)
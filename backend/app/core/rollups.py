@@ -0,0 +1,167 @@
+import argparse
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, sessionmaker
+from app.config import ROLLUP_TIMEZONES
+from app.models import DetectionRollup, GranularityEnum, Detection, Head, Neck, Shoulder, Torso, Feet
+
+# 會被累加的欄位（其餘為主鍵）
+ROLLUP_SUM_COLUMNS = (
+    "SessionCount",
+    "TotalPredictions",
+    "TotalSeconds",
+    "HeadNeutralCount",
+    "NeckNeutralCount",
+    "ShoulderNeutralCount",
+    "TorsoNeutralCount",
+    "FeetFlatCount",
+)
+ROLLUP_KEY_COLUMNS = ("UserID", "Granularity", "BucketStart", "TimeZone")
+
+# 每批寫入的 rollup 列數
+_UPSERT_CHUNK_SIZE = 1000
+
+
+def bucket_start(local_day: date, granularity: GranularityEnum) -> date:
+    """
+    取得某一天所在區間的起始日：週以星期一開始，月以 1 號開始。
+    """
+    if granularity == GranularityEnum.week:
+        return local_day - timedelta(days=local_day.weekday())
+    if granularity == GranularityEnum.month:
+        return local_day.replace(day=1)
+    return local_day
+
+
+def to_local_day(start_time: datetime, tz: str) -> date:
+    # 資料庫中的 StartTime 沒有時區資訊，一律視為 UTC
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    return start_time.astimezone(ZoneInfo(tz)).date()
+
+
+def add_rollup_delta(
+    deltas: dict,
+    user_id: int,
+    start_time: datetime,
+    total_time: time,
+    total_predictions: int,
+    neutral_counts: tuple,
+    sign: int = 1,
+):
+    """
+    將一筆偵測累加到 deltas，key 為 rollup 的主鍵；sign=-1 時扣除（用於以新的數值取代同一筆偵測）。
+    neutral_counts 順序：Head、Neck、Shoulder、Torso 的 NeutralCount 與 Feet 的 FlatCount。
+    """
+    total_seconds = total_time.hour * 3600 + total_time.minute * 60 + total_time.second
+    values = (1, total_predictions, total_seconds) + tuple(count or 0 for count in neutral_counts)
+    values = tuple(sign * value for value in values)
+    for tz in ROLLUP_TIMEZONES:
+        local_day = to_local_day(start_time, tz)
+        for granularity in GranularityEnum:
+            key = (user_id, granularity, bucket_start(local_day, granularity), tz)
+            current = deltas.get(key)
+            if current is None:
+                deltas[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    current[i] += value
+
+
+def upsert_rollups(db: Session, deltas: dict):
+    """
+    將 deltas 累加進 DetectionRollup（不 commit，交由呼叫端控制交易）。
+    MySQL / SQLite 使用單一 INSERT ... ON DUPLICATE KEY / ON CONFLICT 語句。
+    """
+    if not deltas:
+        return
+    rows = [
+        {**dict(zip(ROLLUP_KEY_COLUMNS, key)), **dict(zip(ROLLUP_SUM_COLUMNS, values))}
+        for key, values in deltas.items()
+    ]
+    table = DetectionRollup.__table__
+    dialect = db.get_bind().dialect.name
+    for i in range(0, len(rows), _UPSERT_CHUNK_SIZE):
+        chunk = rows[i:i + _UPSERT_CHUNK_SIZE]
+        if dialect == "mysql":
+            stmt = mysql_insert(table).values(chunk)
+            stmt = stmt.on_duplicate_key_update({
+                column: table.c[column] + stmt.inserted[column] for column in ROLLUP_SUM_COLUMNS
+            })
+            db.execute(stmt)
+        elif dialect == "sqlite":
+            stmt = sqlite_insert(table).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(ROLLUP_KEY_COLUMNS),
+                set_={column: table.c[column] + stmt.excluded[column] for column in ROLLUP_SUM_COLUMNS},
+            )
+            db.execute(stmt)
+        else:
+            for row in chunk:
+                existing = db.get(DetectionRollup, tuple(row[column] for column in ROLLUP_KEY_COLUMNS))
+                if existing is None:
+                    db.add(DetectionRollup(**row))
+                else:
+                    for column in ROLLUP_SUM_COLUMNS:
+                        setattr(existing, column, getattr(existing, column) + row[column])
+            db.flush()
+
+
+def rebuild_rollups(db: Session, user_id: int = None) -> int:
+    """
+    由原始 Detection 與部位資料重建 DetectionRollup（回補歷史資料用），回傳處理的偵測筆數。
+    """
+    delete_stmt = delete(DetectionRollup)
+    if user_id is not None:
+        delete_stmt = delete_stmt.where(DetectionRollup.UserID == user_id)
+    db.execute(delete_stmt)
+
+    query = (
+        select(
+            Detection.UserID,
+            Detection.StartTime,
+            Detection.TotalTime,
+            Detection.TotalPredictions,
+            Head.NeutralCount,
+            Neck.NeutralCount,
+            Shoulder.NeutralCount,
+            Torso.NeutralCount,
+            Feet.FlatCount,
+        )
+        .outerjoin(Head, Head.DetectionID == Detection.DetectionID)
+        .outerjoin(Neck, Neck.DetectionID == Detection.DetectionID)
+        .outerjoin(Shoulder, Shoulder.DetectionID == Detection.DetectionID)
+        .outerjoin(Torso, Torso.DetectionID == Detection.DetectionID)
+        .outerjoin(Feet, Feet.DetectionID == Detection.DetectionID)
+        .execution_options(yield_per=5000)
+    )
+    if user_id is not None:
+        query = query.where(Detection.UserID == user_id)
+
+    deltas = {}
+    count = 0
+    for row in db.execute(query):
+        add_rollup_delta(deltas, row[0], row[1], row[2], row[3], tuple(row[4:]))
+        count += 1
+    upsert_rollups(db, deltas)
+    db.commit()
+    return count
+
+
+if __name__ == "__main__":
+    # 使用方式：python -m app.core.rollups rebuild [--user-id 1]
+    from app.core.database import engine
+
+    parser = argparse.ArgumentParser(description="DetectionRollup 維護工具")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user-id", type=int, default=None, help="只重建指定使用者")
+    args = parser.parse_args()
+
+    DetectionRollup.__table__.create(bind=engine, checkfirst=True)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as db:
+        processed = rebuild_rollups(db, args.user_id)
+    print(f"Rebuilt rollups from {processed} detections")
@@ -1,22 +1,175 @@
 from datetime import datetime, timedelta
+from dataclasses import dataclass
 from jose import JWTError, jwt
+import asyncio
 import bcrypt
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
+from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS, PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS
+from app.config import BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_MAX_CONCURRENCY, BCRYPT_QUEUE_TIMEOUT_SECONDS
+from app.core.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    password_byte_enc = plain_password.encode('utf-8')
-    hashed_password = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_byte_enc, hashed_password)
+# region: bcrypt process pool
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
-def get_password_hash(password):
-    pwd_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password=pwd_bytes, salt=salt)
-    string_password = hashed_password.decode('utf8')
-    return string_password
+def _hashpw(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password=password.encode('utf-8'), salt=bcrypt.gensalt(rounds=rounds)).decode('utf8')
+
+def hash_rounds(hashed_password: str):
+    """
+    從 bcrypt 雜湊（$2b$12$...）取出 work factor，格式不符時回傳 None。
+    """
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+def _verify_and_update(plain_password: str, hashed_password: str, rounds: int):
+    """
+    驗證密碼；驗證成功且雜湊的 work factor 與 rounds 不同時，一併產生新的雜湊。
+    回傳 (是否正確, 新雜湊或 None)，在同一個 worker process 中完成，不需要再排隊一次。
+    """
+    if not _checkpw(plain_password, hashed_password):
+        return False, None
+    if hash_rounds(hashed_password) != rounds:
+        return True, _hashpw(plain_password, rounds)
+    return True, None
+
+class PasswordHasher:
+    """
+    bcrypt 在獨立的 process pool 中執行，不佔用 API 的 GIL，登入尖峰時可以使用所有 CPU 核心。
+    同時在 pool 中排隊的工作數不超過 max_concurrency，等候超過 queue_timeout 秒時回傳 503。
+    排隊與等待結果都在 event loop 上以 await 完成，等待中的登入不佔用任何執行緒。
+    workers 為 0 時直接在呼叫端執行（開發 / 測試用）。
+    """
+    def __init__(self, workers: int, max_concurrency: int, queue_timeout: float, rounds: int):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.rounds = rounds
+        self._executor = None
+        # asyncio.Semaphore 只能在一個 event loop 中使用，每個 loop 各自一個（正式環境每個 worker 只有一個 loop）
+        self._slots = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._slots.get(loop)
+            if slots is None:
+                slots = self._slots[loop] = asyncio.Semaphore(self.max_concurrency)
+            return slots
+
+    async def run(self, fn, *args):
+        """
+        在 pool 中執行 fn(*args) 並等待結果。
+        """
+        slots = self._get_slots()
+        started = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+            acquired = True
+        except asyncio.TimeoutError:
+            acquired = False
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._waiting -= 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if not acquired:
+                self._rejected += 1
+            else:
+                self._in_flight += 1
+        if not acquired:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="伺服器忙碌中，請稍後再試",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            run_started = time.perf_counter()
+            if self.workers > 0:
+                result = await asyncio.wrap_future(self._get_executor().submit(fn, *args))
+            else:
+                result = fn(*args)
+            ran = time.perf_counter() - run_started
+        finally:
+            slots.release()
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self._completed += 1
+            self._run_total += ran
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self.run(_hashpw, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(_checkpw, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str):
+        ok, new_hash = await self.run(_verify_and_update, plain_password, hashed_password, self.rounds)
+        if new_hash is not None:
+            with self._lock:
+                self._rehashed += 1
+        return ok, new_hash
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self._completed + self._rejected
+            return {
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "rehashed": self._rehashed,
+                "queue_wait_avg_ms": round(self._wait_total / finished * 1000, 3) if finished else 0.0,
+                "queue_wait_max_ms": round(self._wait_max * 1000, 3),
+                "hash_avg_ms": round(self._run_total / self._completed * 1000, 3) if self._completed else 0.0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            # 等待執行中的 bcrypt 結束（最多幾百毫秒），避免行程結束時 pool 的管理執行緒寫入已關閉的 pipe
+            executor.shutdown(wait=True, cancel_futures=True)
+
+password_hasher = PasswordHasher(BCRYPT_WORKERS, BCRYPT_MAX_CONCURRENCY, BCRYPT_QUEUE_TIMEOUT_SECONDS, BCRYPT_ROUNDS)
+
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
+# endregion
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -37,4 +190,55 @@ def decode_token(token: str):
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+
+# region: 已驗證身分快取
+@dataclass(frozen=True)
+class Principal:
+    """
+    已驗證的呼叫者，只包含識別用的欄位；需要完整 User 資料時再以 UserID 載入。
+    """
+    UserID: int
+    UserName: str
+
+class PrincipalCache:
+    """
+    token -> Principal 的 LRU + TTL 快取，過期時間不會超過 token 的 exp。
+    另外記錄每位使用者有哪些 token，使用者資料變動時可一次清除。
+    """
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._cache = TTLCache(maxsize, ttl_seconds)
+        self._tokens_by_user = {}  # {UserID: set(token)}
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        return self._cache.get(token)
+
+    def set(self, token: str, principal: Principal, exp: float):
+        self._cache.set(token, principal, exp - time.time())
+        with self._lock:
+            # 順便移除已被淘汰或過期的 token
+            tokens = {t for t in self._tokens_by_user.get(principal.UserID, ()) if t in self._cache}
+            tokens.add(token)
+            self._tokens_by_user[principal.UserID] = tokens
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            tokens = self._tokens_by_user.pop(user_id, ())
+        for token in tokens:
+            self._cache.pop(token)
+
+    def clear(self):
+        with self._lock:
+            self._tokens_by_user.clear()
+        self._cache.clear()
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+def invalidate_principal(user_id: int):
+    """
+    Principal 只包含 UserID 與 UserName，只有使用者名稱、密碼變更或刪除使用者時才需要呼叫；
+    偵測結果與個人資料的其他欄位不會讓快取的 Principal 失效。
+    """
+    principal_cache.invalidate_user(user_id)
+# endregion
@@ -0,0 +1,100 @@
+import json
+from datetime import date, datetime, time
+from enum import Enum
+from typing import get_args
+from sqlalchemy import inspect as sa_inspect
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson 為選用套件，沒有安裝時使用標準函式庫的 json
+    orjson = None
+
+
+def _default(value):
+    # 與 FastAPI 的預設輸出相同：日期時間為 ISO 8601，Enum 為其值
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    直接輸出已經是 JSON 基本型別（以及 datetime / time / Enum）的 dict 或 list。
+    API 回傳 Response 時 FastAPI 不會再以 response_model 驗證，所以資料必須由下面編譯好的 serializer 產生，
+    response_model 仍然保留在路由上作為 OpenAPI 文件。
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _compile(name: str, args: str, body: str):
+    namespace = {}
+    exec(f"def {name}({args}):\n    return {body}\n", namespace)
+    return namespace[name]
+
+
+def _nested_schema(annotation):
+    # Optional[HeadResponse] -> HeadResponse
+    for arg in get_args(annotation):
+        if arg is not type(None):
+            return arg
+    return annotation
+
+
+def compile_row_serializer(schema, model, nested_models: dict):
+    """
+    依 schema 的欄位順序編譯一個「查詢結果 row -> dict」的函式。
+    一般欄位取自 model，nested_models 中的欄位（例如 Head）取自對應的 model，並依子 schema 的欄位組成巢狀 dict。
+    nested model 以 LEFT OUTER JOIN 查詢，主鍵為 NULL（沒有對應的 row）時該欄位輸出 None；
+    這些主鍵欄位放在 schema 的欄位之後，所以 columns[:len(columns) - len(nested_models)] 就是 schema 的欄位。
+    回傳 (要 SELECT 的欄位列表, serializer)，serializer 只用固定的索引取值，沒有任何驗證或反射。
+    """
+    fields = {
+        field_name: _nested_schema(field.annotation).model_fields if field_name in nested_models else None
+        for field_name, field in schema.model_fields.items()
+    }
+    # 主鍵欄位排在所有 schema 欄位之後
+    presence_index = sum(1 if nested is None else len(nested) for nested in fields.values())
+    columns = []
+    presence_columns = []
+    items = []
+    for field_name, nested_fields in fields.items():
+        if nested_fields is None:
+            items.append(f"{field_name!r}: row[{len(columns)}]")
+            columns.append(getattr(model, field_name))
+            continue
+        nested_model = nested_models[field_name]
+        nested_items = []
+        for nested_name in nested_fields:
+            nested_items.append(f"{nested_name!r}: row[{len(columns)}]")
+            columns.append(getattr(nested_model, nested_name))
+        items.append(
+            f"{field_name!r}: {{{', '.join(nested_items)}}} if row[{presence_index + len(presence_columns)}] is not None else None"
+        )
+        presence_columns.append(getattr(nested_model, sa_inspect(nested_model).primary_key[0].key))
+    body = f"{{{', '.join(items)}}}"
+    return columns + presence_columns, _compile(f"serialize_{schema.__name__}", "row", body)
+
+
+def compile_object_serializer(schema, extra_fields=()):
+    """
+    依 schema 的欄位順序編譯一個「ORM 物件 -> dict」的函式；extra_fields 中的欄位（衍生值）由呼叫端以參數傳入。
+    """
+    items = []
+    for field_name in schema.model_fields:
+        if field_name in extra_fields:
+            items.append(f"{field_name!r}: {field_name}")
+        else:
+            items.append(f"{field_name!r}: obj.{field_name}")
+    args = ", ".join(("obj",) + tuple(extra_fields))
+    return _compile(f"serialize_{schema.__name__}", args, f"{{{', '.join(items)}}}")
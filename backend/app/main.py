@@ -2,18 +2,53 @@ import sys
 import site
 sys.path.extend(site.getsitepackages())
 from sqlmodel import SQLModel
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.config import DATABASE_URL
-from app.core.security import decode_token
-from app.api import auth, users, friends, friend_requests, blocked_list, detections
+from app.config import DATABASE_URL, POSTURE_CHECKPOINT_SECONDS, DB_ASYNC, WS_PER_MESSAGE_DEFLATE, LOG_LEVEL
+from app.core.security import decode_token, password_hasher
+from app.core.posture_stream import PostureAccumulator, is_posture_message, is_posture_frame
+from app.core.indexes import score_rank_index, username_index, friend_graph
+from app.core.relay import relay, COMPACT_SUBPROTOCOL, is_valid_device_id
+from app.core.avatars import shutdown_executor
+from app.core.metrics import MetricsMiddleware, metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.core.query_stats import QueryStatsMiddleware
+from app.models import User
+from app.api import auth, users, friends, friend_requests, blocked_list, detections, system
+from app.api.aio import auth as aio_auth, users as aio_users, friends as aio_friends, detections as aio_detections
+from app.core.database import registry, engine
+from app.api.deps import SessionLocal
+from sqlalchemy.engine import make_url
 import uvicorn
 import json
+import logging
+
+# root logger 已有 handler（例如 gunicorn / pytest 設定過）時 basicConfig 不做任何事；
+# LOG_LEVEL 只套用在 app.* logger，其他套件維持預設的 WARNING
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger("app").setLevel(LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 啟動時預先載入行程內的索引
+    db = SessionLocal()
+    try:
+        score_rank_index.ensure_loaded(db)
+        username_index.ensure_loaded(db)
+        friend_graph.ensure_loaded(db)
+    finally:
+        db.close()
+    yield
+    shutdown_executor()
+    password_hasher.shutdown()
+    await relay.broker.close()
+    await registry.dispose_async()
+    registry.dispose()
 
 # 初始化 FastAPI 應用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 # 設定允許的來源，設定為前端的URL
 origins = [
     "*",
@@ -26,27 +61,47 @@ app.add_middleware(
     allow_methods=["*"],          # 允許所有 HTTP 方法
     allow_headers=["*"],          # 允許所有標頭
 )
-
-# 用來儲存每位使用者的連線，格式：{username: {"phone": ws1, "viewer": ws2}}
-connections = {}
+# 統計每個請求的 SQL 次數與耗時（Server-Timing header）
+app.add_middleware(QueryStatsMiddleware)
+# 最外層的 middleware，記錄每個路由的延遲分佈與收送位元組數
+app.add_middleware(MetricsMiddleware)
 
 
-print(DATABASE_URL)
-# 資料庫設定(連線設定)
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+logger.debug("Database: %s", make_url(DATABASE_URL).render_as_string(hide_password=True))
+# 資料庫連線統一由 app.core.database 的 registry 建立
 
 # 創建資料庫表格
 SQLModel.metadata.create_all(bind=engine)
 
-# 依賴注入的函數
-def get_db():
+def save_streamed_detection(username: str, accumulator: PostureAccumulator):
+    """
+    將串流 session 目前的累計寫入資料庫：第一次新增一筆 Detection，之後更新同一筆。
+    """
+    if not accumulator.has_unsaved_frames():
+        return
+    detection_data = accumulator.to_detection_create()
     db = SessionLocal()
     try:
-        yield db
+        user = db.query(User).filter(User.UserName == username).first()
+        if not user:
+            return
+        if accumulator.detection_id is None:
+            detection_id = detections.ingest_detections(db, user, [detection_data])[0]["DetectionID"]
+        else:
+            detection_id = accumulator.detection_id
+            detections.update_streamed_detection(db, user, detection_id, accumulator.saved, detection_data)
+        accumulator.mark_saved(detection_id, detection_data)
+    except Exception:
+        accumulator.defer_checkpoint()
+        logger.exception("Failed to save streamed detection for %s", username)
     finally:
         db.close()
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # async：在 event loop 上輸出，不會與 middleware 的更新同時進行
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.websocket("/ws/{role}")  # role 為 "phone" 或 "viewer"
 async def websocket_endpoint(websocket: WebSocket, role: str):
     token = websocket.query_params.get("token")
@@ -61,27 +116,79 @@ async def websocket_endpoint(websocket: WebSocket, role: str):
         await websocket.close()
         return
         
-    await websocket.accept()
-    if username not in connections:
-        connections[username] = {"phone": None, "viewer": None}
-    connections[username][role] = websocket
+    # 同一位使用者可以有多個裝置：?device= 為本裝置 id，?target= 指定只送給對方的某個裝置
+    device_id = websocket.query_params.get("device")
+    target = websocket.query_params.get("target")
+    if (device_id and not is_valid_device_id(device_id)) or (target and not is_valid_device_id(target)):
+        await websocket.close(code=1008)
+        return
+
+    # 客戶端要求 COMPACT_SUBPROTOCOL 時，可以收送二進位的姿勢事件
+    compact = COMPACT_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=COMPACT_SUBPROTOCOL if compact else None)
+    device_id = await relay.attach(username, role, websocket, device_id, compact=compact)
+    metrics.ws_connected(role)
+    # 手機端可以串流姿勢標籤（"P:..." 文字訊息或二進位姿勢訊息），由伺服器累計後定期寫入 Detection
+    accumulator = PostureAccumulator() if role == "phone" else None
 
     try:
         while True:
-            message = await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            data = message.get("bytes")
+            metrics.ws_message(role, "binary" if data is not None else "text")
+            if data is not None:
+                if accumulator is not None and compact and is_posture_frame(data):
+                    try:
+                        accumulator.add_binary(data)
+                    except ValueError as e:
+                        logger.warning("Invalid posture frame from %s: %s", username, e)
+                        continue
+                    # 即時姿勢事件只轉發給協商了二進位編碼的 viewer
+                    await relay.send(username, role, data, compact=True)
+                    if accumulator.should_checkpoint(POSTURE_CHECKPOINT_SECONDS):
+                        await run_in_threadpool(save_streamed_detection, username, accumulator)
+                    continue
+                # 其他二進位訊息不解碼，直接轉發
+                await relay.send(username, role, data, target)
+                continue
+            text = message.get("text")
+            if accumulator is not None and is_posture_message(text):
+                try:
+                    accumulator.add_message(text)
+                except ValueError as e:
+                    logger.warning("Invalid posture message from %s: %s", username, e)
+                    continue
+                if accumulator.should_checkpoint(POSTURE_CHECKPOINT_SECONDS):
+                    await run_in_threadpool(save_streamed_detection, username, accumulator)
+                continue
             # 僅轉發給相同 username 的另一端連線
-            target = connections[username]["viewer"] if role == "phone" else connections[username]["phone"]
-            if target:
-                await target.send_text(message)
+            await relay.send(username, role, text, target)
     except WebSocketDisconnect:
-        connections[username][role] = None
+        if accumulator is not None:
+            await run_in_threadpool(save_streamed_detection, username, accumulator)
+    finally:
+        metrics.ws_disconnected(role)
+        await relay.detach(username, role, websocket, device_id)
+
+def include_api_routers(app: FastAPI, use_async: bool = DB_ASYNC):
+    # 啟用非同步資料庫路徑時，熱門 API 的 async 版本先註冊，會優先於同路徑的同步版本
+    if use_async:
+        app.include_router(aio_users.router, prefix="/users", tags=["users"])
+        app.include_router(aio_friends.router, prefix="/friends", tags=["friends"])
+        app.include_router(aio_auth.router, prefix="/auth", tags=["auth"])
+        app.include_router(aio_detections.router, prefix="/detections", tags=["detections"])
+
+    app.include_router(users.router, prefix="/users", tags=["users"])
+    app.include_router(friends.router, prefix="/friends", tags=["friends"])
+    app.include_router(friend_requests.router, prefix="/friend-requests", tags=["friend_requests"])
+    app.include_router(blocked_list.router, prefix="/blocked-list", tags=["blocked_list"])
+    app.include_router(auth.router, prefix="/auth", tags=["auth"])
+    app.include_router(detections.router, prefix="/detections", tags=["detections"])
+    app.include_router(system.router, prefix="/system", tags=["system"])
 
-app.include_router(users.router, prefix="/users", tags=["users"])
-app.include_router(friends.router, prefix="/friends", tags=["friends"])
-app.include_router(friend_requests.router, prefix="/friend-requests", tags=["friend_requests"])
-app.include_router(blocked_list.router, prefix="/blocked-list", tags=["blocked_list"])
-app.include_router(auth.router, prefix="/auth", tags=["auth"])
-app.include_router(detections.router, prefix="/detections", tags=["detections"])
+include_api_routers(app)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True, ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE)
\ No newline at end of file
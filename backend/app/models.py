@@ -1,7 +1,7 @@
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import UniqueConstraint, ForeignKeyConstraint, Column, Integer, ForeignKey
+from sqlalchemy import UniqueConstraint, ForeignKeyConstraint, Column, Integer, ForeignKey, Index
 from typing import Optional, List
-from datetime import time, datetime
+from datetime import time, datetime, date
 from enum import Enum
 
 
@@ -19,6 +19,13 @@ class StatusEnum(str, Enum):
     Declined = "Declined"
 
 
+# 定義統計彙總的時間粒度
+class GranularityEnum(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+
 # 基底類別：包含時間戳的共用欄位
 class TimestampMixin(SQLModel):
     CreateDate: Optional[datetime] = Field(default_factory=datetime.utcnow, nullable=False)
@@ -117,6 +124,11 @@ class Detection(TimestampMixin, table=True):
     torso: Optional["Torso"] = Relationship(back_populates="detection", sa_relationship_kwargs={"cascade": "all, delete"})
     feet: Optional["Feet"] = Relationship(back_populates="detection", sa_relationship_kwargs={"cascade": "all, delete"})
 
+    __table_args__ = (
+        # 歷史紀錄以 (StartTime, DetectionID) 做 keyset 分頁
+        Index("ix_detection_userid_starttime", "UserID", "StartTime", "DetectionID"),
+    )
+
 
 # BodyPartMixin：共用的部位欄位
 class BodyPartMixin(SQLModel):
@@ -205,4 +217,26 @@ class Feet(BodyPartMixin, table=True):
     FlatCount: Optional[int] = Field(default=0)
     AmbiguousCount: Optional[int] = Field(default=0)
 
-    detection: Optional[Detection] = Relationship(back_populates="feet")
\ No newline at end of file
+    detection: Optional[Detection] = Relationship(back_populates="feet")
+
+
+# DetectionRollup 表：依 (使用者, 時間粒度, 區間起始日, 時區) 彙總的偵測統計，隨 Detection 寫入時同步累加
+class DetectionRollup(SQLModel, table=True):
+    UserID: int = Field(
+        sa_column=Column(
+            Integer,
+            ForeignKey("user.UserID", name="fk_detectionrollup_userid"),
+            primary_key=True
+        )
+    )
+    Granularity: GranularityEnum = Field(primary_key=True)
+    BucketStart: date = Field(primary_key=True)
+    TimeZone: str = Field(max_length=50, primary_key=True)
+    SessionCount: int = Field(default=0)
+    TotalPredictions: int = Field(default=0)
+    TotalSeconds: int = Field(default=0)
+    HeadNeutralCount: int = Field(default=0)
+    NeckNeutralCount: int = Field(default=0)
+    ShoulderNeutralCount: int = Field(default=0)
+    TorsoNeutralCount: int = Field(default=0)
+    FeetFlatCount: int = Field(default=0)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, validator
 from typing import Optional, List
-from datetime import time, datetime
+from datetime import time, datetime, date
 from .models import GenderEnum, StatusEnum
 from enum import Enum
 
@@ -115,6 +115,14 @@ class RequestAction(str, Enum):
 class FriendRequestAction(BaseModel):
     Action: RequestAction  # 指定 
 
+class FriendRequestBulkAction(FriendRequestAction):
+    RequestID: int
+
+class FriendRequestBulkResult(BaseModel):
+    RequestID: int
+    Success: bool
+    message: str
+
 
 # 好友列表相關模型
 class FriendListResponse(BaseModel):
@@ -138,6 +146,16 @@ class LeaderboardResponse(BaseModel):
     Progress: float
     AllTimeScore: float
 
+class MutualFriendsResponse(BaseModel):
+    UserID: int
+    MutualCount: int
+
+class FriendSuggestionResponse(BaseModel):
+    UserID: int
+    UserName: str
+    PhotoUrl: str
+    MutualCount: int
+
 # 認證相關模型
 class TokenResponse(BaseModel):
     access_token: str
@@ -234,16 +252,37 @@ class DetectionResponse(DetectionBase):
     DetectionID: int
     UserID: int
     Score: float
-    Torso: TorsoResponse
-    Feet: FeetResponse
-    Head: HeadResponse
-    Shoulder: ShoulderResponse
-    Neck: NeckResponse
+    # 缺少部位紀錄的偵測（例如舊資料）該部位為 null
+    Torso: Optional[TorsoResponse]
+    Feet: Optional[FeetResponse]
+    Head: Optional[HeadResponse]
+    Shoulder: Optional[ShoulderResponse]
+    Neck: Optional[NeckResponse]
 
     class Config:
         from_attributes = True
 
 
+# 偵測紀錄匯出格式（/detections/export）
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+    parquet = "parquet"
+
+# 統計 API 回應模型（由 DetectionRollup 計算）
+class DetectionStatsResponse(BaseModel):
+    BucketStart: date
+    SessionCount: int
+    TotalPredictions: int
+    TotalSeconds: int
+    Score: float
+    TorsoScore: float
+    FeetScore: float
+    HeadScore: float
+    ShoulderScore: float
+    NeckScore: float
+
+
 # 集合返回模型
 class UsersPublic(BaseModel):
     data: List[UserResponse]
@@ -0,0 +1,29 @@
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.tests.utils.utils import create_user, get_auth_token
+
+# 所有 API 測試共用一個 app 與資料庫；行程內的索引與快取只透過 API 更新，所以每個測試各自註冊新的使用者即可
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def register(client):
+    """
+    註冊一個新使用者並登入，回傳 (使用者資料, Authorization header)。
+    """
+    def register(password: str = "password123"):
+        username = f"user_{uuid.uuid4().hex[:12]}"
+        response = create_user(client, username, f"{username}@example.com", password)
+        assert response.status_code == 200, response.text
+        token = get_auth_token(client, username, password)
+        assert token.status_code == 200, token.text
+        return response.json(), {"Authorization": f"Bearer {token.json()['access_token']}"}
+    return register
+
@@ -0,0 +1,118 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.main import include_api_routers
+from app.api.deps import get_async_db, get_async_read_db
+from app.core.database import registry
+from app.tests.utils.utils import create_user, get_auth_token, detection_payload
+
+# 與 DB_ASYNC=true 時相同的路由註冊順序（async 版本優先），資料庫為同一個 SQLite 檔案的 aiosqlite engine
+ASYNC_ROUTES = [
+    ("POST", "/auth/token"),
+    ("POST", "/auth/refresh"),
+    ("GET", "/users/me"),
+    ("POST", "/detections/"),
+    ("POST", "/detections/batch"),
+    ("GET", "/detections/"),
+    ("GET", "/friends/"),
+    ("GET", "/friends/leaderboard"),
+]
+
+# 每次執行都不同的欄位，比較兩個版本的回應時忽略
+_VOLATILE_FIELDS = {"UserID", "UserName", "Email", "DetectionID", "access_token", "refresh_token"}
+
+
+@pytest.fixture(scope="module")
+def async_app():
+    async_engine = registry.get_async_engine("primary")
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_test_async_db():
+        async with session_factory() as db:
+            yield db
+
+    test_app = FastAPI()
+    include_api_routers(test_app, use_async=True)
+    test_app.dependency_overrides[get_async_db] = get_test_async_db
+    test_app.dependency_overrides[get_async_read_db] = get_test_async_db
+    with TestClient(test_app) as client:
+        yield test_app, client
+        # 連線屬於這個 client 的 event loop，在同一個 loop 上關閉
+        client.portal.call(async_engine.dispose)
+
+
+def _endpoint(test_app: FastAPI, method: str, path: str):
+    for route in test_app.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            return route.endpoint
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items() if key not in _VOLATILE_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _run_scenario(client) -> list:
+    """
+    以同一組請求走過登入、/users/me、偵測寫入與分頁、好友列表與排行榜，回傳 (請求, 狀態碼, 回應) 的列表。
+    """
+    outputs = []
+    users = []
+    for i in range(2):
+        registered = create_user(client, f"aio_{id(client)}_{i}", f"aio_{id(client)}_{i}@example.com", "password123")
+        assert registered.status_code == 200, registered.text
+        token = get_auth_token(client, registered.json()["UserName"], "password123")
+        outputs.append(("login", token.status_code, sorted(token.json())))
+        users.append((registered.json(), token.json()))
+    (_, tokens), (friend, friend_tokens) = users
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    friend_headers = {"Authorization": f"Bearer {friend_tokens['access_token']}"}
+
+    refreshed = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    outputs.append(("refresh", refreshed.status_code, sorted(refreshed.json())))
+
+    def record(name, response):
+        outputs.append((name, response.status_code, response.json()))
+        return response
+
+    record("create", client.post("/detections/", json=detection_payload("2024-12-20T09:00:00"), headers=headers))
+    record("batch", client.post("/detections/batch", json=[
+        detection_payload("2024-12-21T09:00:00", "00:10:00", 600),
+        detection_payload("2024-12-21T09:00:00", "00:05:00", 300),
+    ], headers=headers))
+    record("empty batch", client.post("/detections/batch", json=[], headers=headers))
+    page = record("page 1", client.get("/detections/", params={"limit": 2}, headers=headers))
+    outputs.append(("page 1 cursors", bool(page.headers.get("X-Next-Cursor")), bool(page.headers.get("X-Prev-Cursor"))))
+    page = record("page 2", client.get("/detections/", params={"limit": 2, "before": page.headers["X-Next-Cursor"]}, headers=headers))
+    outputs.append(("page 2 cursors", bool(page.headers.get("X-Next-Cursor")), bool(page.headers.get("X-Prev-Cursor"))))
+    record("me", client.get("/users/me", headers=headers))
+
+    assert client.post("/friends/requests", json={"ReceiverID": friend["UserID"]}, headers=headers).status_code == 200
+    request_id = client.get("/friends/requests/received", headers=friend_headers).json()[0]["RequestID"]
+    accepted = client.patch("/friends/requests", json=[{"RequestID": request_id, "Action": "Accept"}], headers=friend_headers)
+    assert accepted.json()[0]["Success"]
+    record("friends", client.get("/friends/", headers=headers))
+    record("leaderboard", client.get("/friends/leaderboard", params={"sortBy": "score"}, headers=headers))
+    record("unauthorized", client.get("/users/me"))
+    return outputs
+
+
+def test_async_routes_take_precedence(async_app):
+    test_app, _ = async_app
+    for method, path in ASYNC_ROUTES:
+        assert _endpoint(test_app, method, path).__module__.startswith("app.api.aio."), (method, path)
+
+
+def test_async_stack_matches_sync_stack(client, async_app):
+    """同一組請求在 sync 與 async 兩個版本的回應相同"""
+    _, async_client = async_app
+    sync_outputs = _normalize(_run_scenario(client))
+    async_outputs = _normalize(_run_scenario(async_client))
+    assert [name for name, *_ in async_outputs] == [name for name, *_ in sync_outputs]
+    for expected, actual in zip(sync_outputs, async_outputs):
+        assert actual == expected, expected[0]
@@ -0,0 +1,46 @@
+import io
+from PIL import Image
+from app.api.users import BASE_IMAGE_DIR
+from app.core.avatars import remove_avatar
+
+
+def _png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_upload_uses_detected_extension(client, register):
+    """原圖以 Pillow 判斷的格式存檔與回應，不使用客戶端提供的副檔名"""
+    user, headers = register()
+    response = client.post("/users/avatar", files={"file": ("avatar.html", _png_bytes(), "image/png")}, headers=headers)
+    assert response.status_code == 200, response.text
+    filename = response.json()["filename"]
+    try:
+        assert filename.endswith(".png")
+        image = client.get(f"/users/avatar/{filename}")
+        assert image.status_code == 200
+        assert image.headers["content-type"] == "image/png"
+    finally:
+        remove_avatar(BASE_IMAGE_DIR, filename)
+
+
+def test_invalid_upload_leaves_no_files(client, register):
+    user, headers = register()
+    before = set(BASE_IMAGE_DIR.iterdir())
+    response = client.post("/users/avatar", files={"file": ("avatar.png", b"not an image", "image/png")}, headers=headers)
+    assert response.status_code == 400
+    assert set(BASE_IMAGE_DIR.iterdir()) == before
+
+
+def test_new_upload_replaces_old_files(client, register):
+    user, headers = register()
+    upload = lambda: client.post("/users/avatar", files={"file": ("a.png", _png_bytes(), "image/png")}, headers=headers)
+    first = upload().json()["filename"]
+    second = upload().json()["filename"]
+    try:
+        assert not (BASE_IMAGE_DIR / first).exists()
+        assert (BASE_IMAGE_DIR / second).exists()
+        assert client.get("/users/me", headers=headers).json()["PhotoUrl"] == second
+    finally:
+        remove_avatar(BASE_IMAGE_DIR, second)
@@ -0,0 +1,260 @@
+import csv
+import io
+import json
+import pytest
+from sqlalchemy import event
+from app.api.deps import SessionLocal
+from app.core.database import engine
+from app.core.security import principal_cache
+from app.models import Detection, Torso, Feet, Head, Shoulder, Neck, DetectionRollup
+from app.tests.utils.utils import detection_payload
+
+PART_MODELS = (Torso, Feet, Head, Shoulder, Neck)
+
+
+class SQLLog:
+    """
+    記錄執行的 SQL 與 commit 次數；準備資料（註冊、登入）之後呼叫 reset() 再開始記錄。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.statements = []
+        self.commits = 0
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split()))
+
+    def commit(self, conn):
+        self.commits += 1
+
+    def matching(self, prefix: str) -> list:
+        return [statement for statement in self.statements if statement.upper().startswith(prefix)]
+
+
+@pytest.fixture
+def sql_log():
+    log = SQLLog()
+    event.listen(engine, "before_cursor_execute", log.before_cursor_execute)
+    event.listen(engine, "commit", log.commit)
+    yield log
+    event.remove(engine, "before_cursor_execute", log.before_cursor_execute)
+    event.remove(engine, "commit", log.commit)
+
+
+def _user_row(client, headers):
+    return client.get("/users/me", headers=headers).json()
+
+
+# region: POST /detections/batch
+def test_batch_writes_in_one_transaction(client, register, sql_log):
+    user, headers = register()
+    batch = [
+        detection_payload("2024-12-22T08:00:00", "00:01:50", 110),
+        detection_payload("2024-12-22T09:00:00", "00:10:00", 600),
+        detection_payload("2024-12-23T09:00:00", "01:00:00", 3600),
+    ]
+    sql_log.reset()
+    response = client.post("/detections/batch", json=batch, headers=headers)
+    assert response.status_code == 201, response.text
+    created = response.json()
+    assert [d["StartTime"] for d in created] == [d["StartTime"] for d in batch]
+
+    assert sql_log.commits == 1
+    # 每個部位表一個 executemany INSERT，User 只更新一次
+    for model in PART_MODELS:
+        assert len(sql_log.matching(f"INSERT INTO {model.__tablename__.upper()} ")) == 1
+    assert len(sql_log.matching("UPDATE USER ")) == 1
+
+    ids = [d["DetectionID"] for d in created]
+    with SessionLocal() as db:
+        assert db.query(Detection).filter(Detection.DetectionID.in_(ids)).count() == 3
+        for model in PART_MODELS:
+            assert db.query(model).filter(model.DetectionID.in_(ids)).count() == 3
+
+
+def test_ingest_keeps_cached_principal(client, register):
+    """偵測寫入不改變 UserID / UserName，快取的 Principal 不需要失效"""
+    user, headers = register()
+    token = headers["Authorization"].removeprefix("Bearer ")
+    assert _user_row(client, headers)["UserID"] == user["UserID"]
+    assert principal_cache.get(token) is not None
+    assert client.post("/detections/batch", json=[detection_payload("2024-12-22T08:00:00")], headers=headers).status_code == 201
+    assert principal_cache.get(token) is not None
+
+
+def test_batch_updates_user_aggregates_once(client, register):
+    user, headers = register()
+    batch = [
+        detection_payload("2024-12-22T08:00:00", "00:01:50", 100),
+        detection_payload("2024-12-22T09:00:00", "00:10:00", 300),
+    ]
+    created = client.post("/detections/batch", json=batch, headers=headers).json()
+
+    me = _user_row(client, headers)
+    assert me["TotalPredictionCount"] == 400
+    assert me["TotalDetectionTime"] == "00:11:50"
+    expected = (created[0]["Score"] * 100 + created[1]["Score"] * 300) / 400
+    assert me["AllTimeScore"] == pytest.approx(expected)
+
+
+def test_batch_adds_rollup_deltas(client, register):
+    user, headers = register()
+    batch = [
+        detection_payload("2024-12-22T08:00:00", "00:01:50", 110),
+        detection_payload("2024-12-22T09:00:00", "00:10:00", 600),
+        detection_payload("2024-12-23T09:00:00", "01:00:00", 3600),
+    ]
+    assert client.post("/detections/batch", json=batch, headers=headers).status_code == 201
+
+    stats = client.get("/detections/stats", params={"granularity": "day", "tz": "UTC"}, headers=headers).json()
+    assert [(s["BucketStart"], s["SessionCount"], s["TotalPredictions"], s["TotalSeconds"]) for s in stats] == [
+        ("2024-12-22", 2, 710, 710),
+        ("2024-12-23", 1, 3600, 3600),
+    ]
+    with SessionLocal() as db:
+        # UTC：2 個日區間、2 個週區間（12/22 為星期日）、1 個月區間
+        rollups = db.query(DetectionRollup).filter(DetectionRollup.UserID == user["UserID"], DetectionRollup.TimeZone == "UTC")
+        assert rollups.count() == 5
+
+
+@pytest.mark.parametrize("batch", [
+    [],
+    [detection_payload("2024-12-22T08:00:00"), {"StartTime": "not a date"}],
+])
+def test_invalid_batch_writes_nothing(client, register, sql_log, batch):
+    user, headers = register()
+    sql_log.reset()
+    response = client.post("/detections/batch", json=batch, headers=headers)
+    assert response.status_code == 422
+
+    assert sql_log.commits == 0
+    assert client.get("/detections/", headers=headers).json() == []
+    me = _user_row(client, headers)
+    assert me["TotalPredictionCount"] == 0
+    assert client.get("/detections/stats", headers=headers).json() == []
+# endregion
+
+
+# region: GET /detections/ keyset 分頁
+def _seed_history(client, headers) -> list:
+    """
+    建立 7 筆偵測，其中 3 筆的 StartTime 相同；回傳預期的排序（StartTime、DetectionID 由新到舊）的 DetectionID。
+    """
+    starts = [
+        "2024-12-20T09:00:00",
+        "2024-12-21T09:00:00",
+        "2024-12-21T09:00:00",
+        "2024-12-21T09:00:00",
+        "2024-12-22T09:00:00",
+        "2024-12-23T09:00:00",
+        "2024-12-24T09:00:00",
+    ]
+    created = client.post("/detections/batch", json=[detection_payload(start) for start in starts], headers=headers).json()
+    return [d["DetectionID"] for d in sorted(created, key=lambda d: (d["StartTime"], d["DetectionID"]), reverse=True)]
+
+
+def _page(client, headers, **params):
+    response = client.get("/detections/", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    ids = [d["DetectionID"] for d in response.json()]
+    return ids, response.headers.get("X-Next-Cursor"), response.headers.get("X-Prev-Cursor")
+
+
+def test_walk_pages_with_ties(client, register):
+    """StartTime 相同的資料以 DetectionID 排序，逐頁往舊資料走不會重複或遺漏"""
+    user, headers = register()
+    expected = _seed_history(client, headers)
+
+    pages = []
+    ids, next_cursor, prev_cursor = _page(client, headers, limit=2)
+    assert prev_cursor is None
+    pages.append(ids)
+    while next_cursor:
+        ids, next_cursor, prev_cursor = _page(client, headers, limit=2, before=next_cursor)
+        assert prev_cursor is not None
+        pages.append(ids)
+
+    assert [len(ids) for ids in pages] == [2, 2, 2, 1]
+    assert [i for ids in pages for i in ids] == expected
+    # 第二頁從三筆同時間的資料中間切開
+    assert pages[1][1] == expected[3]
+
+
+def test_walk_back_with_after(client, register):
+    """用 before 往舊資料走，再用 X-Prev-Cursor 與 after 走回來，每一頁都相同"""
+    user, headers = register()
+    expected = _seed_history(client, headers)
+
+    forward = [_page(client, headers, limit=3)]
+    while forward[-1][1]:
+        forward.append(_page(client, headers, limit=3, before=forward[-1][1]))
+    assert [ids for ids, _, _ in forward] == [expected[0:3], expected[3:6], expected[6:7]]
+
+    ids, next_cursor, prev_cursor = forward[-1]
+    backward = []
+    while prev_cursor:
+        ids, next_cursor, prev_cursor = _page(client, headers, limit=3, after=prev_cursor)
+        # 往回走時一定還有更舊的資料
+        assert next_cursor is not None
+        backward.append(ids)
+    assert backward == [expected[3:6], expected[0:3]]
+
+
+def test_date_range_bounds(client, register):
+    """from 包含、to 不包含，並且與 cursor 一起使用"""
+    user, headers = register()
+    expected = _seed_history(client, headers)
+
+    ids, next_cursor, _ = _page(client, headers, **{"from": "2024-12-21T09:00:00", "to": "2024-12-23T09:00:00"})
+    assert ids == expected[2:6]
+    assert next_cursor is None
+
+    ids, next_cursor, _ = _page(client, headers, limit=2, **{"from": "2024-12-21T09:00:00", "to": "2024-12-23T09:00:00"})
+    assert ids == expected[2:4]
+    ids, next_cursor, _ = _page(client, headers, limit=2, before=next_cursor, **{"from": "2024-12-21T09:00:00"})
+    assert ids == expected[4:6]
+    assert next_cursor is None
+
+
+@pytest.mark.parametrize("params", [
+    {"before": "garbage"},
+    {"before": "2024-12-21T09:00:00"},
+    {"after": "2024-13-01T00:00:00_1"},
+    {"after": "2024-12-21T09:00:00_abc"},
+    {"before": "2024-12-21T09:00:00_99999999999999999999999"},
+    {"before": "2024-12-21T09:00:00+08:00_1"},
+    {"before": "2024-12-21T09:00:00_1", "after": "2024-12-21T09:00:00_1"},
+])
+def test_malformed_cursor_is_400(client, register, params):
+    user, headers = register()
+    response = client.get("/detections/", params=params, headers=headers)
+    assert response.status_code == 400
+# endregion
+
+
+# region: 缺少部位紀錄
+def test_detection_without_part_row(client, register):
+    """缺少部位紀錄的偵測仍然出現在列表、單筆查詢與匯出中，該部位為 null"""
+    user, headers = register()
+    created = client.post("/detections/", json=detection_payload("2024-12-22T08:00:00"), headers=headers).json()
+    detection_id = created["DetectionID"]
+    with SessionLocal() as db:
+        db.query(Head).filter(Head.DetectionID == detection_id).delete()
+        db.commit()
+
+    listed, = client.get("/detections/", headers=headers).json()
+    assert listed["DetectionID"] == detection_id
+    assert listed["Head"] is None
+    assert listed["Neck"] == created["Neck"]
+    assert client.get(f"/detections/{detection_id}", headers=headers).json() == listed
+
+    ndjson = client.get("/detections/export", params={"format": "ndjson"}, headers=headers)
+    assert json.loads(ndjson.text) == listed
+    rows = list(csv.DictReader(io.StringIO(client.get("/detections/export", params={"format": "csv"}, headers=headers).text)))
+    assert len(rows) == 1
+    assert rows[0]["Head.BowedCount"] == ""
+    assert "Head.DetectionID" not in rows[0]
+# endregion
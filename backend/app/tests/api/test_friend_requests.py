@@ -0,0 +1,127 @@
+import pytest
+from sqlalchemy import event
+from app.api import friends
+from app.api.deps import SessionLocal
+from app.models import FriendList
+
+
+def _send_request(client, sender_headers, receiver):
+    response = client.post("/friends/requests", json={"ReceiverID": receiver["UserID"]}, headers=sender_headers)
+    assert response.status_code == 200, response.text
+
+
+def _received_ids(client, headers) -> list:
+    return [r["RequestID"] for r in client.get("/friends/requests/received", headers=headers).json()]
+
+
+def _friend_rows(user_id1, user_id2) -> list:
+    with SessionLocal() as db:
+        return sorted(
+            db.query(FriendList.UserID1, FriendList.UserID2)
+              .filter(FriendList.UserID1.in_([user_id1, user_id2]), FriendList.UserID2.in_([user_id1, user_id2]))
+              .all()
+        )
+
+
+def _bulk(client, headers, actions):
+    response = client.patch("/friends/requests", json=actions, headers=headers)
+    assert response.status_code == 200, response.text
+    return [(r["RequestID"], r["Success"], r["message"]) for r in response.json()]
+
+
+def test_accept_inserts_both_directions_once(client, register):
+    receiver, receiver_headers = register()
+    senders = [register() for _ in range(2)]
+    for _, sender_headers in senders:
+        _send_request(client, sender_headers, receiver)
+    request_ids = _received_ids(client, receiver_headers)
+
+    results = _bulk(client, receiver_headers, [{"RequestID": i, "Action": "Accept"} for i in request_ids])
+    assert [success for _, success, _ in results] == [True, True]
+    for sender, _ in senders:
+        assert _friend_rows(receiver["UserID"], sender["UserID"]) == sorted([
+            (receiver["UserID"], sender["UserID"]), (sender["UserID"], receiver["UserID"]),
+        ])
+    friend_ids = {f["UserID"] for f in client.get("/friends/", headers=receiver_headers).json()}
+    assert friend_ids == {sender["UserID"] for sender, _ in senders}
+
+
+def test_foreign_request_id(client, register):
+    """別人收到的邀請不能處理，也不會影響同一批的其他邀請"""
+    receiver, receiver_headers = register()
+    other, other_headers = register()
+    sender, sender_headers = register()
+    _send_request(client, sender_headers, receiver)
+    _send_request(client, sender_headers, other)
+    own_id, = _received_ids(client, receiver_headers)
+    foreign_id, = _received_ids(client, other_headers)
+
+    results = _bulk(client, receiver_headers, [
+        {"RequestID": foreign_id, "Action": "Accept"},
+        {"RequestID": own_id, "Action": "Decline"},
+    ])
+    assert results[0] == (foreign_id, False, "好友邀請不存在或無權處理")
+    assert results[1][:2] == (own_id, True)
+    # 別人的邀請仍然是待處理
+    assert _received_ids(client, other_headers) == [foreign_id]
+    assert _friend_rows(other["UserID"], sender["UserID"]) == []
+
+
+def test_already_handled_request(client, register):
+    receiver, receiver_headers = register()
+    sender, sender_headers = register()
+    _send_request(client, sender_headers, receiver)
+    request_id, = _received_ids(client, receiver_headers)
+    assert _bulk(client, receiver_headers, [{"RequestID": request_id, "Action": "Decline"}])[0][1]
+
+    results = _bulk(client, receiver_headers, [{"RequestID": request_id, "Action": "Accept"}])
+    assert results == [(request_id, False, "好友邀請已處理")]
+    assert _friend_rows(receiver["UserID"], sender["UserID"]) == []
+
+
+def test_duplicate_request_id_in_payload(client, register):
+    """同一批重複的 RequestID 只處理第一筆"""
+    receiver, receiver_headers = register()
+    sender, sender_headers = register()
+    _send_request(client, sender_headers, receiver)
+    request_id, = _received_ids(client, receiver_headers)
+
+    results = _bulk(client, receiver_headers, [
+        {"RequestID": request_id, "Action": "Accept"},
+        {"RequestID": request_id, "Action": "Decline"},
+    ])
+    assert [(success, message) for _, success, message in results][1] == (False, "重複的好友邀請")
+    assert results[0][1]
+    assert len(_friend_rows(receiver["UserID"], sender["UserID"])) == 2
+
+
+def test_indexes_update_only_after_commit(client, register, monkeypatch):
+    """好友鄰接表與排行榜快取在 commit 成功之後才更新；commit 失敗時不更新"""
+    receiver, receiver_headers = register()
+    sender, sender_headers = register()
+    _send_request(client, sender_headers, receiver)
+    request_id, = _received_ids(client, receiver_headers)
+
+    calls = []
+    monkeypatch.setattr(friends.friend_graph, "add_friendship",
+                        lambda *ids: calls.append(("graph", _friend_rows(*ids))))
+    monkeypatch.setattr(friends, "invalidate_friendships",
+                        lambda *ids: calls.append(("leaderboard", _friend_rows(*ids))))
+
+    def fail_commit(session):
+        raise RuntimeError("commit failed")
+
+    event.listen(SessionLocal, "before_commit", fail_commit)
+    try:
+        with pytest.raises(RuntimeError):
+            client.patch("/friends/requests", json=[{"RequestID": request_id, "Action": "Accept"}], headers=receiver_headers)
+    finally:
+        event.remove(SessionLocal, "before_commit", fail_commit)
+    assert calls == []
+    assert _received_ids(client, receiver_headers) == [request_id]
+
+    assert _bulk(client, receiver_headers, [{"RequestID": request_id, "Action": "Accept"}])[0][1]
+    # 兩個 hook 執行時，另一條連線已經看得到 commit 的好友關係
+    assert [name for name, _ in calls] == ["graph", "leaderboard"]
+    for _, rows in calls:
+        assert len(rows) == 2
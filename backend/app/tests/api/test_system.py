@@ -0,0 +1,24 @@
+import pytest
+from app.api import deps
+
+
+@pytest.mark.parametrize("path", ["/system/db-pool", "/system/ws-queues", "/system/bcrypt"])
+def test_system_requires_login(client, path):
+    assert client.get(path).status_code == 401
+
+
+def test_ws_queues_only_aggregates(client, register):
+    user, headers = register()
+    response = client.get("/system/ws-queues", headers=headers)
+    assert response.status_code == 200
+    assert set(response.json()) == {"connections", "depth", "max_depth", "sent", "dropped", "coalesced", "overflowed"}
+
+
+def test_ws_queues_detail_requires_admin(client, register, monkeypatch):
+    user, headers = register()
+    assert client.get("/system/ws-queues", params={"detail": True}, headers=headers).status_code == 403
+
+    monkeypatch.setattr(deps, "SYSTEM_ADMIN_USERS", frozenset({user["UserName"]}))
+    response = client.get("/system/ws-queues", params={"detail": True}, headers=headers)
+    assert response.status_code == 200
+    assert isinstance(response.json(), dict)
@@ -0,0 +1,80 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from app import main
+from app.core import posture_stream
+
+
+class FakeClock:
+    """
+    取代 posture_stream 中的 datetime，讓 utcnow() 回傳測試指定的時間。
+    """
+
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def install(self, monkeypatch):
+        clock = self
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return clock.now
+
+        monkeypatch.setattr(posture_stream, "datetime", FakeDatetime)
+
+
+def _token(headers: dict) -> str:
+    return headers["Authorization"].split()[1]
+
+
+def _wait_for_predictions(client, headers, predictions: int, timeout: float = 2.0):
+    # 斷線後的最後一次寫入在伺服器端的背景執行，等到寫入完成或逾時
+    deadline = time.monotonic() + timeout
+    while True:
+        detections = client.get("/detections/", headers=headers).json()
+        if (detections and detections[0]["TotalPredictions"] == predictions) or time.monotonic() > deadline:
+            return detections
+        time.sleep(0.02)
+
+
+def test_stream_session_is_one_detection(client, register, monkeypatch):
+    """一個串流 session 經過多次 checkpoint 仍然只有一筆 Detection，TotalTime 為整個 session 的時間"""
+    start = datetime(2024, 12, 22, 9, 0, 0)
+    clock = FakeClock(start)
+    clock.install(monkeypatch)
+    monkeypatch.setattr(main, "POSTURE_CHECKPOINT_SECONDS", 60)
+    user, headers = register()
+    token = _token(headers)
+
+    with client.websocket_connect(f"/ws/viewer?token={token}") as viewer:
+        with client.websocket_connect(f"/ws/phone?token={token}") as phone:
+            # 每則姿勢訊息之後送一則一般訊息，viewer 收到時代表伺服器已處理完前面的訊息（包含 checkpoint）
+            for seconds, message in ((0, "P:11221,11221"), (70, "P:01020"), (130, "P:11221"), (140, "P:11221")):
+                clock.now = start + timedelta(seconds=seconds)
+                phone.send_text(message)
+                phone.send_text(f"sync {seconds}")
+                assert viewer.receive_text() == f"sync {seconds}"
+
+            detections = client.get("/detections/", headers=headers).json()
+            # 70 秒與 130 秒時各有一次 checkpoint，都寫在同一筆 Detection
+            assert len(detections) == 1
+            assert detections[0]["TotalPredictions"] == 4
+
+    # 140 秒的幀沒有到 checkpoint 間隔，在斷線時寫入
+    detections = _wait_for_predictions(client, headers, 5)
+    assert len(detections) == 1
+    detection = detections[0]
+    assert detection["TotalPredictions"] == 5
+    assert detection["StartTime"] == "2024-12-22T09:00:00"
+    assert detection["EndTime"] == "2024-12-22T09:02:20"
+    assert detection["TotalTime"] == "00:02:20"
+    assert detection["Head"]["NeutralCount"] == 4 and detection["Head"]["BowedCount"] == 1
+
+    me = client.get("/users/me", headers=headers).json()
+    assert me["TotalPredictionCount"] == 5
+    assert me["TotalDetectionTime"] == "00:02:20"
+    assert me["AllTimeScore"] == pytest.approx(detection["Score"])
+
+    stats = client.get("/detections/stats", params={"granularity": "day", "tz": "UTC"}, headers=headers).json()
+    assert [(s["SessionCount"], s["TotalPredictions"], s["TotalSeconds"]) for s in stats] == [(1, 5, 140)]
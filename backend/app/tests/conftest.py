@@ -1,3 +1,10 @@
+import os
+import tempfile
+
+# app 在 import 時就依環境變數建立 engine，未指定時使用暫存的 SQLite 資料庫；測試中的密碼雜湊使用最低成本
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
 import pytest
 from httpx import AsyncClient
 from app.main import app
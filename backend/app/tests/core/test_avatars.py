@@ -0,0 +1,85 @@
+import io
+import pytest
+from PIL import Image
+from app.core.avatars import (
+    save_upload, build_variants, remove_avatar, variant_name, pick_variant_size, find_avatar, etag_matches,
+    IMMUTABLE_CACHE_CONTROL,
+)
+
+
+def _png_bytes(width=800, height=600):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_build_variants(tmp_path):
+    """測試上傳後產生 48 / 128 / 512 的正方形縮圖"""
+    path = save_upload(io.BytesIO(_png_bytes()), tmp_path)
+    original, filenames = build_variants(str(path), sizes=(48, 128, 512))
+    assert original == f"{path.stem}.png"
+    assert sorted(filenames) == sorted(variant_name(original, size) for size in (48, 128, 512))
+    for size in (48, 128, 512):
+        with Image.open(tmp_path / variant_name(original, size)) as image:
+            assert image.size == (size, size)
+    assert (tmp_path / variant_name(original, 48)).stat().st_size < (tmp_path / original).stat().st_size
+
+    remove_avatar(tmp_path, original)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_upload_size_limit(tmp_path):
+    with pytest.raises(ValueError):
+        save_upload(io.BytesIO(b"x" * 100), tmp_path, max_bytes=10)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_invalid_image(tmp_path):
+    path = save_upload(io.BytesIO(b"not an image"), tmp_path)
+    with pytest.raises(ValueError):
+        build_variants(str(path))
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+
+def test_extension_follows_detected_format(tmp_path):
+    """原圖的副檔名依實際內容決定，與客戶端提供的檔名無關"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(buffer, "JPEG")
+    buffer.seek(0)
+    path = save_upload(buffer, tmp_path)
+    original, _ = build_variants(str(path), sizes=(48,))
+    assert original.endswith(".jpg")
+    assert not path.exists()
+    assert find_avatar(tmp_path, original).media_type == "image/jpeg"
+
+
+def test_pick_variant_size():
+    assert pick_variant_size(40) == 48
+    assert pick_variant_size(48) == 48
+    assert pick_variant_size(100) == 128
+    assert pick_variant_size(2000) == 512
+
+
+def test_find_avatar_is_cached(tmp_path):
+    """測試上傳的檔名使用檔名當 ETag，讀過一次後不再讀取檔案"""
+    path = save_upload(io.BytesIO(_png_bytes(64, 64)), tmp_path)
+    path = tmp_path / build_variants(str(path), sizes=(48,))[0]
+    image = find_avatar(tmp_path, path.name)
+    assert image.etag == f'"{path.name}"'
+    assert image.cache_control == IMMUTABLE_CACHE_CONTROL
+    assert image.media_type == "image/png"
+    path.unlink()
+    assert find_avatar(tmp_path, path.name).content == image.content
+
+    remove_avatar(tmp_path, path.name)
+    assert find_avatar(tmp_path, path.name) is None
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
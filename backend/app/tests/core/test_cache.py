@@ -0,0 +1,57 @@
+import time
+from app.core.cache import TTLCache, ByteBudgetCache
+from app.core.security import Principal, PrincipalCache
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 變成最近使用
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(maxsize=10, ttl_seconds=60)
+    cache.set("a", 1, ttl_seconds=0.01)
+    cache.set("b", 2, ttl_seconds=-1)  # 已過期的資料不會寫入
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert "b" not in cache
+
+
+def test_principal_cache_invalidate_user():
+    """測試使用者資料變動時清除該使用者所有 token"""
+    cache = PrincipalCache(maxsize=10, ttl_seconds=60)
+    exp = time.time() + 3600
+    cache.set("t1", Principal(UserID=1, UserName="u1"), exp)
+    cache.set("t2", Principal(UserID=1, UserName="u1"), exp)
+    cache.set("t3", Principal(UserID=2, UserName="u2"), exp)
+    cache.invalidate_user(1)
+    assert cache.get("t1") is None
+    assert cache.get("t2") is None
+    assert cache.get("t3") == Principal(UserID=2, UserName="u2")
+
+
+def test_principal_cache_respects_token_exp():
+    cache = PrincipalCache(maxsize=10, ttl_seconds=60)
+    cache.set("expired", Principal(UserID=1, UserName="u1"), time.time() - 1)
+    assert cache.get("expired") is None
+
+
+def test_byte_budget_cache():
+    cache = ByteBudgetCache(max_bytes=10, max_item_bytes=6)
+    assert cache.set("a", b"aaaa", 4)
+    assert cache.set("b", b"bbbb", 4)
+    assert not cache.set("big", b"x" * 7, 7)  # 超過單筆上限不快取
+    cache.get("a")  # a 變成最近使用
+    cache.set("c", b"cccc", 4)  # 超過總量，淘汰最久沒用的 b
+    assert "b" not in cache
+    assert cache.get("a") == b"aaaa"
+    assert cache.total_bytes == 8
+    cache.pop("a")
+    assert cache.total_bytes == 4
+
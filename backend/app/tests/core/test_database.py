@@ -0,0 +1,47 @@
+from sqlalchemy import text
+from app.core.database import EngineRegistry, to_async_url
+
+
+def test_to_async_url():
+    assert to_async_url("mysql+pymysql://user:pw@db:3306/app") == "mysql+aiomysql://user:pw@db:3306/app"
+    assert to_async_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+
+
+def test_replica_routing(tmp_path):
+    """用兩個 SQLite 檔案模擬 primary 與 replica"""
+    registry = EngineRegistry(f"sqlite:///{tmp_path / 'primary.db'}", f"sqlite:///{tmp_path / 'replica.db'}")
+    for role, value in (("primary", "written"), ("replica", "replicated")):
+        with registry.get_engine(role).begin() as conn:
+            conn.execute(text("CREATE TABLE t (v TEXT)"))
+            conn.execute(text("INSERT INTO t VALUES (:v)"), {"v": value})
+
+    with registry.get_engine("replica").connect() as conn:
+        assert conn.execute(text("SELECT v FROM t")).scalar() == "replicated"
+    assert registry.get_engine("primary") is not registry.get_engine("replica")
+
+    status = registry.pool_status()
+    assert status["primary"]["checkouts"] >= 1
+    assert status["replica"]["checked_out"] == 0
+    registry.dispose()
+
+
+def test_replica_defaults_to_primary(tmp_path):
+    registry = EngineRegistry(f"sqlite:///{tmp_path / 'primary.db'}")
+    assert registry.get_engine("replica") is registry.get_engine("primary")
+
+
+def test_pool_saturation_counted(tmp_path):
+    registry = EngineRegistry(f"sqlite:///{tmp_path / 'primary.db'}", pool_size=1, max_overflow=0, pool_timeout=0.05)
+    engine = registry.get_engine()
+    held = engine.connect()
+    try:
+        try:
+            engine.connect()
+        except Exception:
+            pass
+    finally:
+        held.close()
+    stats = registry.pool_status()["primary"]
+    assert stats["saturated_checkouts"] == 1
+    assert stats["timeouts"] == 1
+    registry.dispose()
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+import pytest
+from datetime import datetime, time
+from app.core import exports
+from app.core.exports import column_names, ndjson_chunks, csv_chunks, parquet_chunks, require_parquet
+from app.models import Detection, Head
+
+COLUMNS = [Detection.DetectionID, Detection.StartTime, Detection.TotalTime, Detection.Score, Head.BowedCount]
+ROWS = [
+    (1, datetime(2024, 12, 22, 17, 32, 42), time(0, 1, 50), 80.5, 15),
+    (2, datetime(2024, 12, 22, 18, 0, 0, 500), time(0, 2, 0), 90.0, 3),
+    (3, datetime(2024, 12, 23, 9, 0, 0), time(0, 0, 30), 70.25, 0),
+]
+
+
+def _partitions(size=2):
+    return (ROWS[start:start + size] for start in range(0, len(ROWS), size))
+
+
+def test_column_names():
+    assert column_names(COLUMNS, Detection) == ["DetectionID", "StartTime", "TotalTime", "Score", "Head.BowedCount"]
+
+
+def test_ndjson_one_chunk_per_partition():
+    chunks = list(ndjson_chunks(_partitions(), lambda row: {"DetectionID": row[0], "StartTime": row[1]}))
+    assert len(chunks) == 2
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line) for line in lines][1] == {"DetectionID": 2, "StartTime": "2024-12-22T18:00:00.000500"}
+
+
+def test_csv_chunks():
+    names = column_names(COLUMNS, Detection)
+    chunks = list(csv_chunks(_partitions(), COLUMNS, names))
+    assert len(chunks) == 2
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+    assert rows[0] == names
+    assert rows[1] == ["1", "2024-12-22T17:32:42", "00:01:50", "80.5", "15"]
+    assert len(rows) == len(ROWS) + 1
+
+
+def test_csv_header_without_rows():
+    chunks = list(csv_chunks(iter([]), COLUMNS, column_names(COLUMNS, Detection)))
+    assert b"".join(chunks).decode().splitlines() == ["DetectionID,StartTime,TotalTime,Score,Head.BowedCount"]
+
+
+def test_parquet_chunks():
+    parquet = pytest.importorskip("pyarrow.parquet")
+    names = column_names(COLUMNS, Detection)
+    chunks = list(parquet_chunks(_partitions(), COLUMNS, names))
+    table = parquet.read_table(io.BytesIO(b"".join(chunks)))
+    assert table.column_names == names
+    assert table.num_rows == len(ROWS)
+    assert table.column("StartTime").to_pylist()[1] == ROWS[1][1]
+    assert table.column("Head.BowedCount").to_pylist() == [15, 3, 0]
+
+
+def test_parquet_requires_pyarrow(monkeypatch):
+    monkeypatch.setattr(exports, "pyarrow", None)
+    with pytest.raises(exports.HTTPException) as error:
+        require_parquet()
+    assert error.value.status_code == 501
@@ -0,0 +1,159 @@
+import threading
+import time
+from app.core.indexes import ScoreRankIndex, UsernameIndex, FriendGraph
+
+
+def make_rank_index():
+    index = ScoreRankIndex()
+    index.load_scores([(1, 0.5), (2, 0.9), (3, 0.5), (4, None), (5, 0.7)])
+    return index
+
+
+def test_percentile_rank():
+    """測試 PR 值與 COUNT(AllTimeScore <= x) / COUNT(*) 相同"""
+    index = make_rank_index()
+    assert index.percentile_rank(0.5) == 60.0
+    assert index.percentile_rank(0.9) == 100.0
+    assert index.percentile_rank(0.0) == 20.0
+
+
+class BlockingRankIndex(ScoreRankIndex):
+    """_load 會等到 release 才完成，模擬很慢的全表查詢"""
+
+    def __init__(self):
+        super().__init__(refresh_seconds=1)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.loads = 0
+
+    def _load(self, db):
+        self.loads += 1
+        self.started.set()
+        assert self.release.wait(5)
+        self.load_scores([(1, 0.1), (2, 0.2)])
+
+
+def test_reload_does_not_block_readers():
+    """重新載入時查詢在鎖外執行：讀取不會被擋住，同時只有一個執行緒在載入"""
+    index = BlockingRankIndex()
+    index.load_scores([(1, 0.5)])
+    index._loaded_at = time.monotonic() - 10  # 已過期
+
+    loader = threading.Thread(target=index.ensure_loaded, args=(None,))
+    loader.start()
+    assert index.started.wait(5)
+
+    reader = threading.Thread(target=lambda: (index.ensure_loaded(None), index.percentile_rank(0.5)))
+    reader.start()
+    reader.join(1)
+    assert not reader.is_alive()
+    assert index.loads == 1
+    assert index.percentile_rank(0.5) == 100.0
+
+    index.release.set()
+    loader.join(5)
+    assert len(index) == 2
+    assert index.loads == 1
+
+
+def test_update_keeps_order():
+    index = make_rank_index()
+    index.update(4, 0.95)
+    assert index.rank_of(4) == 1
+    assert index.rank_of(2) == 2
+    assert [user_id for _, user_id, _ in index.page(0, 3)] == [4, 2, 5]
+    index.update(6, 0.1)
+    assert len(index) == 6
+    assert index.rank_of(6) == 6
+
+
+def test_page_and_around():
+    index = make_rank_index()
+    assert index.page(0, 2) == [(1, 2, 0.9), (2, 5, 0.7)]
+    assert [rank for rank, _, _ in index.page(3, 10)] == [4, 5]
+    assert index.page(10, 5) == []
+    around = index.around(5, 1)
+    assert [user_id for _, user_id, _ in around] == [2, 5, 3]
+    assert index.around(99, 1) == []
+
+
+def make_username_index():
+    index = UsernameIndex()
+    index.load_names([(1, "Alice"), (2, "alicia"), (3, "MalIce"), (4, "bob"), (5, "ali"), (6, "xxalixx")])
+    return index
+
+
+def test_username_search_prefix_first():
+    """測試完全相同、前綴、包含的排序"""
+    index = make_username_index()
+    assert index.search("ali", 10) == [5, 1, 2, 3, 6]
+    assert index.search("ALIC", 10) == [1, 2, 3]
+    assert index.search("lic", 10) == [1, 2, 3]
+    assert index.search("al", 10) == [5, 1, 2]  # 少於 3 個字只做前綴搜尋
+    assert index.search("zzz", 10) == []
+    assert index.search("ali", 2) == [5, 1]
+
+
+def test_username_index_updates():
+    index = make_username_index()
+    index.add(4, "bobalice")   # 改名
+    index.add(7, "alina")      # 新使用者
+    assert 4 in index.search("alice", 10)
+    assert index.search("bob", 10) == [4]
+    assert index.search("alin", 10) == [7]
+    index.remove(7)
+    assert index.search("alin", 10) == []
+    assert len(index) == 6
+
+
+def make_friend_graph():
+    graph = FriendGraph()
+    # FriendList 每組好友兩筆
+    edges = [(1, 2), (1, 3), (2, 4), (3, 4), (2, 5), (4, 6)]
+    graph.load_edges(edges + [(b, a) for a, b in edges])
+    return graph
+
+
+def test_friend_graph_queries():
+    graph = make_friend_graph()
+    assert graph.friends_of(1) == {2, 3}
+    assert graph.is_friend(4, 2) and not graph.is_friend(1, 4)
+    assert graph.mutual_friends(1, 4) == {2, 3}
+    assert graph.mutual_counts(1, [4, 5, 6, 99]) == {4: 2, 5: 1, 6: 0, 99: 0}
+    # 4 有兩位共同好友排第一，5 只有一位
+    assert graph.suggestions(1, 10) == [(4, 2), (5, 1)]
+    assert graph.suggestions(1, 1) == [(4, 2)]
+
+
+def test_friend_graph_updates():
+    graph = make_friend_graph()
+    graph.add_friendship(1, 4)
+    assert graph.is_friend(4, 1)
+    assert graph.suggestions(1, 10) == [(5, 1), (6, 1)]
+    graph.remove_friendship(1, 4)
+    assert graph.friends_of(1) == {2, 3}
+
+
+
+def test_suggestions_while_friends_change():
+    """其他執行緒同時新增 / 移除好友時，suggestions 不會因為集合在迭代中改變而失敗"""
+    graph = make_friend_graph()
+    stop = threading.Event()
+
+    def churn():
+        friend_id = 1000
+        while not stop.is_set():
+            graph.add_friendship(1, friend_id)
+            graph.remove_friendship(1, friend_id)
+            friend_id += 1
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        for _ in range(2000):
+            graph.suggestions(1, 10)
+            graph.is_friend(1, 2)
+    finally:
+        stop.set()
+        writer.join()
+    assert graph.suggestions(1, 10) == [(4, 2), (5, 1)]
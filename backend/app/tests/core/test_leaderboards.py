@@ -0,0 +1,41 @@
+import time
+from app.core.leaderboards import FriendLeaderboardCache
+
+SORTS = ("level", "score")
+
+
+def _rows(*user_ids):
+    return [{"UserID": user_id} for user_id in user_ids]
+
+
+def test_invalidate_member_drops_every_board_containing_it():
+    cache = FriendLeaderboardCache(maxsize=100, ttl_seconds=60)
+    cache.set(1, "score", _rows(1, 2, 3), [1, 2, 3], time.monotonic())
+    cache.set(4, "score", _rows(4, 2), [4, 2], time.monotonic())
+    cache.set(5, "score", _rows(5, 6), [5, 6], time.monotonic())
+
+    cache.invalidate_member(2, SORTS)
+    assert cache.get(1, "score") is None
+    assert cache.get(4, "score") is None
+    assert cache.get(5, "score") == _rows(5, 6)
+
+
+def test_invalidate_owner_only_drops_own_board():
+    cache = FriendLeaderboardCache(maxsize=100, ttl_seconds=60)
+    cache.set(1, "level", _rows(1, 2), [1, 2], time.monotonic())
+    cache.set(2, "level", _rows(2, 1), [2, 1], time.monotonic())
+
+    cache.invalidate_owner(1, SORTS)
+    assert cache.get(1, "level") is None
+    assert cache.get(2, "level") == _rows(2, 1)
+    # 已清除的排行榜也從反向索引移除
+    assert cache._owners_by_member == {1: {2}, 2: {2}}
+
+
+def test_stale_load_is_not_cached():
+    """查詢期間成員被清除時，查到的結果不寫入快取"""
+    cache = FriendLeaderboardCache(maxsize=100, ttl_seconds=60)
+    loaded_at = time.monotonic()
+    cache.invalidate_member(2, SORTS)
+    cache.set(1, "score", _rows(1, 2), [1, 2], loaded_at)
+    assert cache.get(1, "score") is None
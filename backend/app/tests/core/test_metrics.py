@@ -0,0 +1,69 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core.metrics import MetricsMiddleware, MetricsRegistry, RouteSeries, UNMATCHED_ROUTE, LATENCY_BUCKETS
+
+
+def _client(registry):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.post("/items/{item_id}")
+    def create_item(item_id: int, body: dict):
+        return {"item_id": item_id, **body}
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def test_route_series_buckets():
+    series = RouteSeries()
+    series.observe(0.001, 10, 20)
+    series.observe(0.3, 0, 5)
+    series.observe(60, 0, 0)
+    assert series.buckets[0] == 1
+    assert series.buckets[LATENCY_BUCKETS.index(0.5)] == 1
+    assert series.buckets[-1] == 1  # +Inf
+    assert series.count == 3 and series.request_bytes == 10 and series.response_bytes == 25
+
+
+def test_middleware_records_route_templates():
+    registry = MetricsRegistry()
+    client = _client(registry)
+    for item_id in (1, 2, 3):
+        assert client.post(f"/items/{item_id}", json={"name": "x"}).status_code == 200
+    assert client.post("/items/abc", json={}).status_code == 422
+    assert client.get("/missing").status_code == 404
+    assert client.get("/boom").status_code == 500
+
+    # 不同的 item_id 共用同一個路由樣板
+    series = registry.series("POST", "/items/{item_id}", 200)
+    assert series.count == 3
+    assert series.request_bytes == 3 * len(b'{"name":"x"}')
+    assert series.response_bytes > 0
+    assert registry.series("POST", "/items/{item_id}", 422).count == 1
+    assert registry.series("GET", UNMATCHED_ROUTE, 404).count == 1
+    assert registry.series("GET", "/boom", 500).count == 1
+    assert registry.in_flight == 0
+
+    text = registry.render()
+    assert 'http_request_duration_seconds_count{method="POST",route="/items/{item_id}",status="200"} 3' in text
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/items/{item_id}",status="200",le="+Inf"} 3' in text
+    assert "http_requests_in_flight 0" in text
+
+
+def test_websocket_counters():
+    registry = MetricsRegistry()
+    registry.ws_connected("phone")
+    registry.ws_connected("viewer")
+    registry.ws_message("phone", "binary")
+    registry.ws_message("hacker", "text")
+    registry.ws_disconnected("viewer")
+    text = registry.render()
+    assert 'websocket_connections_active{role="phone"} 1' in text
+    assert 'websocket_connections_active{role="viewer"} 0' in text
+    assert 'websocket_connections_total{role="viewer"} 1' in text
+    assert 'websocket_messages_received_total{role="phone",kind="binary"} 1' in text
+    assert 'websocket_messages_received_total{role="other",kind="text"} 1' in text
@@ -0,0 +1,97 @@
+import pytest
+from datetime import datetime, timedelta
+from app.core.posture_stream import (
+    PostureAccumulator, is_posture_message, is_posture_frame, encode_posture_frames, decode_posture_frames,
+)
+
+
+def test_accumulate_frames():
+    """測試串流訊息累計成 DetectionCreate"""
+    start = datetime(2024, 12, 22, 9, 0, 0)
+    acc = PostureAccumulator(now=start)
+    assert acc.add_message("P:11221,01020", now=start) == 2
+    acc.add_message("P:11221", now=start + timedelta(seconds=30))
+
+    data = acc.to_detection_create()
+    assert data.TotalPredictions == 3
+    assert data.Head.NeutralCount == 2
+    assert data.Head.BowedCount == 1
+    assert data.Neck.NeutralCount == 3
+    assert data.Torso.NeutralCount == 3
+    assert data.Feet.FlatCount == 2
+    assert data.Feet.AnkleOnKneeCount == 1
+    assert data.TotalTime.second == 30
+
+
+def test_checkpoint_and_reset():
+    """測試 checkpoint 時間判斷與重置"""
+    start = datetime(2024, 12, 22, 9, 0, 0)
+    acc = PostureAccumulator(now=start)
+    assert not acc.should_checkpoint(60, now=start + timedelta(seconds=120))
+
+    acc.add_message("P:11221", now=start)
+    assert not acc.should_checkpoint(60, now=start + timedelta(seconds=59))
+    assert acc.should_checkpoint(60, now=start + timedelta(seconds=60))
+
+    acc.reset(now=start + timedelta(seconds=60))
+    assert acc.to_detection_create() is None
+    assert not acc.should_checkpoint(60, now=start + timedelta(seconds=200))
+
+
+def test_checkpoints_keep_session_totals():
+    """測試 checkpoint 之後計數不歸零，只有新的幀才需要再寫入"""
+    start = datetime(2024, 12, 22, 9, 0, 0)
+    acc = PostureAccumulator(now=start)
+    acc.add_message("P:11221", now=start)
+    first = acc.to_detection_create()
+    acc.mark_saved(1, first, now=start + timedelta(seconds=60))
+    assert not acc.has_unsaved_frames()
+    assert not acc.should_checkpoint(60, now=start + timedelta(seconds=300))
+
+    acc.add_message("P:01020", now=start + timedelta(seconds=150))
+    assert acc.should_checkpoint(60, now=start + timedelta(seconds=150))
+    data = acc.to_detection_create()
+    assert acc.detection_id == 1
+    assert data.TotalPredictions == 2
+    assert data.TotalTime.minute == 2 and data.TotalTime.second == 30
+
+
+@pytest.mark.parametrize("message", ["P:1122", "P:11a21", "P:91221", "P:11229"])
+def test_invalid_message(message):
+    """測試無效的姿勢訊息不會被累計"""
+    acc = PostureAccumulator()
+    with pytest.raises(ValueError):
+        acc.add_message(message)
+    assert acc.frame_count == 0
+
+
+def test_is_posture_message():
+    assert is_posture_message("P:11221")
+    assert not is_posture_message('{"sdp": {}}')
+
+
+def test_binary_posture_frames():
+    """測試二進位姿勢訊息與文字訊息累計結果相同"""
+    data = encode_posture_frames([[1, 1, 2, 2, 1], [0, 1, 0, 2, 0]])
+    assert len(data) == 3 + 2 * 5
+    assert is_posture_frame(data)
+    assert decode_posture_frames(data) == [bytes([1, 1, 2, 2, 1]), bytes([0, 1, 0, 2, 0])]
+
+    start = datetime(2024, 12, 22, 9, 0, 0)
+    text_acc, binary_acc = PostureAccumulator(now=start), PostureAccumulator(now=start)
+    text_acc.add_message("P:11221,01020", now=start)
+    assert binary_acc.add_binary(data, now=start) == 2
+    assert binary_acc.counts == text_acc.counts
+
+
+@pytest.mark.parametrize("data", [
+    b"\x01\x00\x02" + bytes([1, 1, 2, 2, 1]),   # 幀數與長度不符
+    encode_posture_frames([[1, 1, 2, 2, 9]]),     # 標籤超出範圍
+    b"\x02\x00\x01" + bytes([1, 1, 2, 2, 1]),   # 不是姿勢訊息
+])
+def test_invalid_binary_frames(data):
+    acc = PostureAccumulator()
+    with pytest.raises(ValueError):
+        acc.add_binary(data)
+    assert acc.frame_count == 0
+
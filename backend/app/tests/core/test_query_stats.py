@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.query_stats import track_queries, RepeatedQueryError, QueryStatsMiddleware, QueryStats, log_query_stats
+
+
+def _engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'q.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t VALUES (1), (2), (3)"))
+    return engine
+
+
+def test_track_queries_counts_statements(tmp_path):
+    engine = _engine(tmp_path)
+    with track_queries(repeat_threshold=2) as stats:
+        with engine.connect() as conn:
+            for i in (1, 2, 3):
+                conn.execute(text("SELECT id FROM t WHERE id = :id"), {"id": i})
+            conn.execute(text("SELECT count(*) FROM t"))
+    assert stats.count == 4
+    assert stats.duration > 0
+    # 相同的 SQL（不同參數）算同一種
+    assert stats.repeated() == {"SELECT id FROM t WHERE id = ?": 3}
+
+    # 區塊外不統計
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert stats.count == 4
+
+
+def test_strict_mode_raises_on_repeated_statements(tmp_path):
+    engine = _engine(tmp_path)
+    with pytest.raises(RepeatedQueryError):
+        with track_queries(repeat_threshold=2, strict=True):
+            with engine.connect() as conn:
+                for i in (1, 2, 3):
+                    conn.execute(text("SELECT id FROM t WHERE id = :id"), {"id": i})
+
+
+def test_async_engine_is_tracked(tmp_path):
+    _engine(tmp_path).dispose()
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'q.db'}")
+        with track_queries() as stats:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT id FROM t"))
+        await engine.dispose()
+        return stats.count
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_middleware_adds_server_timing(tmp_path):
+    engine = _engine(tmp_path)
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware, strict=True, repeat_threshold=2)
+
+    @app.get("/ids/{n}")
+    def read_ids(n: int):
+        # 同步 API 在 threadpool 中執行，仍然計入這個請求
+        with engine.connect() as conn:
+            return [conn.execute(text("SELECT id FROM t WHERE id = :id"), {"id": i}).scalar() for i in range(1, n + 1)]
+
+    client = TestClient(app)
+    response = client.get("/ids/2")
+    assert response.json() == [1, 2]
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert response.headers["server-timing"].endswith('desc="2 queries"')
+
+    # strict 模式下 N+1 會讓請求失敗
+    with pytest.raises(RepeatedQueryError):
+        client.get("/ids/3")
+
+
+def test_log_query_stats_uses_logger(caplog):
+    stats = QueryStats(repeat_threshold=2)
+    for _ in range(3):
+        stats.add_statement("SELECT * FROM user WHERE id = ?")
+    with caplog.at_level("WARNING", logger="app.core.query_stats"):
+        log_query_stats("GET", "/users/me", stats)
+    record, = caplog.records
+    assert record.name == "app.core.query_stats"
+    assert record.getMessage().splitlines()[1] == "  repeated 3x: SELECT * FROM user WHERE id = ?"
+
+    caplog.clear()
+    log_query_stats("GET", "/users/me", QueryStats())
+    assert caplog.records == []
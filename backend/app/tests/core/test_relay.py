@@ -0,0 +1,210 @@
+import asyncio
+import pytest
+from app.core.broker import InMemoryBroker, RedisBroker, create_broker
+from app.core.relay import WebSocketRelay, PeerConnection
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.gate = None  # 設為 asyncio.Event 時，送出前會等待，模擬網路很慢的連線
+
+    async def send_text(self, message):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.sent.append(message)
+
+    async def send_bytes(self, message):
+        await self.send_text(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def _wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timed out waiting for relay")
+        await asyncio.sleep(0.01)
+
+
+def test_in_memory_relay_forwards_to_peer():
+    async def scenario():
+        relay = WebSocketRelay(InMemoryBroker())
+        phone, viewer = FakeWebSocket(), FakeWebSocket()
+        await relay.attach("alice", "phone", phone, "cam")
+        await relay.attach("alice", "viewer", viewer, "desk")
+        await relay.send("alice", "phone", "offer")
+        await relay.send("alice", "viewer", b"\x01\x02")
+        await relay.send("bob", "phone", "not for alice")
+        await _wait_for(lambda: viewer.sent and phone.sent)
+        assert viewer.sent == ["offer"]
+        assert phone.sent == [b"\x01\x02"]
+
+        # 同一裝置重新連線時取代舊連線，舊連線斷線時不影響新連線
+        new_viewer = FakeWebSocket()
+        await relay.attach("alice", "viewer", new_viewer, "desk")
+        await relay.detach("alice", "viewer", viewer, "desk")
+        await relay.send("alice", "phone", "answer")
+        await _wait_for(lambda: new_viewer.sent)
+        assert new_viewer.sent == ["answer"]
+        assert viewer.sent == ["offer"]
+
+        await relay.detach("alice", "viewer", new_viewer, "desk")
+        await relay.detach("alice", "phone", phone, "cam")
+        assert relay.connections == {}
+        assert relay.broker._handlers == {}
+
+    asyncio.run(scenario())
+
+
+def test_multi_device_fan_out_and_targeting():
+    async def scenario():
+        relay = WebSocketRelay(InMemoryBroker())
+        cam1, cam2 = FakeWebSocket(), FakeWebSocket()
+        desk, tablet = FakeWebSocket(), FakeWebSocket()
+        await relay.attach("alice", "phone", cam1, "cam1")
+        await relay.attach("alice", "phone", cam2, "cam2")
+        await relay.attach("alice", "viewer", desk, "desk")
+        # 未指定裝置 id 時自動產生，不會取代其他 viewer
+        tablet_id = await relay.attach("alice", "viewer", tablet)
+        assert tablet_id not in ("desk", None)
+
+        # phone 的訊息送給所有 viewer
+        await relay.send("alice", "phone", "offer")
+        await _wait_for(lambda: desk.sent and tablet.sent)
+        assert desk.sent == tablet.sent == ["offer"]
+
+        # viewer 可以指定只送給某一台 phone
+        await relay.send("alice", "viewer", "answer", target="cam2")
+        await _wait_for(lambda: cam2.sent)
+        assert cam2.sent == ["answer"]
+        assert cam1.sent == []
+
+        assert set(relay.queue_stats()["alice"]["viewer"]) == {"desk", tablet_id}
+        await relay.detach("alice", "viewer", desk, "desk")
+        await relay.send("alice", "phone", "ice")
+        await _wait_for(lambda: len(tablet.sent) == 2)
+        assert desk.sent == ["offer"]
+
+    asyncio.run(scenario())
+
+
+def test_compact_messages_only_reach_negotiated_peers():
+    async def scenario():
+        relay = WebSocketRelay(InMemoryBroker())
+        legacy, compact = FakeWebSocket(), FakeWebSocket()
+        await relay.attach("alice", "viewer", legacy, "legacy")
+        await relay.attach("alice", "viewer", compact, "compact", compact=True)
+        await relay.send("alice", "phone", b"\x01\x00\x00", compact=True)
+        await relay.send("alice", "phone", "offer")
+        await _wait_for(lambda: legacy.sent and len(compact.sent) == 2)
+        assert legacy.sent == ["offer"]
+        assert compact.sent == [b"\x01\x00\x00", "offer"]
+
+        # 最後一條協商的連線斷線後，compact channel 也會取消訂閱
+        await relay.detach("alice", "viewer", compact, "compact")
+        assert "ws:alice:viewer:compact" not in relay.broker._handlers
+        assert "ws:alice:viewer" in relay.broker._handlers
+
+    asyncio.run(scenario())
+
+
+def test_slow_peer_does_not_block_sender():
+    async def scenario():
+        relay = WebSocketRelay(InMemoryBroker(), queue_size=2, overflow_policy="drop_oldest")
+        viewer = FakeWebSocket()
+        viewer.gate = asyncio.Event()
+        await relay.attach("alice", "viewer", viewer, "desk")
+        # viewer 卡住時，phone 端的送出不會等待
+        for i in range(5):
+            await asyncio.wait_for(relay.send("alice", "phone", f"m{i}"), timeout=0.5)
+        stats = relay.queue_stats()["alice"]["viewer"]["desk"]
+        assert stats["depth"] <= 2
+        assert stats["dropped"] >= 2
+        summary = relay.queue_summary()
+        assert summary["connections"] == {"viewer": 1}
+        assert summary["dropped"] == stats["dropped"]
+        assert "alice" not in str(summary)
+        viewer.gate.set()
+        await _wait_for(lambda: relay.queue_stats()["alice"]["viewer"]["desk"]["depth"] == 0)
+        assert viewer.sent[-2:] == ["m3", "m4"]
+        await relay.detach("alice", "viewer", viewer, "desk")
+
+    asyncio.run(scenario())
+
+
+def test_overflow_policies():
+    async def scenario():
+        # coalesce：姿勢訊息只保留最新一筆，信令訊息不合併
+        ws = FakeWebSocket()
+        ws.gate = asyncio.Event()
+        peer = PeerConnection(ws, maxsize=3, overflow_policy="coalesce")
+        for message in ("P:11111", '{"ice": 1}', "P:22222", '{"ice": 2}', "P:00000"):
+            peer.put(message)
+            await asyncio.sleep(0)
+        assert peer.coalesced >= 1
+        ws.gate.set()
+        await _wait_for(lambda: peer.depth == 0)
+        assert '{"ice": 2}' in ws.sent and "P:00000" in ws.sent
+        # 第一筆已經在送出中，之後被合併掉的是 P:22222
+        assert "P:22222" not in ws.sent
+        await peer.close()
+
+        # disconnect：佇列滿時關閉連線
+        ws = FakeWebSocket()
+        ws.gate = asyncio.Event()
+        peer = PeerConnection(ws, maxsize=1, overflow_policy="disconnect")
+        peer.put("a")
+        await asyncio.sleep(0)
+        peer.put("b")
+        peer.put("c")
+        assert peer.overflowed
+        assert not peer.put("d")
+        ws.gate.set()
+        await _wait_for(lambda: ws.closed_with is not None)
+        assert ws.closed_with == 1013
+        await peer.close()
+
+        with pytest.raises(ValueError):
+            PeerConnection(FakeWebSocket(), overflow_policy="block")
+
+    asyncio.run(scenario())
+
+
+def test_redis_relay_across_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        # 兩個 relay 模擬兩個 worker，共用同一個 Redis
+        worker_a = WebSocketRelay(RedisBroker(client=fakeredis.FakeAsyncRedis(server=server), poll_timeout=0.01))
+        worker_b = WebSocketRelay(RedisBroker(client=fakeredis.FakeAsyncRedis(server=server), poll_timeout=0.01))
+        phone, viewer = FakeWebSocket(), FakeWebSocket()
+        await worker_a.attach("alice", "phone", phone, "cam")
+        await worker_b.attach("alice", "viewer", viewer, "desk")
+
+        await worker_a.send("alice", "phone", "offer")
+        await worker_b.send("alice", "viewer", b"\x00binary", target="cam")
+        await _wait_for(lambda: viewer.sent and phone.sent)
+        assert viewer.sent == ["offer"]
+        assert phone.sent == [b"\x00binary"]
+
+        await worker_b.detach("alice", "viewer", viewer, "desk")
+        await worker_a.send("alice", "phone", "dropped")
+        await asyncio.sleep(0.05)
+        assert viewer.sent == ["offer"]
+
+        await worker_a.broker.close()
+        await worker_b.broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_create_broker():
+    assert isinstance(create_broker(""), InMemoryBroker)
+    assert isinstance(create_broker("memory://"), InMemoryBroker)
+    with pytest.raises(ValueError):
+        create_broker("kafka://localhost")
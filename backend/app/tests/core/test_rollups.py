@@ -0,0 +1,26 @@
+from datetime import datetime, date, time
+from app.models import GranularityEnum
+from app.core.rollups import bucket_start, to_local_day, add_rollup_delta
+
+
+def test_bucket_start():
+    """測試日 / 週 / 月的區間起始日"""
+    day = date(2025, 1, 1)  # 星期三
+    assert bucket_start(day, GranularityEnum.day) == date(2025, 1, 1)
+    assert bucket_start(day, GranularityEnum.week) == date(2024, 12, 30)
+    assert bucket_start(day, GranularityEnum.month) == date(2025, 1, 1)
+
+
+def test_local_day_crosses_midnight():
+    """UTC 晚上的偵測在台北時區屬於隔天"""
+    start = datetime(2024, 12, 31, 20, 0, 0)
+    assert to_local_day(start, "UTC") == date(2024, 12, 31)
+    assert to_local_day(start, "Asia/Taipei") == date(2025, 1, 1)
+
+
+def test_add_rollup_delta_merges_same_bucket():
+    deltas = {}
+    for hour in (9, 10):
+        add_rollup_delta(deltas, 1, datetime(2024, 12, 22, hour), time(0, 1, 50), 110, (80, 80, 85, 70, 95))
+    key = (1, GranularityEnum.day, date(2024, 12, 22), "UTC")
+    assert deltas[key] == [2, 220, 220, 160, 160, 170, 140, 190]
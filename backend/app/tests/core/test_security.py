@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from app.core.security import PasswordHasher, hash_rounds
+
+
+def test_hash_and_verify_in_process_pool():
+    hasher = PasswordHasher(workers=1, max_concurrency=2, queue_timeout=5, rounds=4)
+
+    async def scenario():
+        hashed = await hasher.hash("secret")
+        assert hash_rounds(hashed) == 4
+        assert await hasher.verify("secret", hashed)
+        assert not await hasher.verify("wrong", hashed)
+
+    try:
+        asyncio.run(scenario())
+        stats = hasher.stats()
+        assert stats["completed"] == 3
+        assert stats["in_flight"] == 0 and stats["rejected"] == 0
+    finally:
+        hasher.shutdown()
+
+
+def test_rehash_when_rounds_change():
+    old = PasswordHasher(workers=0, max_concurrency=1, queue_timeout=1, rounds=4)
+    new = PasswordHasher(workers=0, max_concurrency=1, queue_timeout=1, rounds=5)
+
+    async def scenario():
+        hashed = await old.hash("secret")
+        assert await old.verify_and_update("secret", hashed) == (True, None)
+
+        # 調高 work factor 後，驗證成功時一併回傳新的雜湊
+        ok, new_hash = await new.verify_and_update("secret", hashed)
+        assert ok and hash_rounds(new_hash) == 5
+        assert await new.verify("secret", new_hash)
+        assert await new.verify_and_update("wrong", hashed) == (False, None)
+        assert await new.verify_and_update("secret", new_hash) == (True, None)
+
+    asyncio.run(scenario())
+    assert new.stats()["rehashed"] == 1
+
+
+def test_rejects_when_queue_is_full():
+    hasher = PasswordHasher(workers=1, max_concurrency=1, queue_timeout=0.05, rounds=4)
+
+    async def scenario():
+        # 第一個工作佔住唯一的名額，第二個排隊逾時後回傳 503
+        slow = asyncio.ensure_future(hasher.run(time.sleep, 0.5))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as exc:
+            await hasher.verify("secret", "$2b$04$invalid")
+        assert exc.value.status_code == 503
+        assert exc.value.headers == {"Retry-After": "1"}
+        await slow
+
+    try:
+        asyncio.run(scenario())
+        stats = hasher.stats()
+        assert stats["rejected"] == 1 and stats["completed"] == 1
+        assert stats["queue_wait_max_ms"] >= 50
+    finally:
+        hasher.shutdown()
+
+
+def test_waiting_holds_no_thread():
+    """排隊與等待 pool 的結果都在 event loop 上 await，不使用任何額外的執行緒"""
+    hasher = PasswordHasher(workers=1, max_concurrency=2, queue_timeout=5, rounds=4)
+
+    async def scenario():
+        # 先啟動 pool（管理執行緒與佇列執行緒），再計算排隊中的工作是否多用了執行緒
+        await hasher.run(time.sleep, 0)
+        threads = threading.active_count()
+        pending = [asyncio.ensure_future(hasher.run(time.sleep, 0.05)) for _ in range(10)]
+        await asyncio.sleep(0.02)
+        assert threading.active_count() == threads
+        assert hasher.stats()["waiting"] == 8
+        assert await asyncio.gather(*pending) == [None] * 10
+
+    try:
+        asyncio.run(scenario())
+        assert hasher.stats()["completed"] == 11
+    finally:
+        hasher.shutdown()
+
+
+def test_hash_rounds():
+    assert hash_rounds("$2b$12$abcdefghijklmnopqrstuu") == 12
+    assert hash_rounds("not a hash") is None
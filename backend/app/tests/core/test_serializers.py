@@ -0,0 +1,79 @@
+import json
+from datetime import datetime, time
+from fastapi.encoders import jsonable_encoder
+from app.core import serializers
+from app.core.serializers import FastJSONResponse, compile_row_serializer, compile_object_serializer
+from app.models import User, Detection, Torso, Feet, Head, Shoulder, Neck, GenderEnum
+from app.schemas import DetectionResponse, ExtendedUserResponse
+
+PARTS = {"Torso": Torso, "Feet": Feet, "Head": Head, "Shoulder": Shoulder, "Neck": Neck}
+
+PART_VALUES = {
+    "Torso": {"BackwardCount": 10, "ForwardCount": 20, "NeutralCount": 70, "AmbiguousCount": 10, "PartialScore": 70.0},
+    "Feet": {"AnkleOnKneeCount": 5, "FlatCount": 95, "AmbiguousCount": 10, "PartialScore": 95.0},
+    "Head": {"BowedCount": 15, "NeutralCount": 80, "TiltBackCount": 5, "AmbiguousCount": 10, "PartialScore": 80.0},
+    "Shoulder": {"HunchedCount": 10, "NeutralCount": 85, "ShrugCount": 5, "AmbiguousCount": 10, "PartialScore": 85.0},
+    "Neck": {"ForwardCount": 20, "NeutralCount": 80, "AmbiguousCount": 10, "PartialScore": 80.0},
+}
+
+
+def _detection_row(columns):
+    values = {
+        Detection.DetectionID: 7,
+        Detection.UserID: 1,
+        Detection.StartTime: datetime(2024, 12, 22, 17, 32, 42, 123456),
+        Detection.EndTime: datetime(2024, 12, 22, 17, 34, 32),
+        Detection.TotalTime: time(0, 1, 50),
+        Detection.TotalPredictions: 110,
+        Detection.Score: 81.5,
+    }
+    for part, model in PARTS.items():
+        values[model.DetectionID] = 7
+        for name, value in PART_VALUES[part].items():
+            values[getattr(model, name)] = value
+    return tuple(values[column] for column in columns)
+
+
+def test_row_serializer_matches_response_model():
+    """編譯的 serializer 與 response_model 的輸出（欄位順序與 JSON）相同"""
+    columns, serialize = compile_row_serializer(DetectionResponse, Detection, PARTS)
+    payload = serialize(_detection_row(columns))
+    expected = jsonable_encoder(DetectionResponse(**payload))
+    assert list(payload) == list(DetectionResponse.model_fields)
+    assert json.loads(FastJSONResponse(payload).body) == expected
+    assert payload["Head"] == PART_VALUES["Head"]
+
+
+def test_row_serializer_emits_null_for_missing_part():
+    """LEFT OUTER JOIN 沒有對應的部位紀錄（主鍵為 NULL）時，該部位輸出 None，其他部位不受影響"""
+    columns, serialize = compile_row_serializer(DetectionResponse, Detection, PARTS)
+    # 主鍵欄位排在 schema 欄位之後
+    assert columns[-len(PARTS):] == [model.DetectionID for model in PARTS.values()]
+    row = list(_detection_row(columns))
+    for index, column in enumerate(columns):
+        if column.class_ is Head:
+            row[index] = None
+    payload = serialize(tuple(row))
+    assert payload["Head"] is None
+    assert payload["Neck"] == PART_VALUES["Neck"]
+    assert json.loads(FastJSONResponse(payload).body) == jsonable_encoder(DetectionResponse(**payload))
+
+
+def test_object_serializer_with_extra_fields():
+    user = User(
+        UserID=3, UserName="u3", Email="u3@example.com", Password="x", Gender=GenderEnum.Male,
+        TotalDetectionTime=time(1, 2, 3), AllTimeScore=42.0, TotalPredictionCount=9,
+    )
+    serialize = compile_object_serializer(ExtendedUserResponse, ("PR", "Level", "LevelProgress"))
+    payload = serialize(user, 50.0, 2, 0.25)
+    expected = jsonable_encoder(ExtendedUserResponse(**user.dict(), PR=50.0, Level=2, LevelProgress=0.25))
+    assert list(payload) == list(ExtendedUserResponse.model_fields)
+    assert json.loads(FastJSONResponse(payload).body) == expected
+
+
+def test_dumps_without_orjson(monkeypatch):
+    """沒有安裝 orjson 時退回標準函式庫，輸出相同"""
+    content = {"at": datetime(2024, 1, 2, 3, 4, 5), "t": time(0, 1, 50), "g": GenderEnum.Female, "name": "小明"}
+    fast = serializers.dumps(content)
+    monkeypatch.setattr(serializers, "orjson", None)
+    assert json.loads(serializers.dumps(content)) == json.loads(fast)
@@ -20,3 +20,19 @@ def get_auth_token(client: httpx.Client, username: str, password: str):
         headers={"Content-Type": "application/x-www-form-urlencoded"},
     )
     return response
+
+test_detection_data = {
+    "StartTime": "2024-12-22T17:32:42",
+    "EndTime": "2024-12-22T17:34:32",
+    "TotalTime": "00:01:50",
+    "TotalPredictions": 110,
+    "Torso": {"BackwardCount": 10, "ForwardCount": 20, "NeutralCount": 70, "AmbiguousCount": 10},
+    "Feet": {"AnkleOnKneeCount": 5, "FlatCount": 95, "AmbiguousCount": 10},
+    "Head": {"BowedCount": 15, "NeutralCount": 80, "TiltBackCount": 5, "AmbiguousCount": 10},
+    "Shoulder": {"HunchedCount": 10, "NeutralCount": 85, "ShrugCount": 5, "AmbiguousCount": 10},
+    "Neck": {"ForwardCount": 20, "NeutralCount": 80, "AmbiguousCount": 10},
+}
+
+def detection_payload(start: str, total_time: str = "00:01:50", predictions: int = 110) -> dict:
+    """偵測資料輔助函數：以 test_detection_data 為基礎，指定開始時間與長度"""
+    return {**test_detection_data, "StartTime": start, "EndTime": start, "TotalTime": total_time, "TotalPredictions": predictions}
@@ -0,0 +1,279 @@
+"""
+熱門路徑的微基準測試：在行程內直接呼叫 API 函式，資料庫為預先建立的 SQLite。
+
+    cd backend
+    python -m benchmarks.run                       # 1k，與 benchmarks/baseline.json 比較
+    python -m benchmarks.run --sizes 1k,100k,1m    # 多個資料量（第一次執行會花時間建立資料庫）
+    python -m benchmarks.run --update-baseline     # 以這次的結果更新 baseline
+
+每個資料量在獨立的子行程中執行（app 的 engine 與行程內索引在 import 時就綁定 DATABASE_URL）。
+每個案例量測 --repeats 輪，每輪取中位數，以最快的一輪（best_ms）和 baseline 比較；
+只有同時比 baseline 慢超過 --threshold（預設 BENCH_REGRESSION_THRESHOLD 或 0.25，即 25%）
+且差距超過 max(--min-delta-ms, 3 x 各輪標準差) 時才算退步，結束代碼為 1。
+
+baseline 是絕對時間，只在同一種主機上有意義：baseline.json 的 meta 記錄了產生它的主機，
+與目前主機不同時只顯示警告與比較結果，不會失敗（--force-compare 可強制比較）。
+更換 CI 主機或調整案例後，在目標主機上執行 --update-baseline 重新產生並提交 baseline.json。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_DATA_DIR = BENCH_DIR / ".data"
+
+# 差距小於這個毫秒數時不視為退步，避免次毫秒等級的函式因雜訊而失敗
+DEFAULT_MIN_DELTA_MS = 0.5
+# 差距也必須超過各輪中位數標準差的這個倍數
+NOISE_STDEV_MULTIPLIER = 3
+DEFAULT_REPEATS = 5
+
+
+def measure(fn, iterations: int, repeats: int = DEFAULT_REPEATS, warmup: int = 3, max_seconds: float = 10.0) -> dict:
+    """
+    執行 fn repeats 輪，每輪 iterations 次，回傳耗時統計（毫秒）；每輪超過 max_seconds 時提早停止。
+    best_ms 為各輪中位數的最小值，stdev_ms 為各輪中位數的標準差。
+    """
+    for _ in range(warmup):
+        fn()
+    medians = []
+    samples = []
+    for _ in range(repeats):
+        round_samples = []
+        deadline = time.perf_counter() + max_seconds
+        for _ in range(iterations):
+            started = time.perf_counter()
+            fn()
+            round_samples.append((time.perf_counter() - started) * 1000)
+            if time.perf_counter() > deadline:
+                break
+        medians.append(statistics.median(round_samples))
+        samples += round_samples
+    samples.sort()
+    return {
+        "iterations": len(samples),
+        "repeats": repeats,
+        "best_ms": round(min(medians), 4),
+        "median_ms": round(statistics.median(medians), 4),
+        "stdev_ms": round(statistics.stdev(medians), 4) if len(medians) > 1 else 0.0,
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "min_ms": round(samples[0], 4),
+    }
+
+
+def host_meta() -> dict:
+    """
+    決定 baseline 能否拿來比較的主機資訊。
+    """
+    return {
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "implementation": platform.python_implementation(),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def host_mismatch(baseline: dict) -> dict:
+    """
+    baseline 的 meta 與目前主機不同的欄位：{欄位: (baseline, 目前)}；沒有 meta 時所有欄位都算不同。
+    """
+    recorded = baseline.get("meta", {})
+    return {key: (recorded.get(key), value) for key, value in host_meta().items() if recorded.get(key) != value}
+
+
+# region: 子行程
+def run_cases(iterations: int, repeats: int) -> dict:
+    """
+    在子行程中執行所有案例，DATABASE_URL 已指向壓測資料庫。
+    """
+    from app.api.deps import SessionLocal, get_current_principal, get_current_user
+    from app.api.detections import create_detection, get_detections
+    from app.api.friends import build_friend_leaderboard
+    from app.api.users import get_userDTO, compute_user_percentile_rank, search_users, get_global_leaderboard
+    from app.core.leaderboards import friend_leaderboard_cache
+    from app.core.security import create_access_token, decode_token, principal_cache, Principal
+    from app.models import User
+    from app.schemas import DetectionCreate
+    from app.tests.utils.utils import test_detection_data
+
+    db = SessionLocal()
+    user = db.get(User, 1)
+    principal = Principal(UserID=user.UserID, UserName=user.UserName)
+    token = create_access_token(data={"sub": user.UserName})
+    detection = DetectionCreate(**test_detection_data)
+
+    def bench_create_detection():
+        # 每次都是新的 session，與一個請求的處理方式相同
+        with SessionLocal() as session:
+            create_detection(detection, session, session.get(User, principal.UserID))
+
+    def bench_get_detections():
+        get_detections(db, principal, limit=50, before=None, after=None, start_from=None, end_to=None)
+
+    def bench_get_userDTO():
+        get_userDTO(db, user)
+
+    def bench_compute_user_percentile_rank():
+        compute_user_percentile_rank(db, user)
+
+    def bench_get_leaderboard():
+        # 不使用快取，量測從資料庫載入好友排行榜
+        friend_leaderboard_cache.clear()
+        build_friend_leaderboard(db, principal.UserID, "score", 20, 0)
+
+    def bench_get_global_leaderboard():
+        get_global_leaderboard(principal, db, limit=20, offset=0)
+
+    def bench_search_users():
+        search_users("bench12", principal, db)
+
+    def bench_decode_token():
+        decode_token(token)
+
+    def bench_get_current_user():
+        # 清除 principal 快取，量測 token 驗證 + 查詢使用者
+        principal_cache.clear()
+        get_current_user(get_current_principal(token, db), db)
+
+    cases = {
+        "create_detection": bench_create_detection,
+        "get_detections": bench_get_detections,
+        "get_userDTO": bench_get_userDTO,
+        "compute_user_percentile_rank": bench_compute_user_percentile_rank,
+        "get_leaderboard": bench_get_leaderboard,
+        "get_global_leaderboard": bench_get_global_leaderboard,
+        "search_users": bench_search_users,
+        "decode_token": bench_decode_token,
+        "get_current_user": bench_get_current_user,
+    }
+    results = {}
+    for name, fn in cases.items():
+        results[name] = measure(fn, iterations, repeats)
+    db.close()
+    return results
+# endregion
+
+
+def run_size(size: str, data_dir: Path, iterations: int, repeats: int) -> dict:
+    """
+    建立（或沿用）size 的資料庫，複製一份後在子行程中量測，避免 create_detection 改動快取的資料庫。
+    """
+    from benchmarks.seed import parse_size, database_path, seed_database
+
+    detections = parse_size(size)
+    source = seed_database(database_path(data_dir, detections), detections)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / source.name
+        shutil.copyfile(source, db_path)
+        result_path = Path(tmp) / "result.json"
+        # replica 也指向壓測資料庫：開發者設定了真正的 DATABASE_REPLICA_URL 時，唯讀查詢不會讀到別的資料庫
+        database_url = f"sqlite:///{db_path}"
+        env = dict(os.environ, DATABASE_URL=database_url, DATABASE_REPLICA_URL=database_url, DB_ASYNC="false")
+        subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.run", "--worker", str(result_path),
+                "--iterations", str(iterations), "--repeats", str(repeats),
+            ],
+            cwd=BENCH_DIR.parent, env=env, check=True,
+        )
+        return json.loads(result_path.read_text())
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """
+    回傳退步的項目：最快一輪的中位數比 baseline 慢超過 threshold，
+    且差距大於 max(min_delta_ms, NOISE_STDEV_MULTIPLIER x 兩邊較大的標準差)。
+    以最快的一輪比較，表示每一輪都比 baseline 慢。
+    """
+    regressions = []
+    for size, cases in results.items():
+        for name, stats in cases.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None or "best_ms" not in base:
+                continue
+            current, previous = stats["best_ms"], base["best_ms"]
+            floor = max(min_delta_ms, NOISE_STDEV_MULTIPLIER * max(stats["stdev_ms"], base.get("stdev_ms", 0.0)))
+            if current > previous * (1 + threshold) and current - previous > floor:
+                regressions.append({
+                    "size": size,
+                    "case": name,
+                    "baseline_ms": previous,
+                    "current_ms": current,
+                    "min_delta_ms": round(floor, 4),
+                    "ratio": round(current / previous, 3) if previous else None,
+                })
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks with regression thresholds")
+    parser.add_argument("--sizes", default="1k", help="comma separated detection counts, e.g. 1k,100k,1m")
+    parser.add_argument("--iterations", type=int, default=200, help="timed iterations per case and repeat")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="rounds per case; the fastest round is compared")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="where seeded databases are kept")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_REGRESSION_THRESHOLD", 0.25)),
+                        help="allowed slowdown of the median as a fraction of the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help="smallest slowdown in ms that can count as a regression")
+    parser.add_argument("--force-compare", action="store_true",
+                        help="fail on regressions even if the baseline was recorded on a different host")
+    parser.add_argument("--update-baseline", action="store_true", help="write these results into the baseline file")
+    parser.add_argument("--output", type=Path, default=None, help="also write the results to this file")
+    parser.add_argument("--worker", type=Path, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.worker is not None:
+        args.worker.write_text(json.dumps(run_cases(args.iterations, args.repeats)))
+        return 0
+
+    results = {}
+    for size in (s.strip() for s in args.sizes.split(",") if s.strip()):
+        results[size] = run_size(size, args.data_dir, args.iterations, args.repeats)
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    mismatch = host_mismatch(baseline)
+    report = {"results": results, "threshold": args.threshold, "regressions": regressions, "host": host_meta()}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text)
+
+    if args.update_baseline:
+        baseline.setdefault("results", {}).update(results)
+        baseline["meta"] = {**host_meta(), "updated": datetime.utcnow().isoformat(timespec="seconds")}
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        return 0
+
+    if mismatch:
+        details = ", ".join(f"{key}: {recorded} != {current}" for key, (recorded, current) in mismatch.items())
+        print(f"WARNING baseline was recorded on a different host ({details}); "
+              "regenerate it on this host with --update-baseline", file=sys.stderr)
+    for item in regressions:
+        print(
+            f"REGRESSION {item['size']} {item['case']}: {item['baseline_ms']}ms -> {item['current_ms']}ms",
+            file=sys.stderr,
+        )
+    if mismatch and not args.force_compare:
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+建立壓測用的 SQLite 資料庫：使用者、好友關係、偵測紀錄與五個部位表。
+同一個大小的資料庫會保留在 data_dir 中重複使用，只有第一次執行需要寫入。
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta, time as dtime
+from pathlib import Path
+
+import bcrypt
+from sqlalchemy import create_engine, insert, event
+from sqlmodel import SQLModel
+
+from app.core.bll import calculate_detection_scores
+from app.models import User, FriendList, Detection, Head, Neck, Shoulder, Torso, Feet
+from app.schemas import DetectionCreate
+from app.tests.utils.utils import test_detection_data
+
+# 每次 executemany 寫入的筆數
+CHUNK_SIZE = 20000
+
+# 每位使用者平均的偵測筆數（決定使用者數），以及每位使用者的好友數（雙向各一筆）
+DETECTIONS_PER_USER = 100
+FRIENDS_PER_USER = 20
+
+# 所有壓測帳號共用的密碼雜湊（rounds=4，只用來滿足 NOT NULL）
+_PASSWORD_HASH = bcrypt.hashpw(b"benchmark", bcrypt.gensalt(rounds=4)).decode()
+
+# 資料格式改變時遞增，舊的資料庫檔案就不會被沿用
+SEED_VERSION = 2
+
+# 部位表的每一筆都使用測試共用的偵測資料，PartialScore 由 app 的計分函式算出（0 ~ 1）
+_PART_SCORES = calculate_detection_scores(DetectionCreate(**test_detection_data))
+PART_ROWS = {
+    model: {**test_detection_data[model.__name__], "PartialScore": _PART_SCORES[model.__name__]}
+    for model in (Head, Neck, Shoulder, Torso, Feet)
+}
+
+
+def parse_size(text: str) -> int:
+    """
+    "1k" -> 1000, "100k" -> 100000, "1m" -> 1000000
+    """
+    text = text.strip().lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def user_count(detections: int) -> int:
+    return max(100, detections // DETECTIONS_PER_USER)
+
+
+def database_path(data_dir: Path, detections: int) -> Path:
+    return Path(data_dir) / f"bench_v{SEED_VERSION}_{detections}.db"
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_database(path: Path, detections: int, seed: int = 42) -> Path:
+    """
+    建立 path 的資料庫並寫入 detections 筆偵測；已存在時直接回傳。
+    先寫到暫存檔，完成後才改名，中斷的執行不會留下不完整的資料庫。
+    """
+    path = Path(path)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    engine = create_engine(f"sqlite:///{tmp_path}")
+
+    @event.listens_for(engine, "connect")
+    def _fast_pragmas(dbapi_connection, _):
+        # 只有建立資料時使用，不影響壓測本身
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=OFF")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.close()
+
+    SQLModel.metadata.create_all(engine)
+    rng = random.Random(seed)
+    users = user_count(detections)
+    now = datetime(2025, 1, 1)
+    started = time.perf_counter()
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "UserID": user_id,
+                "UserName": f"bench{user_id}",
+                "Email": f"bench{user_id}@example.com",
+                "Password": _PASSWORD_HASH,
+                # 與 app 計算的分數相同，介於 0 ~ 1
+                "AllTimeScore": rng.uniform(0, 1),
+                "TotalPredictionCount": DETECTIONS_PER_USER * 110,
+                "TotalDetectionTime": dtime(rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59)),
+                "CreateDate": now,
+                "ModDate": now,
+            }
+            for user_id in range(1, users + 1)
+        ])
+
+        friendships = []
+        for user_id in range(1, users + 1):
+            for offset in range(1, FRIENDS_PER_USER // 2 + 1):
+                friend_id = (user_id - 1 + offset) % users + 1
+                friendships.append({"UserID1": user_id, "UserID2": friend_id, "CreateDate": now, "ModDate": now})
+                friendships.append({"UserID1": friend_id, "UserID2": user_id, "CreateDate": now, "ModDate": now})
+        for batch in _chunks(friendships):
+            conn.execute(insert(FriendList), batch)
+
+        def detection_rows():
+            for detection_id in range(1, detections + 1):
+                user_id = (detection_id - 1) % users + 1
+                start = now - timedelta(minutes=30 * ((detection_id - 1) // users) + rng.randint(0, 20))
+                yield detection_id, user_id, start
+
+        for batch in _chunks(detection_rows()):
+            conn.execute(insert(Detection), [
+                {
+                    "DetectionID": detection_id,
+                    "UserID": user_id,
+                    "StartTime": start,
+                    "EndTime": start + timedelta(seconds=110),
+                    "TotalTime": dtime(0, 1, 50),
+                    "TotalPredictions": 110,
+                    "Score": rng.uniform(0, 1),
+                    "CreateDate": now,
+                    "ModDate": now,
+                }
+                for detection_id, user_id, start in batch
+            ])
+            ids = [detection_id for detection_id, _, _ in batch]
+            for model, values in PART_ROWS.items():
+                conn.execute(insert(model), [{"DetectionID": i, **values} for i in ids])
+
+    engine.dispose()
+    tmp_path.replace(path)
+    print(f"Seeded {path} ({users} users, {detections} detections) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return path